@@ -9,10 +9,15 @@
 # V1.2 add servo/ui class,by tangliufeng
 
 
-from machine import I2C, PWM, Pin, ADC, TouchPad
+from machine import I2C, PWM, Pin, ADC, TouchPad, Timer
 from ssd1106 import SSD1106_I2C
+import framebuf
 import esp
+import sys
 import ustruct
+from ubinascii import crc32
+from ucollections import OrderedDict
+from array import array
 from neopixel import NeoPixel
 from esp import dht_readinto
 from time import sleep_ms, sleep_us
@@ -26,7 +31,14 @@ i2c = I2C(scl=Pin(22), sda=Pin(23), freq=400000)
 
 
 class Font(object):
-    def __init__(self, font_address=0x300000):
+    # When prefetching, neighbouring characters are read from flash together
+    # if they are less than index_gap code points or data_gap bytes apart,
+    # up to read_size bytes at a time.
+    index_gap = 16
+    data_gap = 32
+    read_size = 512
+
+    def __init__(self, font_address=0x300000, cache_size=64):
         self.font_address = font_address
         buffer = bytearray(18)
         esp.flash_read(self.font_address, buffer)
@@ -39,30 +51,348 @@ class Font(object):
             self.first_char,\
             self.last_char = ustruct.unpack('4sHHHHHHH', buffer)
         self.first_char_info_address = self.font_address + 18
+        # Glyphs (see GetGlyph) by code point, least recently used first.
+        self.cache_size = cache_size
+        self.glyphs = OrderedDict()
+        self.info = bytearray(6)
+
+    def remember(self, uni, data):
+        glyph = None
+        if data is not None:
+            width, bytes_per_line = ustruct.unpack_from('HH', data)
+            # The rows are stored left to right, most significant bit first.
+            fbuf = framebuf.FrameBuffer(memoryview(data)[4:], width,
+                                        self.height, framebuf.MONO_HLSB,
+                                        bytes_per_line * 8)
+            glyph = [data, width, fbuf, None]
+        if self.cache_size:
+            glyphs = self.glyphs
+            if len(glyphs) >= self.cache_size:
+                del glyphs[next(iter(glyphs))]
+            glyphs[uni] = glyph
+        return glyph
 
     def GetCharacterData(self, c):
+        glyph = self.GetGlyph(c)
+        if glyph is None:
+            return None
+        return glyph[0]
+
+    def GetGlyph(self, c):
+        """
+        Return [data, width, frame buffer, inverted frame buffer] for the
+        character c, or None if the font hasn't got it. The inverted frame
+        buffer is None until GetInverted is called.
+        """
         uni = ord(c)
-        if uni not in range(self.first_char, self.last_char):
+        glyphs = self.glyphs
+        if uni in glyphs:
+            # Move it to the most recently used end.
+            data = glyphs.pop(uni)
+            glyphs[uni] = data
+            return data
+        if uni < self.first_char or uni >= self.last_char:
             return None
         char_info_address = self.first_char_info_address + \
             (uni - self.first_char) * 6
-        buffer = bytearray(6)
-        esp.flash_read(char_info_address, buffer)
-        ptr_char_data, len = ustruct.unpack('IH', buffer)   
+        esp.flash_read(char_info_address, self.info)
+        ptr_char_data, len = ustruct.unpack('IH', self.info)
         if (ptr_char_data) == 0 or (len == 0):
-            return None
-        buffer = bytearray(len)
-        esp.flash_read(ptr_char_data + self.font_address, buffer)
-        return buffer
+            data = None
+        else:
+            data = bytearray(len)
+            esp.flash_read(ptr_char_data + self.font_address, data)
+        return self.remember(uni, data)
+
+    def GetInverted(self, glyph):
+        """
+        Return a frame buffer of the glyph with its pixels inverted.
+        """
+        if glyph[3] is None:
+            data = glyph[0]
+            rows = bytearray(data[4:])
+            for i in range(len(rows)):
+                rows[i] ^= 0xff
+            bytes_per_line = ustruct.unpack_from('HH', data)[1]
+            glyph[3] = framebuf.FrameBuffer(rows, glyph[1], self.height,
+                                            framebuf.MONO_HLSB,
+                                            bytes_per_line * 8)
+        return glyph[3]
+
+    def prefetch(self, s):
+        """
+        Read the glyphs of the characters in s that aren't cached yet,
+        reading the font's index and glyph data for neighbouring characters
+        together rather than one at a time.
+        """
+        glyphs = self.glyphs
+        for c in s:
+            if ord(c) not in glyphs:
+                break
+        else:
+            return
+        first, last = self.first_char, self.last_char
+        codes = sorted(set(ord(c) for c in s))
+        codes = [uni for uni in codes
+                 if first <= uni < last and uni not in glyphs]
+        codes = codes[:self.cache_size]
+        # Read the index entries of runs of nearby code points.
+        found = []  # (address, length, code point)
+        i = 0
+        while i < len(codes):
+            j = i
+            while j + 1 < len(codes) and \
+                    codes[j + 1] - codes[j] < self.index_gap and \
+                    (codes[j + 1] - codes[i] + 1) * 6 <= self.read_size:
+                j += 1
+            table = bytearray((codes[j] - codes[i] + 1) * 6)
+            esp.flash_read(self.first_char_info_address +
+                           (codes[i] - first) * 6, table)
+            for uni in codes[i:j + 1]:
+                ptr_char_data, length = ustruct.unpack_from(
+                    'IH', table, (uni - codes[i]) * 6)
+                if ptr_char_data == 0 or length == 0:
+                    self.remember(uni, None)
+                else:
+                    found.append((ptr_char_data + self.font_address, length,
+                                  uni))
+            i = j + 1
+        # Then the glyph data of runs of nearby glyphs.
+        found.sort()
+        i = 0
+        while i < len(found):
+            start = found[i][0]
+            end = start + found[i][1]
+            j = i
+            while j + 1 < len(found) and \
+                    found[j + 1][0] - end < self.data_gap and \
+                    found[j + 1][0] + found[j + 1][1] - start <= \
+                    self.read_size:
+                j += 1
+                end = max(end, found[j][0] + found[j][1])
+            block = bytearray(end - start)
+            esp.flash_read(start, block)
+            for address, length, uni in found[i:j + 1]:
+                self.remember(uni, block[address - start:
+                                         address - start + length])
+            i = j + 1
+
+
+class SampleRing(object):
+    """
+    A ring buffer of samples of a number of channels, filled by a timer
+    callback and emptied by the program. Only the callback moves head and
+    only the program moves tail, so neither has to stop the other.
+    """
+    def __init__(self, channels, size):
+        self.channels = channels
+        self.size = size
+        self.data = array('h', bytes(2 * channels * size))
+        self.head = 0   # samples written
+        self.tail = 0   # samples read
+        self.overruns = 0   # samples dropped because the ring was full
+
+    def available(self):
+        return self.head - self.tail
+
+    def slot(self):
+        # Where in data the callback should put the next sample, or -1 if
+        # the ring is full. The callback adds one to head once it's there.
+        if self.head - self.tail >= self.size:
+            self.overruns += 1
+            return -1
+        return (self.head % self.size) * self.channels
+
+    def readinto(self, buf):
+        """
+        Copy as many of the oldest unread samples as fit into buf (e.g. an
+        array('h')), with the channels of each sample next to each other,
+        and return how many were copied.
+        """
+        n = min(self.head - self.tail, len(buf) // self.channels)
+        data = self.data
+        end = len(data)
+        i = (self.tail % self.size) * self.channels
+        for j in range(n * self.channels):
+            buf[j] = data[i]
+            i += 1
+            if i == end:
+                i = 0
+        self.tail += n
+        return n
+
+
+# Starts each binary frame. 0xff never appears in UTF-8 text, so this never
+# turns up in what's printed to the REPL.
+FRAME_SYNC = b'\xff\x55'
+
+
+def send_frame(buf, channels, rows, kind='h'):
+    """
+    Write rows samples of channels values each from buf, an array of kind
+    'h' (int16) or 'f' (float32), to the serial port as binary frames, which
+    Mu's plotter reads much faster than printed tuples. A frame is 0xff 0x55,
+    then a byte each for kind, channels and rows (at most 255, so longer
+    blocks take several frames), the values (little endian) and the CRC-32
+    of everything from kind on (4 bytes, little endian).
+    """
+    out = getattr(sys.stdout, 'buffer', sys.stdout)
+    values = memoryview(buf)
+    start = 0
+    while start < rows:
+        count = min(rows - start, 255)
+        header = bytes((ord(kind), channels, count))
+        payload = values[start * channels:(start + count) * channels]
+        crc = crc32(payload, crc32(header)) & 0xffffffff
+        out.write(FRAME_SYNC + header)
+        out.write(payload)
+        out.write(ustruct.pack('<I', crc))
+        start += count
+
+
+def plot(*values):
+    """
+    Send one sample to Mu's plotter as a binary frame, like print(values)
+    but quicker to send and to read: as int16 if the values are all whole
+    numbers that fit, or else as float32.
+    """
+    kind = 'h'
+    for value in values:
+        if not isinstance(value, int) or not -32768 <= value <= 32767:
+            kind = 'f'
+            break
+    send_frame(array(kind, values), len(values), 1, kind)
+
+
+class ADCSampler(object):
+    """
+    Reads a set of ADC channels (e.g. (sound, light)) rate times a second,
+    at most 1000, on a hardware timer, into a ring of the last size samples.
+
+    Read blocks of samples into an array('h') with read, then work them out
+    with mean, peak and rms, which don't allocate memory as they go, or send
+    them to Mu's plotter with send. For example, for the loudness of sound:
+
+        sampler = ADCSampler((sound,))
+        block = array('h', bytes(2 * 100))
+        sampler.start()
+        n = sampler.read(block)
+        loudness = sampler.rms(block, n, centre=sampler.mean(block, n))
+    """
+    def __init__(self, adcs, rate=1000, size=256, timer=1):
+        self.adcs = tuple(adcs)
+        self.rate = rate
+        self.timer_id = timer
+        self.ring = SampleRing(len(self.adcs), size)
+        self.timer = None
+
+    def start(self):
+        self.stop()
+        self.timer = Timer(self.timer_id)
+        self.timer.init(period=max(1, 1000 // self.rate),
+                        mode=Timer.PERIODIC, callback=self.sample)
+
+    def stop(self):
+        if self.timer is not None:
+            self.timer.deinit()
+            self.timer = None
+
+    def sample(self, timer):
+        # The timer callback, which mustn't allocate memory.
+        ring = self.ring
+        i = ring.slot()
+        if i < 0:
+            return
+        data = ring.data
+        adcs = self.adcs
+        for channel in range(len(adcs)):
+            data[i + channel] = adcs[channel].read()
+        ring.head += 1
+
+    def read(self, buf):
+        """
+        Copy the oldest unread samples into buf, an array('h') of a multiple
+        of the number of channels (the readings of each sample next to each
+        other), and return how many samples were copied.
+        """
+        return self.ring.readinto(buf)
+
+    def mean(self, buf, n, channel=0):
+        """
+        The mean of the channel's readings in the first n samples of buf.
+        """
+        step = self.ring.channels
+        end = n * step
+        total = 0
+        i = channel
+        while i < end:
+            total += buf[i]
+            i += step
+        return total / n if n else 0
+
+    def peak(self, buf, n, channel=0, centre=0):
+        """
+        The furthest the channel's readings in the first n samples of buf
+        get from centre: the highest reading, or with centre the mean, the
+        amplitude of a sound.
+        """
+        centre = int(centre)
+        step = self.ring.channels
+        end = n * step
+        peak = 0
+        i = channel
+        while i < end:
+            distance = abs(buf[i] - centre)
+            if distance > peak:
+                peak = distance
+            i += step
+        return peak
+
+    def rms(self, buf, n, channel=0, centre=0):
+        """
+        The root mean square of the channel's (12 bit) readings in the first
+        n samples of buf, measured from centre (use the mean to take off the
+        microphone's bias).
+        """
+        centre = int(centre)
+        step = self.ring.channels
+        end = n * step
+        # Small ints are added up in squares until they'd stop being small
+        # (and need memory), then moved into the float total.
+        total = 0.0
+        squares = 0
+        i = channel
+        while i < end:
+            distance = buf[i] - centre
+            squares += distance * distance
+            if squares > 0x3f000000:
+                total += squares
+                squares = 0
+            i += step
+        return ((total + squares) / n) ** 0.5 if n else 0
+
+    def send(self, buf, n):
+        """
+        Send the first n samples of buf to Mu's plotter (see send_frame).
+        """
+        send_frame(buf, self.ring.channels, n)
 
 
 class Accelerometer():
     """  """
+    # Raw readings are in units of 1/16384 g.
+    scale = 1 / 4 / 4096
+
     def __init__(self):
         self.addr = 38
         self.i2c = i2c
         self.i2c.writeto(self.addr, b'\x0F\x08')    # set resolution = 10bit
         self.i2c.writeto(self.addr, b'\x11\x00')    # set power mode = normal
+        # x, y and z, two bytes each (low byte first) from register 2.
+        self.xyz = bytearray(6)
+        self.sample_xyz = bytearray(6)
+        self.samples = None
+        self.timer = None
 
     def get_x(self):
         self.i2c.writeto(self.addr, b'\x02', False)
@@ -82,6 +412,56 @@ class Accelerometer():
         z = ustruct.unpack('h', buf)[0]
         return z / 4 / 4096
 
+    def get_xyz(self):
+        # Read all three axes in one transaction, so they're from the same
+        # moment.
+        self.i2c.readfrom_mem_into(self.addr, 0x02, self.xyz)
+        x, y, z = ustruct.unpack('<hhh', self.xyz)
+        return x / 4 / 4096, y / 4 / 4096, z / 4 / 4096
+
+    def start_sampling(self, rate=100, size=128, timer=0):
+        """
+        Read the three axes rate times a second, into a ring of the last
+        size samples, using the hardware timer with the given id. Get them
+        with read_samples.
+        """
+        self.stop_sampling()
+        self.samples = SampleRing(3, size)
+        self.timer = Timer(timer)
+        self.timer.init(period=max(1, 1000 // rate), mode=Timer.PERIODIC,
+                        callback=self.sample)
+
+    def stop_sampling(self):
+        if self.timer is not None:
+            self.timer.deinit()
+            self.timer = None
+
+    def sample(self, timer):
+        # The timer callback, which mustn't allocate memory.
+        ring = self.samples
+        i = ring.slot()
+        if i < 0:
+            return
+        buf = self.sample_xyz
+        self.i2c.readfrom_mem_into(self.addr, 0x02, buf)
+        data = ring.data
+        for axis in range(3):
+            value = buf[2 * axis] | buf[2 * axis + 1] << 8
+            if value & 0x8000:
+                value -= 0x10000
+            data[i + axis] = value
+        ring.head += 1
+
+    def read_samples(self, buf):
+        """
+        Copy the oldest unread samples into buf, an array('h') of a multiple
+        of three values (x, y and z of each sample in turn, to be multiplied
+        by scale to give g), and return how many samples were copied.
+        """
+        if self.samples is None:
+            return 0
+        return self.samples.readinto(buf)
+
 
 class TextMode():
     normal = 1
@@ -92,8 +472,19 @@ class TextMode():
 
 class OLED(SSD1106_I2C):
     """ 128x64 oled display """
+    # The display's 128 columns start at column 2 of the SH1106's RAM.
+    column_offset = 2
+
     def __init__(self):
+        # The columns of each page drawn on since the last show(), from
+        # dirty_from up to (not including) dirty_to. Set up first since the
+        # driver clears and shows the display as it starts.
+        self.dirty_from = bytearray(b'\x80' * 8)
+        self.dirty_to = bytearray(8)
         super().__init__(128, 64, i2c)
+        # Used to xor glyphs onto the display a byte at a time.
+        self.scratch = None
+        self.scratch_pages = 0
         self.f = Font()
         if self.f is None:
             raise Exception('font load failed')
@@ -101,58 +492,134 @@ class OLED(SSD1106_I2C):
     def DispChar(self, s, x, y, mode=TextMode.normal):
         if self.f is None:
             return
+        if len(s) > 1:
+            self.f.prefetch(s)
         for c in s:
-            data = self.f.GetCharacterData(c)
-            if data is None:
+            glyph = self.f.GetGlyph(c)
+            if glyph is None:
                 x = x + self.width
                 continue
-            width, bytes_per_line = ustruct.unpack('HH', data[:4])
-            # print('character [%d]: width = %d, bytes_per_line = %d' % (ord(c)
-            # , width, bytes_per_line))
-            for h in range(0, self.f.height):
-                w = 0
-                i = 0
-                while w < width:
-                    mask = data[4 + h * bytes_per_line + i]
-                    if (width - w) >= 8:
-                        n = 8
-                    else:
-                        n = width - w
-                    py = y + h
-                    page = py >> 3
-                    bit = 0x80 >> (py % 8)
-                    for p in range(0, n):
-                        px = x + w + p
-                        c = 0
-                        if (mask & 0x80) != 0:
-                            if mode == TextMode.normal or \
-                               mode == TextMode.trans:
-                                c = 1
-                            if mode == TextMode.rev:
-                                c = 0
-                            if mode == TextMode.xor:                               
-                                c = self.buffer[page * 128 + px] & bit
-                                if c != 0:
-                                    c = 0
-                                else:
-                                    c = 1
-                                print("px = %d, py = %d, c = %d" % (px, py, c))
-                            super().pixel(px, py, c)
-                        else:
-                            if mode == TextMode.normal:
-                                c = 0
-                                super().pixel(px, py, c)
-                            if mode == TextMode.rev:
-                                c = 1
-                                super().pixel(px, py, c)
-                        mask = mask << 1
-                    w = w + 8
-                    i = i + 1
+            width = glyph[1]
+            self.mark(x, y, width, self.f.height)
+            if mode == TextMode.normal:
+                super().blit(glyph[2], x, y)
+            elif mode == TextMode.trans:
+                # Only draw the set pixels.
+                super().blit(glyph[2], x, y, 0)
+            elif mode == TextMode.rev:
+                super().blit(self.f.GetInverted(glyph), x, y)
+            elif mode == TextMode.xor:
+                self.xor_glyph(glyph[2], x, y, width)
             x = x + width + 1
 
+    def xor_glyph(self, fbuf, x, y, width):
+        # Draw the glyph into a scratch buffer laid out like the display's,
+        # in pages of eight rows, then xor whole bytes onto the display.
+        shift = y & 7
+        pages = (shift + self.f.height + 7) >> 3
+        if self.scratch is None or self.scratch_pages < pages:
+            self.scratch_pages = pages
+            self.scratch = bytearray(self.width * pages)
+            self.scratch_buf = framebuf.FrameBuffer(
+                self.scratch, self.width, pages * 8, framebuf.MONO_VLSB)
+        self.scratch_buf.fill_rect(0, 0, width, pages * 8, 0)
+        self.scratch_buf.blit(fbuf, 0, shift)
+        buffer = self.buffer
+        scratch = self.scratch
+        first = max(x, 0)
+        last = min(x + width, self.width)
+        for p in range(pages):
+            page = (y >> 3) + p
+            if page < 0 or page * 8 >= self.height:
+                continue
+            offset = page * self.width
+            source = p * self.width - x
+            for column in range(first, last):
+                buffer[offset + column] ^= scratch[source + column]
+
+    def mark(self, x, y, w, h):
+        # Remember that the w by h pixels at x, y need sending to the
+        # display.
+        x0 = max(x, 0)
+        x1 = min(x + w, self.width)
+        y1 = min(y + h, self.height) - 1
+        if x0 >= x1 or y1 < max(y, 0):
+            return
+        dirty_from = self.dirty_from
+        dirty_to = self.dirty_to
+        for page in range(max(y, 0) >> 3, (y1 >> 3) + 1):
+            if x0 < dirty_from[page]:
+                dirty_from[page] = x0
+            if x1 > dirty_to[page]:
+                dirty_to[page] = x1
+
+    def show(self):
+        # Only send the columns of each page that have been drawn on.
+        dirty_from = self.dirty_from
+        dirty_to = self.dirty_to
+        buffer = memoryview(self.buffer)
+        for page in range(self.height >> 3):
+            start = dirty_from[page]
+            end = dirty_to[page]
+            if start >= end:
+                continue
+            column = start + self.column_offset
+            self.write_cmd(0xb0 | page)
+            self.write_cmd(column & 0x0f)
+            self.write_cmd(0x10 | (column >> 4))
+            offset = page * self.width
+            self.write_data(buffer[offset + start:offset + end])
+            dirty_from[page] = self.width
+            dirty_to[page] = 0
+
+    def fill(self, c):
+        self.mark(0, 0, self.width, self.height)
+        super().fill(c)
+
+    def pixel(self, x, y, c=None):
+        if c is None:
+            return super().pixel(x, y)
+        self.mark(x, y, 1, 1)
+        super().pixel(x, y, c)
+
+    def hline(self, x, y, w, c):
+        self.mark(x, y, w, 1)
+        super().hline(x, y, w, c)
+
+    def vline(self, x, y, h, c):
+        self.mark(x, y, 1, h)
+        super().vline(x, y, h, c)
+
+    def line(self, x1, y1, x2, y2, c):
+        self.mark(min(x1, x2), min(y1, y2), abs(x2 - x1) + 1,
+                  abs(y2 - y1) + 1)
+        super().line(x1, y1, x2, y2, c)
+
+    def rect(self, x, y, w, h, c):
+        self.mark(x, y, w, h)
+        super().rect(x, y, w, h, c)
+
+    def fill_rect(self, x, y, w, h, c):
+        self.mark(x, y, w, h)
+        super().fill_rect(x, y, w, h, c)
+
+    def text(self, s, x, y, c=1):
+        self.mark(x, y, len(s) * 8, 8)
+        super().text(s, x, y, c)
+
+    def blit(self, fbuf, x, y, key=-1):
+        # A FrameBuffer doesn't say how big it is.
+        self.mark(0, 0, self.width, self.height)
+        super().blit(fbuf, x, y, key)
+
+    def scroll(self, xstep, ystep):
+        self.mark(0, 0, self.width, self.height)
+        super().scroll(xstep, ystep)
+
     def circle(self, x0, y0, radius , c):
             # Circle drawing function.  Will draw a single pixel wide circle with
             # center at x0, y0 and the specified radius.
+            self.mark(x0 - radius, y0 - radius, 2*radius + 1, 2*radius + 1)
             f = 1 - radius
             ddF_x = 1
             ddF_y = -2 * radius
@@ -183,6 +650,7 @@ class OLED(SSD1106_I2C):
     def fill_circle(self, x0, y0, radius, c):
         # Filled circle drawing function.  Will draw a filled circule with
         # center at x0, y0 and the specified radius.
+        self.mark(x0 - radius, y0 - radius, 2*radius + 1, 2*radius + 1)
         super().vline(x0, y0 - radius, 2*radius + 1, c)
         f = 1 - radius
         ddF_x = 1
@@ -206,14 +674,22 @@ class OLED(SSD1106_I2C):
     def triangle(self, x0, y0, x1, y1, x2, y2, c):
             # Triangle drawing function.  Will draw a single pixel wide triangle
             # around the points (x0, y0), (x1, y1), and (x2, y2).
+            self.mark_triangle(x0, y0, x1, y1, x2, y2)
             super().line(x0, y0, x1, y1, c)
             super().line(x1, y1, x2, y2, c)
             super().line(x2, y2, x0, y0, c)
 
 
+    def mark_triangle(self, x0, y0, x1, y1, x2, y2):
+        left = min(x0, x1, x2)
+        top = min(y0, y1, y2)
+        self.mark(left, top, max(x0, x1, x2) - left + 1,
+                  max(y0, y1, y2) - top + 1)
+
     def fill_triangle(self, x0, y0, x1, y1, x2, y2, c):
         # Filled triangle drawing function.  Will draw a filled triangle around
         # the points (x0, y0), (x1, y1), and (x2, y2).
+        self.mark_triangle(x0, y0, x1, y1, x2, y2)
         if y0 > y1:
             y0, y1 = y1, y0
             x0, x1 = x1, x0
@@ -280,6 +756,7 @@ class OLED(SSD1106_I2C):
             
 
     def Bitmap(self, x, y, bitmap, w, h,c):
+        self.mark(x, y, w, h)
         byteWidth = int((w + 7) / 8)
         for j in range(h):
             for i in range(w):
@@ -288,6 +765,7 @@ class OLED(SSD1106_I2C):
 
 
     def drawCircleHelper(self, x0, y0, r, cornername, c):
+            self.mark(x0 - r, y0 - r, 2 * r + 1, 2 * r + 1)
             f = 1 - r
             ddF_x = 1
             ddF_y = -2 * r 
@@ -1,3 +1,5 @@
+# Imported first so the start up tracer (if switched on) sees everything else.
+from mu.trace import tracer
 import gettext
 import locale
 import os
@@ -18,3 +20,4 @@ gettext.translation('mu', localedir=localedir,
                     languages=[language_code], fallback=True).install()
 
 __version__ = '0.2.5'
+__all__ = ['__version__', 'language_code', 'tracer']
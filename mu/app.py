@@ -23,57 +23,244 @@ import logging
 from logging.handlers import TimedRotatingFileHandler
 import os
 import platform
-import pkgutil
+import importlib.util
 import sys
+import urllib.error
 import urllib.request
 import json
 import hashlib
-import time
 
 from PyQt5.QtCore import QTimer, Qt, QThread, pyqtSignal
 from PyQt5.QtWidgets import QApplication, QSplashScreen
 
-from mu import __version__, language_code
+from mu import __version__, language_code, tracer
 from mu.logic import Editor, LOG_FILE, LOG_DIR, DEBUGGER_PORT, ENCODING
 from mu.interface import Window
 from mu.resources import load_pixmap, load_icon
-from mu.modes import (PythonMode, AdafruitMode, MicrobitMode, EspMode, DebugMode,
-                      PyGameZeroMode)
+from mu.modes import ModeDescriptor
+from mu.modes.base import get_default_workspace
 from mu.debugger.runner import run as run_debugger
 from mu.interface.themes import NIGHT_STYLE, DAY_STYLE, CONTRAST_STYLE
 
 
+#: Size of the blocks downloads are streamed and files are hashed in.
+CHUNK_SIZE = 64 * 1024
+
+
+def file_md5(path, chunk_size=CHUNK_SIZE):
+    """
+    Return the hex MD5 digest of the referenced file, read a chunk at a time,
+    or an empty string if there is no such file.
+    """
+    if not os.path.isfile(path):
+        return ""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def download_file(url, path, md5=None, chunk_size=CHUNK_SIZE, timeout=30):
+    """
+    Stream the content at url into the file at path.
+
+    The content is written a chunk at a time to path + '.part' and hashed as
+    it arrives. If a partial download is left over from a previous attempt
+    the rest of it is requested with an HTTP Range header (if the server
+    ignores the range the download starts again). Once complete, the MD5
+    digest is checked against md5 (if given) and the file is atomically
+    renamed into place, so path never holds half a download.
+
+    Raises ValueError if the digest doesn't match (the partial file is
+    removed so the next attempt starts afresh) and URLError / OSError if the
+    download fails (the partial file is kept so it can be resumed).
+    """
+    part_path = path + '.part'
+    digest = hashlib.md5()
+    offset = 0
+    headers = {}
+    if os.path.isfile(part_path):
+        with open(part_path, 'rb') as part:
+            for chunk in iter(lambda: part.read(chunk_size), b''):
+                digest.update(chunk)
+                offset += len(chunk)
+        if offset:
+            headers['Range'] = 'bytes={}-'.format(offset)
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as ex:
+        if ex.code != 416:  # 416 is Range Not Satisfiable.
+            raise
+        # The partial file is bigger than the content, so start again.
+        os.remove(part_path)
+        return download_file(url, path, md5, chunk_size, timeout)
+    with response:
+        if offset and response.status != 206:
+            # The server sent all of it, not just the missing part.
+            digest = hashlib.md5()
+            offset = 0
+        mode = 'ab' if offset else 'wb'
+        with open(part_path, mode) as part:
+            for chunk in iter(lambda: response.read(chunk_size), b''):
+                part.write(chunk)
+                digest.update(chunk)
+    if md5 and digest.hexdigest() != md5:
+        os.remove(part_path)
+        raise ValueError('Download from {} failed its MD5 check.'.format(url))
+    os.replace(part_path, path)
+    return path
+
+
+class UpdateCache:
+    """
+    What the updater learned last time, kept in update_cache.json in the
+    config directory: the manifest with its ETag / Last-Modified headers
+    (so it is only downloaded again if it has changed) and the MD5 digests of
+    the local files keyed by their size and modification time (so they are
+    only hashed again if they have changed).
+    """
+
+    def __init__(self, config_dir):
+        self.path = os.path.join(config_dir, 'update_cache.json')
+        self.manifest = {}
+        self.hashes = {}
+        try:
+            with open(self.path, encoding=ENCODING) as f:
+                cache = json.load(f)
+            self.manifest = cache.get('manifest', {})
+            self.hashes = cache.get('hashes', {})
+        except (OSError, ValueError):
+            pass  # No cache (yet) or a broken one, so start afresh.
+
+    def save(self):
+        """
+        Write the cache to disk.
+        """
+        cache = {'manifest': self.manifest, 'hashes': self.hashes}
+        try:
+            with open(self.path, 'w', encoding=ENCODING) as f:
+                json.dump(cache, f)
+        except OSError as ex:
+            logging.error('Could not save update cache: {}'.format(ex))
+
+    def request_headers(self):
+        """
+        Return the headers to make the manifest request conditional on it
+        having changed since it was cached.
+        """
+        headers = {}
+        if self.manifest.get('etag'):
+            headers['If-None-Match'] = self.manifest['etag']
+        if self.manifest.get('last_modified'):
+            headers['If-Modified-Since'] = self.manifest['last_modified']
+        return headers
+
+    def set_manifest(self, body, headers):
+        """
+        Remember the manifest body and the validators from the response
+        headers it came with.
+        """
+        self.manifest = {
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'body': body.decode(ENCODING),
+        }
+
+    def _key(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def md5(self, path):
+        """
+        Return the MD5 digest of the file at path, only hashing it if it has
+        changed size or modification time since it was last hashed. Returns
+        an empty string if there is no such file.
+        """
+        key = self._key(path)
+        if key is None:
+            self.hashes.pop(path, None)
+            return ""
+        cached = self.hashes.get(path)
+        if cached and cached['key'] == key:
+            return cached['md5']
+        md5 = file_md5(path)
+        self.hashes[path] = {'key': key, 'md5': md5}
+        return md5
+
+    def set_md5(self, path, md5):
+        """
+        Record the (already known) MD5 digest of the file at path.
+        """
+        key = self._key(path)
+        if key is not None:
+            self.hashes[path] = {'key': key, 'md5': md5}
+
+
 class Updater(QThread):
 
     download_url = pyqtSignal(str, str)
-    update_pylib = pyqtSignal(bytes, str)
+    update_pylib = pyqtSignal(str)
     set_update_bin_status = pyqtSignal(bool)
-    update_bin = pyqtSignal(str, bytes, str)
+    update_bin = pyqtSignal(str, str)
     check_firmware = pyqtSignal()
-        
+
     def __init__(self, _key, _url, _config_dir):
         QThread.__init__(self)
         self.key = _key
         self.url = _url
         self.config_dir = _config_dir
+        self.cache = None
 
     def download(self, user_agent='wswp', num_retries=2):
-        #print('Downloading:', self.url)
-        headers = {'User-agent':user_agent}
+        """
+        Return the manifest, which is only downloaded if it has changed
+        since it was cached (otherwise the cached copy is returned).
+        Returns None if it can't be had.
+        """
+        headers = {'User-agent': user_agent}
+        headers.update(self.cache.request_headers())
         request = urllib.request.Request(self.url, headers=headers)
-
         try:
-            html = urllib.request.urlopen(self.url).read()
-        except urllib.request.URLError as e:
-            #print('Downloading error:',e.reason)
+            with urllib.request.urlopen(request, timeout=30) as response:
+                html = response.read()
+                self.cache.set_manifest(html, response.headers)
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and 'body' in self.cache.manifest:
+                logging.info('Update manifest not modified.')
+                return self.cache.manifest['body'].encode(ENCODING)
+            html = None
+            if num_retries > 0 and 500 <= e.code < 600:
+                # recursively retry 5xx HTTP errors
+                return self.download(user_agent, num_retries - 1)
+        except (OSError, ValueError) as e:
+            # URLError is a subclass of OSError.
+            logging.error('Could not check for updates: {}'.format(e))
             html = None
-            if num_retries > 0:
-                if hasattr(e,'code') and 500<=e.code<600:
-                    #recursively retry 5xx HTTP errors
-                    return self.download('wswp', num_retries-1)
         return html
 
+    def fetch(self, url, name, md5):
+        """
+        Download url into the file called name in the config directory,
+        checking it against the md5 digest. Returns the path to the file or
+        None if the download failed.
+        """
+        path = os.path.join(self.config_dir, name)
+        try:
+            download_file(url, path, md5)
+        except (OSError, ValueError) as ex:
+            # URLError is a subclass of OSError.
+            logging.error('Could not update {}: {}'.format(name, ex))
+            return None
+        self.cache.set_md5(path, md5)
+        return path
+
     def run(self):
+        self.cache = UpdateCache(self.config_dir)
         html = self.download()
         if html is not None:
             try:
@@ -85,47 +272,27 @@ class Updater(QThread):
             if __version__ < ideList[0]['version']:
                 self.download_url.emit(ideList[0]['version'], ideList[0][self.key]['url'])
             else:
-                time.sleep(5)
                 mp_info = hjson['mpython.py']
                 mp_update_md5 = mp_info['MD5']
-                # print(mp_update_md5)
                 mp_path = os.path.join(self.config_dir, 'mpython.py')
-                if os.path.isfile(mp_path):
-                    mp_file = open(mp_path, 'rb')
-                    mp_local_md5 = hashlib.md5(mp_file.read()).hexdigest()
-                else:
-                    mp_local_md5 = ""
-                # print(mp_local_md5)
-                if mp_local_md5 != mp_update_md5:
-                    mp_update_url = mp_info['url']
-                    try:
-                        mp_update_bytes = urllib.request.urlopen(mp_update_url).read()
-                        self.update_pylib.emit(mp_update_bytes, self.config_dir)
-                    except urllib.request.URLError as e:
-                        print(e)
-                    time.sleep(5)
-                    
+                if self.cache.md5(mp_path) != mp_update_md5:
+                    path = self.fetch(mp_info['url'], 'mpython.py',
+                                      mp_update_md5)
+                    if path:
+                        self.update_pylib.emit(path)
+
                 hw_info = hjson['firmware']
                 hw_update_md5 = hw_info['MD5']
-                # print(hw_update_md5)
                 hw_path = os.path.join(self.config_dir, 'target.bin')
-                if os.path.isfile(hw_path):
-                    hw_file = open(hw_path, 'rb')
-                    hw_local_md5 = hashlib.md5(hw_file.read()).hexdigest()
-                else:
-                    hw_local_md5 = ""
-                # print(hw_local_md5)
-                if hw_local_md5 == hw_update_md5:
+                if self.cache.md5(hw_path) == hw_update_md5:
                     self.set_update_bin_status.emit(True)
                 else:
                     self.set_update_bin_status.emit(False)
-                    hw_update_url = hw_info['url']
-                    hw_update_version = hw_info['version']
-                    try:
-                        hw_update_bytes = urllib.request.urlopen(hw_update_url).read()
-                        self.update_bin.emit(hw_update_version, hw_update_bytes, self.config_dir)
-                    except urllib.request.URLError as e:
-                        print(e)
+                    path = self.fetch(hw_info['url'], 'target.bin',
+                                      hw_update_md5)
+                    if path:
+                        self.update_bin.emit(hw_info['version'], path)
+        self.cache.save()
         self.check_firmware.emit()
 
 
@@ -158,22 +325,40 @@ def setup_logging():
 
 def setup_modes(editor, view):
     """
-    Create a simple dictionary to hold instances of the available modes.
+    Create a simple dictionary to hold descriptors of the available modes.
+    Each mode is only imported when it's first used.
 
     *PREMATURE OPTIMIZATION ALERT* This may become more complex in future so
     splitting things out here to contain the mess. ;-)
-    """    
+    """
     modes = {
-        'python': PythonMode(editor, view),
-        'adafruit': AdafruitMode(editor, view),
-        'microbit': MicrobitMode(editor, view),
-        'mPython': EspMode(editor, view),
-        'debugger': DebugMode(editor, view),
+        'python': ModeDescriptor(
+            editor, view, 'mu.modes.python3.PythonMode', _('Python 3'),
+            _('Create code using standard Python 3.'), 'python'),
+        'adafruit': ModeDescriptor(
+            editor, view, 'mu.modes.adafruit.AdafruitMode',
+            _('Adafruit CircuitPython'),
+            _("Use CircuitPython on Adafruit's line of boards."), 'adafruit',
+            finds_devices=True),
+        'microbit': ModeDescriptor(
+            editor, view, 'mu.modes.microbit.MicrobitMode', _('BBC micro:bit'),
+            _("Write MicroPython for the BBC micro:bit."), 'microbit',
+            finds_devices=True),
+        'mPython': ModeDescriptor(
+            editor, view, 'mu.modes.esp.EspMode', _('mPython'),
+            _("Write MicroPython for the mPython board."), 'mPython',
+            finds_devices=True),
+        'debugger': ModeDescriptor(
+            editor, view, 'mu.modes.debugger.DebugMode',
+            _('Graphical Debugger'), _('Debug your Python 3 code.'), 'python',
+            is_debugger=True),
     }
-    
+
     # Check if pgzero is available (without importing it)
-    if any([m for m in pkgutil.iter_modules() if 'pgzero' in m]):
-        modes['pygamezero'] = PyGameZeroMode(editor, view)
+    if importlib.util.find_spec('pgzero') is not None:
+        modes['pygamezero'] = ModeDescriptor(
+            editor, view, 'mu.modes.pygamezero.PyGameZeroMode',
+            _('Pygame Zero'), _('Make games with Pygame Zero.'), 'pygamezero')
 
     # return available modes
     return modes
@@ -212,14 +397,20 @@ def run():
     - display a splash screen while starting
     - close the splash screen after startup timer ends
     """
-    setup_logging()
+    # Mu's imports are done by now.
+    tracer.end()
+    tracer.begin('run')
+    with tracer.phase('setup_logging'):
+        setup_logging()
     logging.info('\n\n-----------------\n\nStarting mPython2_{} ( base on Mu )'.format(__version__))
     logging.info(platform.uname())
     logging.info('Python path: {}'.format(sys.path))
     logging.info('Language code: {}'.format(language_code))
 
     # The app object is the application running on your computer.
-    app = QApplication(sys.argv)
+    with tracer.phase('QApplication'):
+        app = QApplication(sys.argv)
+    tracer.finish_on_first_paint(app, LOG_DIR)
     # By default PyQt uses the script name (run.py)
     app.setApplicationName('mu')
     # Set hint as to the .desktop files name
@@ -231,31 +422,40 @@ def run():
     app.setAttribute(Qt.AA_UseHighDpiPixmaps)
 
     # Create the "window" we'll be looking at.
-    editor_window = Window()
+    with tracer.phase('Window'):
+        editor_window = Window()
 
     @editor_window.load_theme.connect
     def load_theme(theme):
-        if theme == 'contrast':
-            app.setStyleSheet(CONTRAST_STYLE)
-        elif theme == 'night':
-            app.setStyleSheet(NIGHT_STYLE)
-        else:
-            app.setStyleSheet(DAY_STYLE)
+        with tracer.phase('load_theme'):
+            if theme == 'contrast':
+                app.setStyleSheet(CONTRAST_STYLE)
+            elif theme == 'night':
+                app.setStyleSheet(NIGHT_STYLE)
+            else:
+                app.setStyleSheet(DAY_STYLE)
 
     # Make sure all windows have the Mu icon as a fallback
     app.setWindowIcon(load_icon(editor_window.icon))
     # Create the "editor" that'll control the "window".
-    editor = Editor(view=editor_window)
-    editor.setup(setup_modes(editor, editor_window))
+    with tracer.phase('Editor'):
+        editor = Editor(view=editor_window)
+    with tracer.phase('setup_modes'):
+        modes = setup_modes(editor, editor_window)
+    with tracer.phase('Editor.setup'):
+        editor.setup(modes)
     # Setup the window.
     editor_window.closeEvent = editor.quit
-    editor_window.setup(editor.debug_toggle_breakpoint, editor.theme)
+    with tracer.phase('Window.setup'):
+        editor_window.setup(editor.debug_toggle_breakpoint, editor.theme)
     # Restore the previous session along with files passed by the os
-    editor.restore_session(sys.argv[1:])
+    with tracer.phase('restore_session'):
+        editor.restore_session(sys.argv[1:])
     # Connect the various UI elements in the window to the editor.
     editor_window.connect_tab_rename(editor.rename_tab, 'Ctrl+Shift+S')
     editor_window.connect_find_replace(editor.find_replace, 'Ctrl+F')
     editor_window.connect_toggle_comments(editor.toggle_comments, 'Ctrl+K')
+    editor_window.connect_unlock_tab(editor.unlock_tab, 'Ctrl+Shift+E')
     status_bar = editor_window.status_bar
     status_bar.connect_logs(editor.show_admin, 'Ctrl+Shift+D')
 
@@ -272,7 +472,7 @@ def run():
     # Check software update.
     key = get_platform()
     url = "http://static.steamaker.cn/files/mPython2.json"
-    config_dir = os.path.join(editor.modes['mPython'].workspace_dir(), '__config__')
+    config_dir = os.path.join(get_default_workspace(), '__config__')
     if not os.path.exists(config_dir):
         os.makedirs(config_dir)
     updater = Updater(key, url, config_dir)
@@ -280,8 +480,15 @@ def run():
     updater.update_pylib.connect(editor_window.update_pylib)
     updater.update_bin.connect(editor_window.update_bin)
     updater.set_update_bin_status.connect(editor_window.set_update_bin_status)
-    updater.check_firmware.connect(editor.modes['mPython'].check_firmware)
+
+    @updater.check_firmware.connect
+    def check_firmware():
+        # Only mPython mode checks, so don't load it just to ask.
+        if editor.mode == 'mPython':
+            editor.modes['mPython'].check_firmware()
+
     updater.start()
+    tracer.end()
             
     # Stop the program after the application finishes executing.
     sys.exit(app.exec_())
@@ -13,9 +13,11 @@ You may:
 from __future__ import print_function
 import ast
 import argparse
+import base64
 import sys
 import os
 import time
+import struct
 import os.path
 import logging
 import json
@@ -45,6 +47,11 @@ For example, 'ufs ls' will list the files on a connected BBC micro:bit.
 
 COMMAND_LINE_FLAG = False  # Indicates running from the command line.
 
+#: The prompt shown by the raw REPL.
+RAW_REPL_PROMPT = b'raw REPL; CTRL-B to exit\r\n>'
+#: Bytes sent at a time to a raw REPL that doesn't support raw-paste mode.
+RAW_CHUNK_SIZE = 256
+
 
 def find_device():
     """
@@ -347,114 +354,141 @@ def stop_py(serial=None):
     time.sleep(0.1)
 
 
-def run_py(parent, filename, serial=None):
-    #print("espfs:run_py")
+def enter_raw_repl(serial):
+    """
+    Interrupt any running program and put the device into the raw REPL.
+    Raises an IOError if the raw REPL's prompt doesn't appear.
+    """
+    # CTRL-B to leave the raw REPL if need be, CTRL-C to break out of loops.
+    serial.write(b'\x02\r\x03\x03')
+    time.sleep(0.01)
+    # Flush input (without relying on serial.flushInput())
+    n = serial.inWaiting()
+    while n > 0:
+        serial.read(n)
+        n = serial.inWaiting()
+    # Go into raw mode with CTRL-A.
+    serial.write(b'\r\x01')
+    data = serial.read_until(RAW_REPL_PROMPT)
+    if not data.endswith(RAW_REPL_PROMPT):
+        raise IOError('Could not enter raw REPL.')
+
+
+def raw_paste_write(serial, command_bytes):
+    """
+    Send the command to a device in raw-paste mode. The device starts by
+    saying how big its window is and, from then on, sends CTRL-A each time
+    there's room for another window's worth of data, so it is never sent more
+    than it can take and nothing is echoed back.
+    """
+    window_size = struct.unpack('<H', serial.read(2))[0]
+    window_remain = window_size
+    i = 0
+    while i < len(command_bytes):
+        while window_remain == 0 or serial.inWaiting():
+            data = serial.read(1)
+            if data == b'\x01':
+                window_remain += window_size
+            elif data == b'\x04':
+                # The device stopped the paste early (e.g. a syntax error).
+                serial.write(b'\x04')
+                return
+            else:
+                raise IOError('Unexpected data during raw paste: '
+                              '{}'.format(data))
+        chunk = command_bytes[i:i + window_remain]
+        serial.write(chunk)
+        window_remain -= len(chunk)
+        i += len(chunk)
+    # CTRL-D to end the paste, acknowledged by the device with CTRL-D.
+    serial.write(b'\x04')
+    data = serial.read_until(b'\x04')
+    if not data.endswith(b'\x04'):
+        raise IOError('Could not complete raw paste: {}'.format(data))
+
+
+def exec_raw(serial, command_bytes):
+    """
+    Have a device in the raw REPL execute the command. Raw-paste mode
+    (CTRL-E, A, CTRL-A) is used if the firmware supports it, otherwise the
+    command is written in chunks as plain raw REPL input. Returns once the
+    device has accepted the command, after which its output follows (stdout,
+    CTRL-D, stderr, CTRL-D, ">").
+    """
+    serial.write(b'\x05A\x01')
+    data = serial.read(2)
+    if data == b'R\x01':
+        raw_paste_write(serial, command_bytes)
+        return
+    if data != b'R\x00':
+        # Firmware older than raw-paste mode takes the CTRL-A as a request to
+        # enter the raw REPL again (and has already sent the first two bytes
+        # of the prompt).
+        data = serial.read_until(RAW_REPL_PROMPT[2:])
+        if not data.endswith(RAW_REPL_PROMPT[2:]):
+            raise IOError('Could not enter raw REPL.')
+    for i in range(0, len(command_bytes), RAW_CHUNK_SIZE):
+        serial.write(command_bytes[i:i + RAW_CHUNK_SIZE])
+        time.sleep(0.01)
+    serial.write(b'\x04')
+    data = serial.read(2)
+    if data != b'OK':
+        raise IOError('Could not execute command: {}'.format(data))
+
+
+def file_command(filename):
+    """
+    Return the command to run the referenced file on the device.
+    """
     filename = json.dumps(filename)
     if filename.startswith('"') and filename.endswith('"'):
         filename = filename[1:-1]
-    command = "exec(open('./{}').read(),globals())\r\n".format(filename)
-    if serial is None:
-        serial = get_serial()
-        time.sleep(0.1)
-    serial.setDTR(True)
-    time.sleep(0.1)
-    # Send a Control-B / exit raw mode.
-    serial.write(b'\x02')
-    for i in range(3):
-        serial.write(b'\r\x03')
-        time.sleep(0.01)
-    time.sleep(0.5)
-    command_bytes = command.encode('utf-8')
-    for i in range(0, len(command_bytes), 64):
-        serial.write(command_bytes[i:min(i + 64, len(command_bytes))])
-        time.sleep(0.01)
-    time.sleep(0.1)
-    serial.setDTR(False)
-    response = serial.read_until(b'\x04>')       # Read until prompt.
-    #print(response)
-    if response.find(b'MemoryError:') > 0:
-        try:
-            out, err = response.split(b'MemoryError:', 1)  # Split stdout, stderr
-            if err:
-                err = err.replace(b'\r\n', b'')
-                err = err.replace(b'>', b'')
-                err = b'MemoryError:' + err
-                return 2, err
-        except:
-            return 2, b'MemoryError:'
-    if response.find(b'Traceback ') > 0:
-        try:
-            out, err = response.split(b'Traceback ', 1)  # Split stdout, stderr
-            if err:
-                err = b'Traceback ' + err
-                return 1, err
-        except:
-            return 1, response
-    #print("thread running")
-    while True:
-        if parent.running:
-            time.sleep(0.1)
-        else:
-            break;
-    #print("thread end")
-    serial.write(b'\x02\x03')
-    time.sleep(0.1)
-    return 0, None
+    return "exec(open('./{}').read(),globals())".format(filename)
 
 
-def run_content(parent, content, serial=None):
-    #print("espfs:run_content")
-    content = content.replace("\r\n", "\n")
-    content = json.dumps(content)
-    command = "exec({},globals())\r\n".format(content)
-    if serial is None:
-        serial = get_serial()
-        time.sleep(0.1)
+def start_command(command, serial):
+    """
+    Start the command running on the device via the raw REPL. Its output
+    follows and can be picked apart, as it arrives, with a RawReplReader.
+    """
     serial.setDTR(True)
-    time.sleep(0.1)
-    # Send a Control-B / exit raw mode.
-    serial.write(b'\x02')
-    for i in range(3):
-        serial.write(b'\r\x03')
-        time.sleep(0.01)
-    time.sleep(0.5)
-    command_bytes = command.encode('utf-8')
-    #print(command_bytes)
-    for i in range(0, len(command_bytes), 64):
-        serial.write(command_bytes[i:min(i + 64, len(command_bytes))])
-        time.sleep(0.01)
-    time.sleep(0.1)
+    enter_raw_repl(serial)
+    exec_raw(serial, command.replace('\r\n', '\n').encode('utf-8'))
     serial.setDTR(False)
-    response = serial.read_until(b'\x04>')       # Read until prompt.
-    #print(response)
-    if response.find(b'MemoryError:') > 0:
-        try:
-            out, err = response.split(b'MemoryError:', 1)  # Split stdout, stderr
-            if err:
-                err = err.replace(b'\r\n', b'')
-                err = err.replace(b'>', b'')
-                err = b'MemoryError:' + err
-                return 2, err
-        except:
-            return 2, b'MemoryError:'
-    if response.find(b'Traceback ') > 0:
-        try:
-            out, err = response.split(b'Traceback ', 1)  # Split stdout, stderr
-            if err:
-                err = b'Traceback ' + err
-                return 1, err
-        except:
-            return 1, response
-    #print("thread running")
-    while True:
-        if parent.running:
-            time.sleep(0.1)
-        else:
-            break;
-    #print("thread end")
-    serial.write(b'\x02\x03')
-    time.sleep(0.1)
-    return 0, None
+
+
+class RawReplReader:
+    """
+    Splits the reply to a command run in the raw REPL, a chunk at a time as
+    it is read, into the output of the command and its traceback (if it
+    fails). The reply is stdout, CTRL-D, stderr, CTRL-D and then the prompt.
+    """
+
+    def __init__(self):
+        self.section = 0  # 0 while reading stdout, 1 for stderr.
+        self.error = b''
+
+    @property
+    def finished(self):
+        """
+        Whether the command has finished.
+        """
+        return self.section > 1
+
+    def feed(self, data):
+        """
+        Take the next bytes read from the device and return those that were
+        printed by the command (on stdout or stderr).
+        """
+        output = b''
+        while data and not self.finished:
+            printed, end, data = data.partition(b'\x04')
+            output += printed
+            if self.section == 1:
+                self.error += printed
+            if end:
+                self.section += 1
+        return output
 
 
 def set_default(filename, serial=None):
@@ -488,16 +522,32 @@ def get_default(serial=None):
         return b''
 
 
-def write_lib(libpath, serial=None):
+def write_lib(libpath, serial=None, content=None, target='mpython.py'):
+    """
+    Copy the mpython library at libpath (or the given bytes content, the
+    library's source or its .mpy compiled form) onto the board as target.
+    A copy of the library in the other form is removed, since the board
+    imports mpython.py in preference to mpython.mpy.
+    """
     #print("espfs:write_lib")
-    if not os.path.isfile(libpath):
-        raise IOError('No such file.')
-    with open(libpath, 'rb') as local:
-        content = local.read()
+    if content is None:
+        if not os.path.isfile(libpath):
+            raise IOError('No such file.')
+        with open(libpath, 'rb') as local:
+            content = local.read()
+    name, extension = os.path.splitext(target)
+    other = name + ('.py' if extension == '.mpy' else '.mpy')
     commands = [
-        "import os;fd = open('mpython.py', 'wb')",
+        "import os;fd = open('{}', 'wb')".format(target),
         "f = fd.write",
     ]
+    if extension == '.mpy':
+        # Binary, which base64 makes a third bigger but repr up to four times.
+        commands.append('from ubinascii import a2b_base64')
+        while content:
+            line = base64.b64encode(content[:192]).decode('ascii')
+            commands.append("f(a2b_base64('{}'))".format(line))
+            content = content[192:]
     while content:
         line = content[:256]
         if PY2:
@@ -506,6 +556,8 @@ def write_lib(libpath, serial=None):
             commands.append('f(' + repr(line) + ')')
         content = content[256:]
     commands.append('fd.close()')
+    commands.append("try:\n os.remove('{}')\nexcept OSError:\n pass"
+                    .format(other))
     out, err = execute(commands, serial)
     if err:
         raise IOError(clean_error(err))
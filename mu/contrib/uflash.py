@@ -18,9 +18,10 @@ import ctypes
 import os
 import struct
 import sys
-from subprocess import check_output
 import time
 
+from mu.volumes import find_volume
+
 # nudatus is an optional dependancy
 can_minify = True
 try:
@@ -214,12 +215,9 @@ def find_microbit():
     # Check what sort of operating system we're on.
     if os.name == 'posix':
         # 'posix' means we're on Linux or OSX (Mac).
-        # Call the unix "mount" command to list the mounted volumes.
-        mount_output = check_output('mount').splitlines()
-        mounted_volumes = [x.split()[2] for x in mount_output]
-        for volume in mounted_volumes:
-            if volume.endswith(b'MICROBIT'):
-                return volume.decode('utf-8')  # Return a string not bytes.
+        # Look through the mounted volumes (cached by Mu, since this is
+        # called often).
+        return find_volume('MICROBIT')
     elif os.name == 'nt':
         # 'nt' means we're on Windows.
 
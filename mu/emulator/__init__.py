@@ -0,0 +1,83 @@
+"""
+Runs programs written for the mPython board on this computer, against an
+emulated board, so they can be tried out without one.
+
+Mu runs ``python -m mu.emulator script.py`` (see mu.emulator.runner) in a
+PythonProcessPane, with environment variables saying which mpython.py to
+use, where the board's font is and which file to keep up to date with what
+the board's display and RGB LEDs show. Mu's MPythonDisplayPane draws what's
+in that file.
+
+Copyright (c) 2015-2017 Nicholas H.Tollervey and others (see the AUTHORS file).
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import struct
+
+
+#: Environment variable with the path of the mpython.py to run against.
+LIB_ENV = 'MU_MPYTHON_LIB'
+#: Environment variable with the path of the board's font (or a copy of all
+#: its flash). The emulator draws its own font if it isn't set.
+FONT_ENV = 'MU_MPYTHON_FONT'
+#: Environment variable with the path of the file the emulator keeps up to
+#: date with what the display and RGB LEDs show.
+STATE_ENV = 'MU_MPYTHON_STATE'
+#: The width and height of the display and the number of RGB LEDs.
+STATE_HEADER = '<HHB'
+
+
+def envars(lib, font, state):
+    """
+    Return the environment variables (as (name, value) pairs) the emulator
+    needs to run the mpython.py at lib, with the font at font (or None) and
+    keeping the file at state up to date.
+    """
+    # The emulator is part of Mu, so Mu needs to be importable.
+    root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    python_path = os.environ.get('PYTHONPATH')
+    if python_path:
+        root += os.pathsep + python_path
+    return [(LIB_ENV, lib), (FONT_ENV, font or ''), (STATE_ENV, state),
+            ('PYTHONPATH', root)]
+
+
+def pack_state(width, height, display, leds):
+    """
+    Return the bytes of the state file for a display of width by height
+    pixels showing display (a page of 8 rows at a time, a byte per column,
+    least significant bit at the top) and RGB LEDs showing leds, a list of
+    (red, green, blue) colours.
+    """
+    colours = bytes(value for colour in leds for value in colour[:3])
+    return struct.pack(STATE_HEADER, width, height, len(leds)) + \
+        bytes(display) + colours
+
+
+def unpack_state(data):
+    """
+    Return (width, height, display, leds) from the bytes of a state file.
+    Raise ValueError if they're not all there.
+    """
+    size = struct.calcsize(STATE_HEADER)
+    if len(data) < size:
+        raise ValueError('State file too short.')
+    width, height, count = struct.unpack_from(STATE_HEADER, data)
+    end = size + width * height // 8
+    if len(data) != end + count * 3:
+        raise ValueError('State file the wrong size.')
+    leds = [tuple(data[i:i + 3]) for i in range(end, end + count * 3, 3)]
+    return width, height, data[size:end], leds
@@ -0,0 +1,5 @@
+from mu.emulator.runner import main
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+A font for the emulated mPython board when there's no copy of the real one:
+it has (almost) every character of the Basic Multilingual Plane, drawn with
+Qt the first time the board reads it.
+
+Copyright (c) 2015-2017 Nicholas H.Tollervey and others (see the AUTHORS file).
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import struct
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QFont, QFontDatabase, QImage, QPainter
+
+
+class RenderedFont:
+    """
+    The bytes of a font in the mPython board's format (see
+    standins.make_font), for putting in the board's flash. They're worked
+    out as they're sliced, so only the glyphs that are read get drawn.
+
+    Every glyph has a slot of the same size after the table, so where each
+    one is doesn't depend on the others. Characters below 0x80 are half
+    width. A QGuiApplication must exist before glyphs are drawn.
+    """
+
+    height = 16
+    first_char = 32
+    last_char = 0xffff  # The most a font's header can hold.
+    header_size = 18
+    slot_size = 4 + height * 2
+
+    def __init__(self):
+        count = self.last_char - self.first_char
+        self.table_size = self.header_size + count * 6
+        table = bytearray(self.table_size)
+        struct.pack_into('4sHHHHHHH', table, 0, b'FONT', self.height, 16,
+                         12, 8, 12, self.first_char, self.last_char)
+        for i in range(count):
+            width = 8 if self.first_char + i < 0x80 else 16
+            struct.pack_into('IH', table, self.header_size + i * 6,
+                             self.table_size + i * self.slot_size,
+                             4 + self.height * (width // 8))
+        self.table = bytes(table)
+        self.glyphs = {}  # code point -> bytes
+        self.fonts = None
+
+    def __len__(self):
+        return self.table_size + (self.last_char - self.first_char) * \
+            self.slot_size
+
+    def __getitem__(self, index):
+        start, stop, _ = index.indices(len(self))
+        data = bytearray(self.table[start:stop])
+        position = max(start, self.table_size)
+        while position < stop:
+            slot, offset = divmod(position - self.table_size,
+                                  self.slot_size)
+            glyph = self.glyph(self.first_char + slot)
+            chunk = glyph[offset:offset + stop - position]
+            # Pad the unused end of half width glyphs' slots.
+            chunk += bytes(min(self.slot_size - offset,
+                               stop - position) - len(chunk))
+            data += chunk
+            position += len(chunk)
+        return bytes(data)
+
+    def glyph(self, code):
+        """
+        Return the bytes of the glyph of the character with the code point:
+        its width, its bytes per row, then its rows (most significant bit
+        leftmost).
+        """
+        if code not in self.glyphs:
+            if self.fonts is None:
+                fixed = QFontDatabase.systemFont(QFontDatabase.FixedFont)
+                fixed.setPixelSize(self.height - 3)
+                wide = QFont()
+                wide.setPixelSize(self.height - 1)
+                self.fonts = fixed, wide
+            width = 8 if code < 0x80 else 16
+            image = QImage(width, self.height, QImage.Format_Grayscale8)
+            image.fill(0)
+            painter = QPainter(image)
+            painter.setPen(Qt.white)
+            painter.setFont(self.fonts[0] if width == 8 else self.fonts[1])
+            if not 0xd800 <= code < 0xe000:  # Surrogates aren't characters.
+                painter.drawText(0, 0, width, self.height, Qt.AlignCenter,
+                                 chr(code))
+            painter.end()
+            rows = bytearray(self.height * (width // 8))
+            for y in range(self.height):
+                for x in range(width):
+                    if image.pixelColor(x, y).value() > 127:
+                        rows[y * (width // 8) + x // 8] |= 0x80 >> (x % 8)
+            self.glyphs[code] = struct.pack('HH', width, width // 8) + rows
+        return self.glyphs[code]
@@ -0,0 +1,124 @@
+"""
+Runs a program written for the mPython board against an emulated one. Mu
+starts it as ``python -m mu.emulator script.py`` (see mu.emulator).
+
+The board's modules are the stand-ins in mu.emulator.standins, running in
+real time, with the accelerometer lying flat and the buttons not pressed.
+What the display and RGB LEDs show is written to the state file every so
+often, from a thread of its own.
+
+Copyright (c) 2015-2017 Nicholas H.Tollervey and others (see the AUTHORS file).
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import runpy
+import sys
+import threading
+from mu.emulator import FONT_ENV, LIB_ENV, STATE_ENV, pack_state
+from mu.emulator import standins
+
+
+#: How often, in seconds, the state file is brought up to date.
+PUBLISH_INTERVAL = 0.04
+#: Where the accelerometer is on the I2C bus.
+ACCELEROMETER = 38
+
+
+class StatePublisher(threading.Thread):
+    """
+    Keeps the file at path up to date with what the board's display and RGB
+    LEDs show.
+    """
+
+    def __init__(self, board, path):
+        super().__init__(daemon=True)
+        self.board = board
+        self.path = path
+        self.published = None
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(PUBLISH_INTERVAL):
+            self.publish()
+
+    def publish(self):
+        """
+        Write the state file if what's shown has changed. It's written
+        under another name then renamed, so it's never seen half written.
+        """
+        display = self.board.display
+        if display is None:
+            return
+        leds = [colour for neopixel in self.board.neopixels
+                for colour in neopixel.shown]
+        data = pack_state(display.width, display.height, display.shown(),
+                          leds)
+        if data == self.published:
+            return
+        new_path = self.path + '.new'
+        try:
+            with open(new_path, 'wb') as new_file:
+                new_file.write(data)
+            os.replace(new_path, self.path)
+        except OSError:
+            # e.g. Mu is reading it (on Windows). Try again next time.
+            return
+        self.published = data
+
+    def stop(self):
+        """
+        Stop, once what's shown now is written.
+        """
+        self.stopped.set()
+        self.publish()
+
+
+def main(argv=None):
+    """
+    Run the script named first in argv (sys.argv[1:] by default), with the
+    rest of argv as its arguments, against an emulated board.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print(_('The mPython emulator requires a Python script filename to '
+                'run.'))
+        return
+    script = os.path.abspath(argv[0])
+    board = standins.install(board=standins.Board(realtime=True))
+    font = os.environ.get(FONT_ENV)
+    if font:
+        board.load_font(font)
+    else:
+        # The font is drawn with Qt, which needs an application (but not a
+        # window) to draw.
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtGui import QGuiApplication
+        from mu.emulator.font import RenderedFont
+        application = QGuiApplication.instance() or QGuiApplication([])  # noqa
+        board.flash[standins.FONT_ADDRESS] = RenderedFont()
+    # Lying flat: 1g (16384) along z, in registers 6 and 7.
+    board.i2c_memory[(ACCELEROMETER, 7)] = 0x40
+    publisher = None
+    if os.environ.get(STATE_ENV):
+        publisher = StatePublisher(board, os.environ[STATE_ENV])
+        publisher.start()
+    try:
+        standins.load_mpython(os.environ.get(LIB_ENV) or None)
+        sys.argv = [script] + list(argv[1:])
+        sys.path.insert(0, os.path.dirname(script))
+        runpy.run_path(script, run_name='__main__')
+    finally:
+        if publisher:
+            publisher.stop()
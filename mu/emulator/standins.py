@@ -0,0 +1,555 @@
+"""
+Stand-ins for the MicroPython modules mpython.py uses (machine, esp,
+framebuf, ssd1106, neopixel, ustruct, ubinascii, ucollections and time's
+sleep_ms and friends), so mpython.py can be imported and benchmarked on a
+computer, or programs written for the board run there (see mu.emulator).
+
+The stand-ins count what would cross the buses of a real board: flash reads
+and the bytes read, I2C transactions and the bytes written and read, and
+FrameBuffer drawing calls. Everything is recorded on the Board returned by
+install.
+
+Copyright (c) 2015-2017 Nicholas H.Tollervey and others (see the AUTHORS file).
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import binascii
+import collections
+import importlib.util
+import io
+import json
+import os
+import random
+import re
+import struct
+import sys
+import threading
+import time
+import types
+
+
+#: Where mpython.py is in a copy of Mu's source.
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+#: Where the font lives in the flash of an mPython board.
+FONT_ADDRESS = 0x300000
+
+
+class Board:
+    """
+    What the stand-in hardware has been asked to do.
+
+    If realtime is True, timers go off and sleeps take as long as they would
+    on the board. Otherwise timers only go off when fired and sleeps return
+    straight away, which is what benchmarks want.
+    """
+
+    def __init__(self, realtime=False):
+        self.realtime = realtime
+        self.flash = {}  # address -> bytes (or anything that slices like it)
+        # The registers of the devices on the I2C bus: (addr, reg) -> byte.
+        self.i2c_memory = collections.defaultdict(int)
+        self.display = None  # The SSD1106_I2C, once there is one.
+        self.neopixels = []
+        self.reset()
+
+    def reset(self):
+        self.flash_reads = 0
+        self.flash_bytes = 0
+        self.i2c_transactions = 0
+        self.i2c_written = 0
+        self.i2c_read = 0
+        self.draw_calls = 0
+
+    def flash_read(self, address, buffer):
+        self.flash_reads += 1
+        self.flash_bytes += len(buffer)
+        for start, data in self.flash.items():
+            if start <= address < start + len(data):
+                offset = address - start
+                chunk = data[offset:offset + len(buffer)]
+                buffer[:len(chunk)] = chunk
+                return
+        raise OSError('flash read out of range')
+
+    def load_font(self, path):
+        """
+        Put the font in the file at path in flash. The file can be the font
+        on its own or a copy of all the board's flash (e.g. the target.bin
+        Mu restores boards with), which has the font in it.
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) > FONT_ADDRESS:
+            self.flash[0] = data
+        else:
+            self.flash[FONT_ADDRESS] = data
+
+
+def make_font(chars, height=16):
+    """
+    Return the bytes of a font in the mPython board's format covering the
+    code points from space to the highest of chars, with (made up) glyphs
+    for chars only.
+
+    The header is followed by a table of (offset, length) for each code
+    point, then each glyph: its width and bytes per row, then its rows.
+    """
+    codes = sorted(set(ord(c) for c in chars))
+    first_char, last_char = 32, codes[-1] + 1
+    table_size = 18 + (last_char - first_char) * 6
+    table = bytearray(table_size)
+    struct.pack_into('4sHHHHHHH', table, 0, b'FONT', height, 16, 12, 8, 12,
+                     first_char, last_char)
+    glyphs = bytearray()
+    for code in codes:
+        width = 8 if code < 0x80 else 16
+        bytes_per_line = (width + 7) // 8
+        rows = bytes((code * 37 + row * 11) & 0xff
+                     for row in range(height * bytes_per_line))
+        glyph = struct.pack('HH', width, bytes_per_line) + rows
+        struct.pack_into('IH', table, 18 + (code - first_char) * 6,
+                         table_size + len(glyphs), len(glyph))
+        glyphs += glyph
+    return bytes(table + glyphs)
+
+
+def _machine(board):
+    module = types.ModuleType('machine')
+
+    class Pin:
+        IN, OUT, OPEN_DRAIN = 1, 3, 7
+        PULL_UP, PULL_DOWN = 1, 2
+
+        IRQ_FALLING, IRQ_RISING = 2, 1
+
+        def __init__(self, id, mode=-1, pull=-1, value=None):
+            self.id = id
+            if value is None:
+                # Buttons read high until they're pressed.
+                value = 1 if pull == self.PULL_UP else 0
+            self._value = value
+            self.handler = None
+
+        def init(self, *args, **kwargs):
+            pass
+
+        def value(self, value=None):
+            if value is None:
+                return self._value
+            self._value = value
+
+        def on(self):
+            self._value = 1
+
+        def off(self):
+            self._value = 0
+
+        def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING):
+            self.handler = handler
+
+    class PWM:
+        def __init__(self, pin, freq=5000, duty=512):
+            self._freq, self._duty = freq, duty
+
+        def freq(self, freq=None):
+            if freq is None:
+                return self._freq
+            self._freq = freq
+
+        def duty(self, duty=None):
+            if duty is None:
+                return self._duty
+            self._duty = duty
+
+        def deinit(self):
+            pass
+
+    class ADC:
+        ATTN_0DB, ATTN_2_5DB, ATTN_6DB, ATTN_11DB = range(4)
+
+        def __init__(self, pin):
+            self.pin = pin
+            self.samples = 0
+
+        def atten(self, attenuation):
+            pass
+
+        def width(self, width):
+            pass
+
+        def read(self):
+            self.samples += 1
+            return (self.samples * 97) & 0xfff
+
+    class TouchPad:
+        def __init__(self, pin):
+            self.pin = pin
+
+        def read(self):
+            return 600
+
+    class I2C:
+        def __init__(self, id=-1, scl=None, sda=None, freq=400000):
+            self.memory = board.i2c_memory
+            self.registers = {}  # addr -> the register reads start at
+
+        def writeto(self, addr, buf, stop=True):
+            board.i2c_transactions += 1
+            board.i2c_written += len(buf) + 1  # And the address byte.
+            if buf:
+                self.registers[addr] = buf[0]
+            return len(buf)
+
+        def readfrom(self, addr, nbytes, stop=True):
+            buf = bytearray(nbytes)
+            self.readfrom_into(addr, buf)
+            return bytes(buf)
+
+        def readfrom_into(self, addr, buf, stop=True):
+            board.i2c_transactions += 1
+            board.i2c_written += 1
+            board.i2c_read += len(buf)
+            register = self.registers.get(addr, 0)
+            for i in range(len(buf)):
+                buf[i] = self.memory[(addr, register + i)]
+
+        def readfrom_mem_into(self, addr, memaddr, buf):
+            board.i2c_transactions += 1
+            board.i2c_written += 2
+            board.i2c_read += len(buf)
+            for i in range(len(buf)):
+                buf[i] = self.memory[(addr, memaddr + i)]
+
+        def readfrom_mem(self, addr, memaddr, nbytes):
+            buf = bytearray(nbytes)
+            self.readfrom_mem_into(addr, memaddr, buf)
+            return bytes(buf)
+
+        def writeto_mem(self, addr, memaddr, buf):
+            board.i2c_transactions += 1
+            board.i2c_written += len(buf) + 2
+
+    class Timer:
+        PERIODIC, ONE_SHOT = 1, 0
+
+        def __init__(self, id=-1):
+            self.callback = None
+            self.stopped = threading.Event()
+
+        def init(self, mode=PERIODIC, period=-1, callback=None, freq=None):
+            self.deinit()
+            self.callback = callback
+            if board.realtime and callback:
+                seconds = 1 / freq if freq else max(period, 1) / 1000
+                self.stopped = threading.Event()
+                threading.Thread(target=self.run, daemon=True,
+                                 args=(mode, seconds, self.stopped)).start()
+
+        def run(self, mode, seconds, stopped):
+            # Go off every so many seconds (in its own thread) until stopped.
+            while not stopped.wait(seconds):
+                callback = self.callback
+                if callback:
+                    callback(self)
+                if mode == self.ONE_SHOT:
+                    break
+
+        def deinit(self):
+            self.stopped.set()
+            self.callback = None
+
+        def fire(self, times=1):
+            """
+            Call the callback as if the timer had gone off (host only).
+            """
+            for _ in range(times):
+                if self.callback:
+                    self.callback(self)
+
+    for cls in (Pin, PWM, ADC, TouchPad, I2C, Timer):
+        setattr(module, cls.__name__, cls)
+    return module
+
+
+def _framebuf(board):
+    module = types.ModuleType('framebuf')
+    module.MONO_VLSB, module.MONO_HLSB, module.MONO_HMSB = 0, 3, 4
+
+    class FrameBuffer:
+        """
+        framebuf.FrameBuffer for the monochrome formats.
+        """
+
+        def __init__(self, buffer, width, height, format, stride=None):
+            self.buffer = buffer
+            self.width, self.height = width, height
+            self.format = format
+            self.stride = stride or width
+
+        def _index(self, x, y):
+            if self.format == module.MONO_VLSB:
+                return (y >> 3) * self.stride + x, 1 << (y & 7)
+            offset = (y * self.stride + x) >> 3
+            if self.format == module.MONO_HLSB:
+                return offset, 0x80 >> (x & 7)
+            return offset, 1 << (x & 7)
+
+        def _get(self, x, y):
+            index, bit = self._index(x, y)
+            return 1 if self.buffer[index] & bit else 0
+
+        def _set(self, x, y, c):
+            if 0 <= x < self.width and 0 <= y < self.height:
+                index, bit = self._index(x, y)
+                if c:
+                    self.buffer[index] |= bit
+                else:
+                    self.buffer[index] &= ~bit
+
+        def pixel(self, x, y, c=None):
+            board.draw_calls += 1
+            if c is None:
+                if 0 <= x < self.width and 0 <= y < self.height:
+                    return self._get(x, y)
+                return None
+            self._set(x, y, c)
+
+        def fill(self, c):
+            board.draw_calls += 1
+            for i in range(len(self.buffer)):
+                self.buffer[i] = 0xff if c else 0
+
+        def fill_rect(self, x, y, w, h, c):
+            board.draw_calls += 1
+            for yy in range(max(y, 0), min(y + h, self.height)):
+                for xx in range(max(x, 0), min(x + w, self.width)):
+                    self._set(xx, yy, c)
+
+        def hline(self, x, y, w, c):
+            self.fill_rect(x, y, w, 1, c)
+
+        def vline(self, x, y, h, c):
+            self.fill_rect(x, y, 1, h, c)
+
+        def rect(self, x, y, w, h, c):
+            self.hline(x, y, w, c)
+            self.hline(x, y + h - 1, w, c)
+            self.vline(x, y, h, c)
+            self.vline(x + w - 1, y, h, c)
+
+        def line(self, x0, y0, x1, y1, c):
+            board.draw_calls += 1
+            dx, dy = abs(x1 - x0), -abs(y1 - y0)
+            sx, sy = (1 if x0 < x1 else -1), (1 if y0 < y1 else -1)
+            error = dx + dy
+            while True:
+                self._set(x0, y0, c)
+                if x0 == x1 and y0 == y1:
+                    break
+                double = 2 * error
+                if double >= dy:
+                    error += dy
+                    x0 += sx
+                if double <= dx:
+                    error += dx
+                    y0 += sy
+
+        def blit(self, fbuf, x, y, key=-1):
+            board.draw_calls += 1
+            for yy in range(fbuf.height):
+                for xx in range(fbuf.width):
+                    c = fbuf._get(xx, yy)
+                    if c != key:
+                        self._set(x + xx, y + yy, c)
+
+        def scroll(self, xstep, ystep):
+            board.draw_calls += 1
+            copy = FrameBuffer(bytearray(self.buffer), self.width,
+                               self.height, self.format, self.stride)
+            for yy in range(self.height):
+                for xx in range(self.width):
+                    if 0 <= xx - xstep < self.width and \
+                            0 <= yy - ystep < self.height:
+                        self._set(xx, yy, copy._get(xx - xstep, yy - ystep))
+
+        def text(self, s, x, y, c=1):
+            board.draw_calls += 1
+
+    module.FrameBuffer = FrameBuffer
+    module.FrameBuffer1 = FrameBuffer
+    return module
+
+
+def _ssd1106(board, framebuf):
+    module = types.ModuleType('ssd1106')
+
+    class SSD1106_I2C(framebuf.FrameBuffer):
+        """
+        The SH1106 driver on the board, which has 132 columns of RAM with the
+        128 pixels of the display starting at column 2.
+        """
+
+        def __init__(self, width, height, i2c, addr=0x3c,
+                     external_vcc=False):
+            self.i2c = i2c
+            self.addr = addr
+            self.pages = height // 8
+            self.ram = bytearray(self.pages * 132)
+            board.display = self
+            self.ram_page = self.ram_column = 0
+            super().__init__(bytearray(self.pages * width), width, height,
+                             framebuf.MONO_VLSB)
+            for cmd in (0xae, 0xd5, 0x80, 0xa8, height - 1, 0xd3, 0x00, 0x40,
+                        0xad, 0x8b, 0xa1, 0xc8, 0xda, 0x12, 0x81, 0xcf, 0xd9,
+                        0xf1, 0xdb, 0x40, 0xa4, 0xa6, 0xaf):
+                self.write_cmd(cmd)
+            self.fill(0)
+            self.show()
+
+        def write_cmd(self, cmd):
+            self.i2c.writeto(self.addr, bytes((0x80, cmd)))
+            # Keep track of where data goes in the display's RAM.
+            if 0xb0 <= cmd <= 0xb7:
+                self.ram_page = cmd & 0x07
+            elif cmd <= 0x0f:
+                self.ram_column = (self.ram_column & 0xf0) | cmd
+            elif cmd <= 0x1f:
+                self.ram_column = (self.ram_column & 0x0f) | (cmd & 0x0f) << 4
+
+        def write_data(self, buf):
+            self.i2c.writeto(self.addr, b'\x40' + bytes(buf))
+            for byte in bytes(buf):
+                if self.ram_column < 132:
+                    self.ram[self.ram_page * 132 + self.ram_column] = byte
+                self.ram_column += 1
+
+        def shown(self):
+            """
+            Return what the display shows, laid out like the buffer (host
+            only).
+            """
+            return bytes(b for page in range(self.pages)
+                         for b in self.ram[page * 132 + 2:page * 132 + 130])
+
+        def show(self):
+            for page in range(self.pages):
+                self.write_cmd(0xb0 | page)
+                self.write_cmd(0x02)
+                self.write_cmd(0x10)
+                self.write_data(self.buffer[page * self.width:
+                                            (page + 1) * self.width])
+
+        def poweroff(self):
+            self.write_cmd(0xae)
+
+        def poweron(self):
+            self.write_cmd(0xaf)
+
+        def contrast(self, contrast):
+            self.write_cmd(0x81)
+            self.write_cmd(contrast)
+
+        def invert(self, invert):
+            self.write_cmd(0xa6 | (invert & 1))
+
+    module.SSD1106_I2C = SSD1106_I2C
+    return module
+
+
+def _neopixel(board):
+    module = types.ModuleType('neopixel')
+
+    class NeoPixel:
+        def __init__(self, pin, n, bpp=3, timing=1):
+            self.n = n
+            self.pixels = [(0, ) * bpp] * n
+            # The colours last written to the LEDs.
+            self.shown = list(self.pixels)
+            board.neopixels.append(self)
+
+        def __setitem__(self, index, value):
+            self.pixels[index] = value
+
+        def __getitem__(self, index):
+            return self.pixels[index]
+
+        def fill(self, value):
+            self.pixels = [value] * self.n
+
+        def write(self):
+            self.shown = list(self.pixels)
+
+    module.NeoPixel = NeoPixel
+    return module
+
+
+def install(font_chars='', board=None):
+    """
+    Put the stand-in modules in sys.modules, with a font for font_chars in
+    flash, and return the Board recording what they're asked to do. The
+    MicroPython names of standard modules (utime, ujson and so on) are given
+    to CPython's.
+    """
+    board = board or Board()
+    if font_chars:
+        board.flash[FONT_ADDRESS] = make_font(font_chars)
+    esp = types.ModuleType('esp')
+    esp.flash_read = board.flash_read
+    esp.dht_readinto = lambda pin, buf: None
+    micropython = types.ModuleType('micropython')
+    micropython.const = lambda value: value
+    framebuf = _framebuf(board)
+    modules = {
+        'machine': _machine(board),
+        'esp': esp,
+        'framebuf': framebuf,
+        'ssd1106': _ssd1106(board, framebuf),
+        'neopixel': _neopixel(board),
+        'micropython': micropython,
+        'ustruct': struct,
+        'ubinascii': binascii,
+        'ucollections': collections,
+        'uio': io,
+        'ujson': json,
+        'uos': os,
+        'urandom': random,
+        'ure': re,
+        'utime': time,
+        'array': importlib.import_module('array'),
+    }
+    sys.modules.update(modules)
+    if board.realtime:
+        time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+        time.sleep_us = lambda us: time.sleep(us / 1000000)
+    else:
+        time.sleep_ms = lambda ms: None
+        time.sleep_us = lambda us: None
+    time.ticks_ms = lambda: int(time.monotonic() * 1000)
+    time.ticks_us = lambda: int(time.monotonic() * 1000000)
+    time.ticks_diff = lambda end, start: end - start
+    time.ticks_add = lambda ticks, delta: ticks + delta
+    return board
+
+
+def load_mpython(path=None):
+    """
+    Import (a fresh copy of) mpython.py against the stand-in modules.
+    """
+    path = path or os.path.join(ROOT, 'mpython.py')
+    spec = importlib.util.spec_from_file_location('mpython', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['mpython'] = module
+    spec.loader.exec_module(module)
+    return module
@@ -217,13 +217,18 @@ class FindReplaceDialog(QDialog):
 
     * A term to find,
     * An optional value to replace the search term,
-    * A flag to indicate if the user wishes to replace all.
+    * A flag to indicate if the user wishes to replace all,
+    * A flag to indicate if the term to find is a regular expression.
+
+    If given, count_matches is called with the term to find and the regular
+    expression flag to show how many matches there are as the user types.
     """
 
     def __init__(self, parent=None):
         super().__init__(parent)
 
-    def setup(self, find=None, replace=None, replace_flag=False):
+    def setup(self, find=None, replace=None, replace_flag=False,
+              regex_flag=False, count_matches=None):
         self.setMinimumSize(600, 200)
         self.setWindowTitle(_('Find / Replace'))
         widget_layout = QVBoxLayout()
@@ -244,6 +249,18 @@ class FindReplaceDialog(QDialog):
         self.replace_all_flag = QCheckBox(_('Replace all?'))
         self.replace_all_flag.setChecked(replace_flag)
         widget_layout.addWidget(self.replace_all_flag)
+        # Regular expression.
+        self.regex_checkbox = QCheckBox(_('Regular expression?'))
+        self.regex_checkbox.setChecked(regex_flag)
+        widget_layout.addWidget(self.regex_checkbox)
+        # Number of matches.
+        self.count_matches = count_matches
+        self.match_count = QLabel()
+        widget_layout.addWidget(self.match_count)
+        if count_matches:
+            self.find_term.textChanged.connect(self.update_match_count)
+            self.regex_checkbox.toggled.connect(self.update_match_count)
+            self.update_match_count()
         button_box = QDialogButtonBox(QDialogButtonBox.Ok |
                                       QDialogButtonBox.Cancel)
         button_box.accepted.connect(self.accept)
@@ -268,6 +285,24 @@ class FindReplaceDialog(QDialog):
         """
         return self.replace_all_flag.isChecked()
 
+    def regex_flag(self):
+        """
+        Return the value of the regular expression flag.
+        """
+        return self.regex_checkbox.isChecked()
+
+    def update_match_count(self, *args):
+        """
+        Show how many matches there are for the term to find.
+        """
+        count = self.count_matches(self.find(), self.regex_flag())
+        if count is None:
+            self.match_count.setText(_('Invalid regular expression.'))
+        elif self.find():
+            self.match_count.setText(_('Matches: {}').format(count))
+        else:
+            self.match_count.setText('')
+
 
 class UpdateFirmwareDialog(QDialog):
     """
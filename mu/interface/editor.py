@@ -19,17 +19,36 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import keyword
 import os
 import re
+import hashlib
 import logging
 import os.path
 from collections import defaultdict
-from PyQt5.Qsci import QsciScintilla, QsciLexerPython, QsciAPIs
-from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.Qsci import (QsciScintilla, QsciLexerPython, QsciAPIs,
+                        QSCINTILLA_VERSION_STR)
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
+from PyQt5.QtGui import QColor
+from PyQt5.QtWidgets import QWidget, QLabel, QVBoxLayout
 from mu.interface.themes import Font, DayTheme
-from mu.logic import NEWLINE
+from mu.logic import NEWLINE, DATA_DIR
 
 
 # Regular Expression for valid individual code 'words'
 RE_VALID_WORD = re.compile('^[A-Za-z0-9_-]*$')
+# Regular Expression for the words indexed in each line of the editor.
+RE_WORD = re.compile(r'\w+')
+# Regular Expression for the line endings Scintilla recognises.
+RE_LINE_ENDING = re.compile('\r\n|\r|\n')
+
+# Text with at least this many characters is opened in large file mode:
+# read-only (until the user unlocks it) and without syntax highlighting,
+# autocompletion or highlighting of the matches of the selected word.
+LARGE_FILE_SIZE = 1024 * 1024
+# How many characters of a large file are added to the editor at first.
+LARGE_FILE_CHUNK = 256 * 1024
+
+# Prepared autocomplete databases shared by all tabs, keyed by a hash of the
+# API definitions they were built from (see get_api).
+API_DATABASES = {}
 
 
 logger = logging.getLogger(__name__)
@@ -58,6 +77,127 @@ class PythonLexer(QsciLexerPython):
         return ' '.join(kws)
 
 
+def search_pattern(target, regex=False):
+    """
+    Return a compiled regular expression matching the target text, which is
+    either a regular expression itself or, by default, literal text. Raises
+    re.error if the regular expression is invalid.
+    """
+    return re.compile(target if regex else re.escape(target), re.MULTILINE)
+
+
+def api_key(api_definitions):
+    """
+    Return a hash identifying the referenced list of API definitions (and the
+    version of QScintilla whose prepared database format we'd save).
+    """
+    digest = hashlib.sha1(QSCINTILLA_VERSION_STR.encode('utf-8'))
+    for entry in api_definitions:
+        digest.update(entry.encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+def get_api(api_definitions):
+    """
+    Return the QsciAPIs database for the referenced API definitions, shared
+    by every tab using them.
+
+    The first time a list of definitions is seen its database is loaded from
+    the copy prepared by a previous session. Failing that, it is prepared
+    (QScintilla does this in a background thread) and saved for next time.
+    """
+    key = api_key(api_definitions)
+    api = API_DATABASES.get(key)
+    if api is None:
+        # The database outlives the tabs using it, so give it its own lexer.
+        lexer = PythonLexer()
+        api = QsciAPIs(lexer)
+        api.owner = lexer
+        prepared_path = os.path.join(DATA_DIR, 'api-{}.pap'.format(key))
+        if api.isPrepared(prepared_path) and api.loadPrepared(prepared_path):
+            logger.info('Loaded prepared API from: {}'.format(prepared_path))
+        else:
+            for entry in api_definitions:
+                api.add(entry)
+
+            @api.apiPreparationFinished.connect
+            def on_prepared():
+                if api.savePrepared(prepared_path):
+                    logger.info('Saved prepared API to: {}'.format(
+                        prepared_path))
+                else:
+                    logger.warning('Could not save prepared API to: {}'.format(
+                        prepared_path))
+
+            api.prepare()
+        API_DATABASES[key] = api
+    return api
+
+
+def split_chunks(text, size, max_size=None):
+    """
+    Yield the text in chunks, starting with one of the given size and
+    doubling the size of each chunk up to max_size (16 times the first size
+    by default). Appending to a large document is slow however little is
+    appended, so this keeps the number of chunks down while the first one
+    shows up quickly.
+    """
+    max_size = max_size or size * 16
+    start = 0
+    while start < len(text):
+        yield text[start:start + size]
+        start += size
+        size = min(size * 2, max_size)
+
+
+class WordIndex:
+    """
+    An index of where each word occurs in each line of a document.
+
+    Each line is a dictionary mapping the words found in it to the columns
+    at which they start, so finding the occurrences of a word in a range of
+    lines doesn't involve searching the text. The index is kept up to date by
+    re-indexing only the lines affected by each change to the document.
+    """
+
+    def __init__(self, text=''):
+        self.lines = [self.index_line(line)
+                      for line in RE_LINE_ENDING.split(text)]
+
+    @staticmethod
+    def index_line(line):
+        """
+        Return a dictionary of the words in the line and the columns at which
+        they start.
+        """
+        words = {}
+        for match in RE_WORD.finditer(line):
+            words.setdefault(match.group(), []).append(match.start())
+        return words
+
+    def update(self, line, lines_removed, new_lines):
+        """
+        Replace the entries for lines_removed lines, starting at the given
+        line, with entries for each of the new lines of text.
+        """
+        end = line + lines_removed
+        self.lines[line:end] = [self.index_line(text) for text in new_lines]
+
+    def find(self, word, first_line=0, last_line=None):
+        """
+        Yield (line, col_start, line, col_end) ranges for the occurrences of
+        the word between first_line and last_line (inclusive).
+        """
+        if last_line is None:
+            last_line = len(self.lines) - 1
+        length = len(word)
+        for line in range(max(first_line, 0),
+                          min(last_line + 1, len(self.lines))):
+            for col in self.lines[line].get(word, ()):
+                yield line, col, line, col + length
+
+
 class EditorPane(QsciScintilla):
     """
     Represents the text editor.
@@ -70,7 +210,16 @@ class EditorPane(QsciScintilla):
         super().__init__()
         self.setUtf8(True)
         self.path = path
-        self.setText(text)
+        self.large = len(text) >= LARGE_FILE_SIZE
+        # Large files are read-only until the user unlocks them.
+        self.locked = self.large
+        self.loading = False
+        # Kept up to date by on_modified as the text changes.
+        self.word_index = WordIndex()
+        if not self.large:
+            self.SCN_MODIFIED.connect(self.on_modified)
+            self.SCN_UPDATEUI.connect(self.on_update_ui)
+            self.setText(text)
         self.newline = newline
         self.check_indicators = {  # IDs are arbitrary
             'error': {'id': 19, 'markers': {}},
@@ -79,6 +228,10 @@ class EditorPane(QsciScintilla):
         self.search_indicators = {
             'selection': {'id': 21, 'positions': []}
         }
+        # The selected word (and its range) whose matches are highlighted.
+        self.highlighted_word = None
+        self.highlighted_range = None
+        self.highlighted_lines = set()
         self.DEBUG_INDICATOR = 22  # Arbitrary
         self.BREAKPOINT_MARKER = 23  # Arbitrary
         self.previous_selection = {
@@ -92,6 +245,8 @@ class EditorPane(QsciScintilla):
         self.configure()
         self.setAcceptDrops(True)
         #self.setDragEnabled(True)
+        if self.large:
+            self.load_in_chunks(text)
 
     def dragEnterEvent(self, QDragEnterEvent):
         event = QDragEnterEvent  # type:QDragEnterEvent
@@ -175,7 +330,41 @@ class EditorPane(QsciScintilla):
                 self.StraightBoxIndicator, self.search_indicators[type_]['id'])
         self.indicatorDefine(self.FullBoxIndicator, self.DEBUG_INDICATOR)
         self.setAnnotationDisplay(self.AnnotationBoxed)
-        self.selectionChanged.connect(self.selection_change_listener)
+        if not self.large:
+            self.selectionChanged.connect(self.selection_change_listener)
+
+    def load_in_chunks(self, text):
+        """
+        Add the text of a large file to the (read-only) editor a chunk at a
+        time, letting the event loop run in between so Mu stays responsive.
+        """
+        self.loading = True
+        self.setReadOnly(True)
+        self.SendScintilla(QsciScintilla.SCI_SETUNDOCOLLECTION, False)
+        self.chunks = split_chunks(text, LARGE_FILE_CHUNK)
+        # Owned by the editor, so it stops if the tab is closed.
+        self.chunk_timer = QTimer(self)
+        self.chunk_timer.timeout.connect(self.load_next_chunk)
+        self.load_next_chunk()
+        self.chunk_timer.start(0)
+
+    def load_next_chunk(self):
+        """
+        Append the next chunk of a large file, or finish loading it.
+        """
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.chunk_timer.stop()
+            self.chunks = None
+            self.SendScintilla(QsciScintilla.SCI_SETUNDOCOLLECTION, True)
+            self.SendScintilla(QsciScintilla.SCI_EMPTYUNDOBUFFER)
+            self.loading = False
+            return
+        # Read-only stops the text being changed by any means.
+        self.setReadOnly(False)
+        self.append(chunk)
+        self.setReadOnly(True)
+        self.setModified(False)
 
     def connect_margin(self, func):
         """
@@ -187,8 +376,15 @@ class EditorPane(QsciScintilla):
         """
         Connect the theme to a lexer and return the lexer for the editor to
         apply to the script text.
+
+        Large files aren't highlighted, so just get the theme's default
+        colours.
         """
-        theme.apply_to(self.lexer)
+        if self.large:
+            self.setColor(QColor(theme.Default.color))
+            self.setPaper(QColor(theme.Default.paper))
+        else:
+            theme.apply_to(self.lexer)
         self.lexer.setDefaultPaper(theme.Paper)
         self.setCaretForegroundColor(theme.Caret)
         self.setIndicatorForegroundColor(theme.IndicatorError,
@@ -204,8 +400,12 @@ class EditorPane(QsciScintilla):
                                       self.BREAKPOINT_MARKER)
         self.setAutoCompletionThreshold(1)  # 2
         self.setAutoCompletionCaseSensitivity(True)  # CaseSensitivity
-        self.setAutoCompletionSource(QsciScintilla.AcsAll)
-        self.setLexer(self.lexer)
+        if self.large:
+            # Don't trawl the whole document for completions.
+            self.setAutoCompletionSource(QsciScintilla.AcsNone)
+        else:
+            self.setAutoCompletionSource(QsciScintilla.AcsAll)
+            self.setLexer(self.lexer)
         self.setMarginsBackgroundColor(theme.Margin)
         self.setMarginsForegroundColor(theme.Caret)
         self.setMatchedBraceBackgroundColor(theme.BraceBackground)
@@ -217,10 +417,10 @@ class EditorPane(QsciScintilla):
         """
         Sets the API entries for tooltips, calltips and the like.
         """
-        self.api = QsciAPIs(self.lexer)
-        for entry in api_definitions:
-            self.api.add(entry)
-        self.api.prepare()
+        if self.large:
+            return
+        self.api = get_api(api_definitions)
+        self.lexer.setAPIs(self.api)
 
     @property
     def label(self):
@@ -276,6 +476,9 @@ class EditorPane(QsciScintilla):
                     position['line_end'], position['col_end'],
                     self.search_indicators[indicator]['id'])
             self.search_indicators[indicator]['positions'] = []
+        self.highlighted_word = None
+        self.highlighted_range = None
+        self.highlighted_lines = set()
 
     def annotate_code(self, feedback, annotation_type='error'):
         """
@@ -357,17 +560,115 @@ class EditorPane(QsciScintilla):
             show=False,      # Unfolds found text
             posix=False)     # More POSIX compatible RegEx
 
-    def range_from_positions(self, start_position, end_position):
-        """Given a start-end pair, such as are provided by a regex match,
-        return the corresponding Scintilla line-offset pairs which are
-        used for searches, indicators etc.
+    def count_matches(self, target, regex=False):
+        """
+        Return how many times the target text (or regular expression) matches
+        the text in the editor, or None if the regular expression is invalid.
+        """
+        if not target:
+            return 0
+        try:
+            pattern = search_pattern(target, regex)
+        except re.error:
+            return None
+        return sum(1 for _match in pattern.finditer(self.text()))
 
-        FIXME: Not clear whether the Scintilla conversions are expecting
-        bytes or characters (ie codepoints)
+    def find_match(self, target, regex=False):
+        """
+        Select the first match of the target text (or regular expression,
+        with the same syntax as count_matches and replace_all) after the
+        cursor, wrapping round to the start if there isn't one. Returns the
+        match, or None. Raises re.error if the regular expression is invalid.
         """
-        start_line, start_offset = self.lineIndexFromPosition(start_position)
-        end_line, end_offset = self.lineIndexFromPosition(end_position)
-        return start_line, start_offset, end_line, end_offset
+        if not target:
+            return None
+        pattern = search_pattern(target, regex)
+        text = self.text()
+        data = text.encode('utf-8')
+        # Scintilla positions count bytes of UTF-8.
+        cursor = self.SendScintilla(QsciScintilla.SCI_GETCURRENTPOS)
+        start = len(data[:cursor].decode('utf-8', 'ignore'))
+        match = pattern.search(text, start)
+        if match and match.end() == start and start < len(text):
+            # Don't find the same empty match again.
+            match = pattern.search(text, start + 1)
+        match = match or pattern.search(text)
+        if match:
+            start_pos = len(text[:match.start()].encode('utf-8'))
+            end_pos = start_pos + len(match.group().encode('utf-8'))
+            self.SendScintilla(QsciScintilla.SCI_SETSEL, start_pos, end_pos)
+        return match
+
+    def replace_match(self, target, replace, regex=False):
+        """
+        Replace the first match of the target text (or regular expression,
+        in which case replace may refer to its groups) after the cursor, as
+        find_match finds it, with replace. Returns the number of replacements
+        made (0 or 1). Raises re.error if the regular expression is invalid.
+        """
+        if self.isReadOnly():
+            return 0
+        match = self.find_match(target, regex)
+        if not match:
+            return 0
+        replacement = match.expand(replace) if regex else replace
+        self.replaceSelectedText(replacement)
+        return 1
+
+    def replace_all(self, target, replace, regex=False):
+        """
+        Replace every match of the target text (or regular expression, in
+        which case replace may refer to its groups) with replace. Returns the
+        number of replacements made.
+
+        The new text is worked out in a single pass over the old and then
+        only the part from the first match to the end of the last is
+        replaced, as one edit that can be undone in one go. Raises re.error
+        if the regular expression is invalid.
+        """
+        if not target or self.isReadOnly():
+            return 0
+        pattern = search_pattern(target, regex)
+        text = self.text()
+        span = []
+
+        def substitute(match):
+            if not span:
+                span.append(match.start())
+            span[1:] = [match.end()]
+            return match.expand(replace) if regex else replace
+
+        new_text, count = pattern.subn(substitute, text)
+        if not count:
+            return 0
+        start, end = span
+        tail = len(text) - end
+        # Scintilla positions count bytes of UTF-8.
+        start_pos = len(text[:start].encode('utf-8'))
+        end_pos = start_pos + len(text[start:end].encode('utf-8'))
+        replacement = new_text[start:len(new_text) - tail].encode('utf-8')
+        line, index = self.getCursorPosition()
+        first_visible = self.firstVisibleLine()
+        line_count = self.lines()
+        breakpoints = sorted({self.markerLine(handle)
+                              for handle in self.breakpoint_handles} - {-1})
+        self.beginUndoAction()
+        self.SendScintilla(QsciScintilla.SCI_SETTARGETRANGE, start_pos,
+                           end_pos)
+        self.SendScintilla(QsciScintilla.SCI_REPLACETARGET, len(replacement),
+                           replacement)
+        self.endUndoAction()
+        if self.lines() == line_count and breakpoints:
+            # Markers on lines within the replaced text end up on its first
+            # line, so put them back where they were.
+            self.markerDeleteAll(self.BREAKPOINT_MARKER)
+            self.breakpoint_handles = {
+                self.markerAdd(line, self.BREAKPOINT_MARKER)
+                for line in breakpoints}
+        line = min(line, self.lines() - 1)
+        self.setCursorPosition(line, min(index, len(self.text(line))))
+        self.setFirstVisibleLine(first_visible)
+        return count
 
     def highlight_selected_matches(self):
         """
@@ -423,28 +724,74 @@ class EditorPane(QsciScintilla):
         if col1 != end_offset:
             return
 
-        #
-        # For each matching word within the editor text, add it to
-        # the list of highlighted indicators and fill it according
-        # to the current theme.
-        #
+        self.highlighted_word = selected_text
+        self.highlighted_range = selected_range
+        self.highlight_visible_matches()
+
+    def visible_lines(self):
+        """
+        Return the first and last lines of the document visible in the editor.
+        """
+        first = self.SendScintilla(
+            QsciScintilla.SCI_DOCLINEFROMVISIBLE, self.firstVisibleLine())
+        last = self.SendScintilla(
+            QsciScintilla.SCI_DOCLINEFROMVISIBLE,
+            self.firstVisibleLine() + self.SendScintilla(
+                QsciScintilla.SCI_LINESONSCREEN))
+        return first, last
+
+    def highlight_visible_matches(self):
+        """
+        Look up the matches for the highlighted word in the lines currently
+        visible in the editor and fill them according to the current theme.
+        Lines already highlighted are skipped, so this is cheap enough to call
+        whenever the editor scrolls.
+        """
+        if not self.highlighted_word:
+            return
         indicators = self.search_indicators['selection']
-        text = self.text()
-        for match in re.finditer(selected_text, text):
-            range = self.range_from_positions(*match.span())
+        first, last = self.visible_lines()
+        for match in self.word_index.find(self.highlighted_word, first, last):
+            line_start, col_start, line_end, col_end = match
             #
-            # Don't highlight the text we've selected
+            # Don't highlight the text we've selected, or anything already
+            # highlighted
             #
-            if range == selected_range:
+            if (match == self.highlighted_range or
+                    line_start in self.highlighted_lines):
                 continue
-
-            line_start, col_start, line_end, col_end = range
             indicators['positions'].append({
                 'line_start': line_start, 'col_start': col_start,
                 'line_end': line_end, 'col_end': col_end
             })
             self.fillIndicatorRange(line_start, col_start, line_end,
                                     col_end, indicators['id'])
+        self.highlighted_lines.update(range(first, last + 1))
+
+    def on_modified(self, position, modification_type, text, length,
+                    lines_added, *args):
+        """
+        Handle Scintilla's notification of a change to the document by
+        re-indexing the words in the lines that changed.
+        """
+        if not modification_type & (QsciScintilla.SC_MOD_INSERTTEXT |
+                                    QsciScintilla.SC_MOD_DELETETEXT):
+            return
+        line = self.SendScintilla(QsciScintilla.SCI_LINEFROMPOSITION,
+                                  position)
+        lines_removed = 1 + max(0, -lines_added)
+        new_lines = [self.text(number) for number in
+                     range(line, line + 1 + max(0, lines_added))]
+        self.word_index.update(line, lines_removed, new_lines)
+        # Highlights on lines that have moved are no longer accounted for.
+        self.highlighted_lines = set()
+
+    def on_update_ui(self, updated):
+        """
+        Highlight matches scrolled into view.
+        """
+        if updated & QsciScintilla.SC_UPDATE_V_SCROLL:
+            self.highlight_visible_matches()
 
     def selection_change_listener(self):
         """
@@ -523,3 +870,48 @@ class EditorPane(QsciScintilla):
             self.setSelection(line_number, 0, line_number, len(line_content))
             self.replaceSelectedText(new_line)
             self.setSelection(line_number, 0, line_number, len(new_line) - 1)
+
+
+class PlaceholderPane(QWidget):
+    """
+    Stands in for an EditorPane restored from a previous session until its
+    tab is first focussed, at which point the file is read and the real
+    editor widget replaces it.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.newline = NEWLINE
+        self.breakpoint_handles = set()
+        self.large = False
+        self.locked = False
+        self.loading = True
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel(_('Loading...')), 0, Qt.AlignCenter)
+
+    label = EditorPane.label
+
+    def isModified(self):
+        """
+        Nothing can have changed in a file that hasn't been loaded yet.
+        """
+        return False
+
+    def set_theme(self, theme=DayTheme):
+        pass
+
+    def set_api(self, api_definitions):
+        pass
+
+    def setReadOnly(self, is_readonly):
+        pass
+
+    def reset_annotations(self):
+        pass
+
+    def reset_debugger_highlight(self):
+        pass
+
+    def setSelection(self, *args):
+        pass
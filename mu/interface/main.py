@@ -16,6 +16,7 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
+import re
 import sys
 import platform
 import logging
@@ -38,8 +39,9 @@ from mu.interface.themes import (DayTheme, NightTheme, ContrastTheme,
 from mu.interface.panes import (DebugInspector, DebugInspectorItem,
                                 PythonProcessPane, JupyterREPLPane,
                                 MicroPythonREPLPane, FileSystemPane,
-                                EspFileSystemPane, PlotterPane)
-from mu.interface.editor import EditorPane
+                                EspFileSystemPane, PlotterPane,
+                                MPythonDisplayPane)
+from mu.interface.editor import EditorPane, PlaceholderPane
 from mu.resources import load_icon, load_pixmap
 
 
@@ -174,6 +176,18 @@ class FileTabs(QTabWidget):
             window.update_title(current_tab.label)
         else:
             window.update_title(None)
+        if isinstance(current_tab, PlaceholderPane):
+            # Read the file in the background once this event is handled, so
+            # quickly flicking through restored tabs doesn't load them all.
+            QTimer.singleShot(0, lambda: self.load_placeholder(current_tab))
+
+    def load_placeholder(self, placeholder):
+        """
+        Ask for the file behind the referenced placeholder to be loaded if its
+        tab is still the one being looked at.
+        """
+        if self.currentWidget() is placeholder:
+            self.nativeParentWidget().load_tab.emit(placeholder.path, False)
 
 
 class Window(QMainWindow):
@@ -189,6 +203,7 @@ class Window(QMainWindow):
     serial = None
     repl = None
     plotter = None
+    emulator = None
 
     _zoom_in = pyqtSignal(int)
     _zoom_out = pyqtSignal(int)
@@ -197,7 +212,9 @@ class Window(QMainWindow):
     data_received = pyqtSignal(bytes)
     open_file = pyqtSignal(str)
     load_theme = pyqtSignal(str)
+    load_tab = pyqtSignal(str, bool)
     previous_folder = None
+    theme_class = DayTheme
     update_bin_status = False
 
     def zoom_in(self):
@@ -223,8 +240,18 @@ class Window(QMainWindow):
     def current_tab(self):
         """
         Returns the currently focussed tab.
+
+        If the tab is a placeholder for a file restored from the last session,
+        the file is loaded (blocking) so callers always get an editor.
         """
-        return self.tabs.currentWidget()
+        tab = self.tabs.currentWidget()
+        while isinstance(tab, PlaceholderPane):
+            self.load_tab.emit(tab.path, True)
+            if self.tabs.currentWidget() is tab:
+                # Nothing handled the signal.
+                break
+            tab = self.tabs.currentWidget()
+        return tab
 
     def set_read_only(self, is_readonly):
         """
@@ -232,7 +259,15 @@ class Window(QMainWindow):
         """
         self.read_only_tabs = is_readonly
         for tab in self.widgets:
-            tab.setReadOnly(is_readonly)
+            tab.setReadOnly(is_readonly or tab.locked)
+
+    def unlock_tab(self, tab):
+        """
+        Let the user edit the referenced tab (a large file, which is opened
+        read-only) unless all the tabs are read-only at the moment.
+        """
+        tab.locked = False
+        tab.setReadOnly(self.read_only_tabs)
 
     def get_load_path(self, folder, extensions='*'):
         """
@@ -301,6 +336,74 @@ class Window(QMainWindow):
             new_tab.setReadOnly(self.read_only_tabs)
         return new_tab
 
+    def add_placeholder_tab(self, path):
+        """
+        Adds a tab for the referenced path whose content is only loaded, via
+        the load_tab signal, when the tab is first focussed.
+        """
+        placeholder = PlaceholderPane(path)
+        self.tabs.addTab(placeholder, placeholder.label)
+        return placeholder
+
+    def replace_placeholder(self, path, text, api, newline):
+        """
+        Swaps the placeholder tab for the referenced path with an editor
+        containing the loaded text. Returns the new tab, or None if there is
+        no longer a placeholder for the path (e.g. it was closed).
+        """
+        placeholder = self.find_placeholder(path)
+        if placeholder is None:
+            return None
+        index = self.tabs.indexOf(placeholder)
+        is_current = self.tabs.currentWidget() is placeholder
+        new_tab = EditorPane(path, text, newline)
+        new_tab.connect_margin(self.breakpoint_toggle)
+        self.tabs.insertTab(index, new_tab, new_tab.label)
+        new_tab.set_api(api)
+
+        @new_tab.modificationChanged.connect
+        def on_modified():
+            modified_tab_index = self.tabs.currentIndex()
+            self.tabs.setTabText(modified_tab_index, new_tab.label)
+            self.update_title(new_tab.label)
+
+        @new_tab.open_file.connect
+        def on_open_file(file):
+            # Bubble the signal up
+            self.open_file.emit(file)
+
+        self.connect_zoom(new_tab)
+        new_tab.set_theme(self.theme_class)
+        if self.read_only_tabs:
+            new_tab.setReadOnly(self.read_only_tabs)
+        if is_current:
+            self.tabs.setCurrentIndex(index)
+        # Skip FileTabs.removeTab, there's no unsaved work to confirm.
+        QTabWidget.removeTab(self.tabs, self.tabs.indexOf(placeholder))
+        placeholder.deleteLater()
+        if is_current:
+            new_tab.setFocus()
+        return new_tab
+
+    def remove_placeholder(self, path):
+        """
+        Closes the placeholder tab for the referenced path (if it is still
+        open).
+        """
+        placeholder = self.find_placeholder(path)
+        if placeholder is not None:
+            QTabWidget.removeTab(self.tabs, self.tabs.indexOf(placeholder))
+            placeholder.deleteLater()
+
+    def find_placeholder(self, path):
+        """
+        Returns the placeholder tab for the referenced path or None.
+        """
+        for widget in self.widgets:
+            if isinstance(widget, PlaceholderPane) and widget.path == path:
+                return widget
+        return None
+
     def focus_tab(self, tab):
         index = self.tabs.indexOf(tab)
         self.tabs.setCurrentIndex(index)
@@ -492,6 +595,15 @@ class Window(QMainWindow):
         self.data_received.connect(repl_pane.process_bytes)
         self.add_repl(repl_pane, name)
 
+    def add_device_output(self, name):
+        """
+        Adds a read only REPL pane to show the output of a program a mode is
+        running on a device over a serial connection of its own.
+        """
+        repl_pane = MicroPythonREPLPane(serial=None)
+        repl_pane.setReadOnly(True)
+        self.add_repl(repl_pane, name)
+
     def add_micropython_plotter(self, port, name, mode):
         """
         Adds a plotter that reads data from a serial connection.
@@ -558,6 +670,21 @@ class Window(QMainWindow):
         self.plotter_pane.set_theme(self.theme)
         self.plotter_pane.setFocus()
 
+    def add_mpython_display(self, path):
+        """
+        Adds a pane showing the display of the emulated mPython board, which
+        the emulator keeps up to date in the file at path.
+        """
+        self.emulator_pane = MPythonDisplayPane(path)
+        self.emulator = QDockWidget(_('mPython Emulator'))
+        self.emulator.setWidget(self.emulator_pane)
+        self.emulator.setFeatures(QDockWidget.DockWidgetMovable)
+        self.emulator.setAllowedAreas(Qt.BottomDockWidgetArea |
+                                      Qt.LeftDockWidgetArea |
+                                      Qt.RightDockWidgetArea)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.emulator)
+        return self.emulator_pane
+
     def add_python3_runner(self, script_name, working_directory,
                            interactive=False, debugger=False,
                            command_args=None, runner=None, envars=None,
@@ -703,6 +830,16 @@ class Window(QMainWindow):
             if not self.repl:
                 self.close_serial_link()
 
+    def remove_mpython_display(self):
+        """
+        Removes the emulated mPython board's display from the application.
+        """
+        if self.emulator:
+            self.emulator_pane = None
+            self.emulator.setParent(None)
+            self.emulator.deleteLater()
+            self.emulator = None
+
     def remove_python_runner(self):
         """
         Removes the runner pane from the application.
@@ -739,6 +876,7 @@ class Window(QMainWindow):
         else:
             new_theme = DayTheme
             new_icon = 'theme'
+        self.theme_class = new_theme
         for widget in self.widgets:
             widget.set_theme(new_theme)
         self.button_bar.slots['theme'].setIcon(load_icon(new_icon))
@@ -973,53 +1111,58 @@ class Window(QMainWindow):
         self.find_replace_shortcut = QShortcut(QKeySequence(shortcut), self)
         self.find_replace_shortcut.activated.connect(handler)
 
-    def show_find_replace(self, find, replace, global_replace):
+    def connect_unlock_tab(self, handler, shortcut):
+        """
+        Create a keyboard shortcut and associate it with a handler for making
+        a large file editable.
+        """
+        self.unlock_tab_shortcut = QShortcut(QKeySequence(shortcut), self)
+        self.unlock_tab_shortcut.activated.connect(handler)
+
+    def show_find_replace(self, find, replace, global_replace, regex=False):
         """
         Display the find/replace dialog. If the dialog's OK button was clicked
-        return a tuple containing the find term, replace term and global
-        replace flag.
+        return a tuple containing the find term, replace term, global
+        replace flag and regular expression flag.
         """
         finder = FindReplaceDialog(self)
-        finder.setup(find, replace, global_replace)
+        count_matches = None
+        if self.current_tab:
+            count_matches = self.current_tab.count_matches
+        finder.setup(find, replace, global_replace, regex, count_matches)
         if finder.exec():
-            return (finder.find(), finder.replace(), finder.replace_flag())
+            return (finder.find(), finder.replace(), finder.replace_flag(),
+                    finder.regex_flag())
 
-    def replace_text(self, target_text, replace, global_replace):
+    def replace_text(self, target_text, replace, global_replace, regex=False):
         """
         Given target_text, replace the first instance after the cursor with
         "replace". If global_replace is true, replace all instances of
-        "target". Returns the number of times replacement has occurred.
+        "target" (as a single edit which can be undone in one go). If regex
+        is true target_text is a regular expression. Returns the number of
+        times replacement has occurred.
         """
         if not self.current_tab:
             return 0
-        if global_replace:
-            counter = 0
-            found = self.current_tab.findFirst(target_text, True, True,
-                                               False, False, line=0, index=0)
-            if found:
-                counter += 1
-                self.current_tab.replace(replace)
-                while self.current_tab.findNext():
-                    self.current_tab.replace(replace)
-                    counter += 1
-            return counter
-        else:
-            found = self.current_tab.findFirst(target_text, True, True, False,
-                                               True)
-            if found:
-                self.current_tab.replace(replace)
-                return 1
-            else:
-                return 0
+        try:
+            if global_replace:
+                return self.current_tab.replace_all(target_text, replace,
+                                                    regex)
+            return self.current_tab.replace_match(target_text, replace, regex)
+        except re.error:
+            return 0
 
-    def highlight_text(self, target_text):
+    def highlight_text(self, target_text, regex=False):
         """
         Highlight the first match from the current position of the cursor in
         the current tab for the target_text. Returns True if there's a match.
         """
         if self.current_tab:
-            return self.current_tab.findFirst(target_text, True, True, False,
-                                              True)
+            try:
+                return self.current_tab.find_match(target_text,
+                                                   regex) is not None
+            except re.error:
+                return False
         else:
             return False
 
@@ -1045,30 +1188,19 @@ class Window(QMainWindow):
         if result == QMessageBox.Ok:
             webbrowser.open_new(_url)
 
-    def update_pylib(self, _bytes, _config_dir):
+    def update_pylib(self, _path):
         """
-        result = self.show_confirmation(_("\nFound a new version of "
-            "'mpython.py' library, update now ?"), icon='Question')
-        if result == QMessageBox.Ok:
+        The 'mpython.py' library at _path has been updated.
         """
-        file_path = os.path.join(_config_dir, 'mpython.py')
-        file_handle = open(file_path, mode='wb+')
-        file_handle.write(_bytes)
-        file_handle.close()
         self.status_bar.set_message(_("The 'mpython.py' library which pre"
             "seted in software has been updated to the latest version."))
 
-    def update_bin(self, _version, _bytes, _config_dir):
+    def update_bin(self, _version, _path):
         """
-        result = self.show_confirmation(_("\nFound a new firmware of "
-            "mPython board, update now ?"), icon='Question')
-        if result == QMessageBox.Ok:
+        The firmware at _path has been updated to _version, so record the
+        new version in the mpython.ini next to it.
         """
-        file_path = os.path.join(_config_dir, 'target.bin')
-        file_handle = open(file_path, mode='wb')
-        file_handle.write(_bytes)
-        file_handle.close()
-        ini_path = os.path.join(_config_dir, 'mpython.ini')
+        ini_path = os.path.join(os.path.dirname(_path), 'mpython.ini')
         cf = configparser.ConfigParser()
         cf.read(ini_path)
         if not cf.has_section("firmware"):
@@ -1078,8 +1210,8 @@ class Window(QMainWindow):
         _date = _version[k:]
         cf.set("firmware", "date", _date)
         cf.set("firmware", "ignore", "0")
-        # print(cf.get("firmware","version"))
-        cf.write(open(ini_path, "w"))
+        with open(ini_path, "w") as ini_file:
+            cf.write(ini_file)
         self.update_bin_status = True
         self.status_bar.set_message(_("The firmware of mPython board which "
             "preseted in software has been updated to the latest version."))
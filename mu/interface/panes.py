@@ -28,17 +28,21 @@ import os.path
 import json
 import configparser
 from PyQt5.QtCore import (Qt, QProcess, QProcessEnvironment, pyqtSignal,
-                          QTimer, QUrl)
+                          QTimer, QUrl, QRect)
 from collections import deque
 from PyQt5.QtWidgets import (QMessageBox, QTextEdit, QFrame, QListWidget,
                              QGridLayout, QLabel, QMenu, QApplication,
-                             QTreeView, QInputDialog, QLineEdit)  # , QListWidgetItem)
+                             QTreeView, QInputDialog, QLineEdit,
+                             QWidget)  # , QListWidgetItem)
 from PyQt5.QtGui import (QKeySequence, QTextCursor, QCursor, QPainter,
-                         QDesktopServices, QStandardItem)  # , QBrush, QColor)
+                         QDesktopServices, QStandardItem, QImage,
+                         QColor)  # , QBrush)
 from qtconsole.rich_jupyter_widget import RichJupyterWidget
 from mu.interface.themes import Font
 from mu.interface.themes import DEFAULT_FONT_SIZE
 from mu.interface.dialogs import PutPyFileDialog
+from mu.telemetry import FrameDecoder
+from mu.emulator import unpack_state
 
 
 logger = logging.getLogger(__name__)
@@ -126,6 +130,10 @@ class MicroPythonREPLPane(QTextEdit):
     The device MUST be flashed with MicroPython for this to work.
     """
 
+    #: Milliseconds to wait for more of what looks like the start of a
+    #: telemetry frame before showing it as text.
+    frame_timeout = 100
+
     def __init__(self, serial, theme='day', parent=None):
         super().__init__(parent)
         self.serial = serial
@@ -137,6 +145,12 @@ class MicroPythonREPLPane(QTextEdit):
         self.customContextMenuRequested.connect(self.context_menu)
         self.setObjectName('replpane')
         self.set_theme(theme)
+        # Takes out telemetry frames meant for the plotter.
+        self.decoder = FrameDecoder()
+        self.pending_timer = QTimer(self)
+        self.pending_timer.setSingleShot(True)
+        self.pending_timer.setInterval(self.frame_timeout)
+        self.pending_timer.timeout.connect(self.release_pending)
         if self.serial:
             self.serial.setDataTerminalReady(False)
             # self.serial.setRequestToSend(False)
@@ -147,7 +161,7 @@ class MicroPythonREPLPane(QTextEdit):
         Grabs clipboard contents then sends down the serial port.
         """
         clipboard = QApplication.clipboard()
-        if clipboard and clipboard.text():
+        if self.serial and clipboard and clipboard.text():
             to_paste = json.dumps(clipboard.text())
             if to_paste.startswith('"') and to_paste.endswith('"'):
                 to_paste = to_paste[1:-1]
@@ -219,13 +233,39 @@ class MicroPythonREPLPane(QTextEdit):
             elif key == Qt.Key_V:
                 self.paste()
                 msg = b''
-        self.serial.write(msg)
+        if self.serial:
+            self.serial.write(msg)
 
     def process_bytes(self, data):
         """
         Given some incoming bytes of data, work out how to handle / display
         them in the REPL widget.
         """
+        data = self.decoder.feed(data)[0]
+        if self.decoder.pending:
+            # Perhaps the start of a frame. If no more arrives for a while it
+            # was text after all.
+            self.pending_timer.start()
+        else:
+            self.pending_timer.stop()
+        self.show_bytes(data)
+
+    def release_pending(self):
+        """
+        Nothing more has arrived of what looked like the start of a
+        telemetry frame, so show it as text.
+        """
+        self.show_bytes(self.decoder.flush()[0])
+        if self.decoder.pending:
+            self.pending_timer.start()
+        else:
+            self.pending_timer.stop()
+
+    def show_bytes(self, data):
+        """
+        Display the bytes of text in data (which may contain VT100 control
+        sequences) in the REPL widget.
+        """
         tc = self.textCursor()
         # The text cursor must be on the last line of the document. If it isn't
         # then move it there.
@@ -1541,6 +1581,10 @@ class PlotterPane(QChartView):
 
     data_flood = pyqtSignal()
 
+    #: Milliseconds to wait for more of what looks like the start of a
+    #: telemetry frame before treating it as text.
+    frame_timeout = 100
+
     def __init__(self, parent=None):
         super().__init__(parent)
         # Holds the raw input to be checked for actionable data to display.
@@ -1551,6 +1595,11 @@ class PlotterPane(QChartView):
         self.max_x = 100  # Maximum value along x axis
         self.max_y = 1000  # Maximum value +/- along y axis
         self.flooded = False  # Flag to indicate if data flooding is happening.
+        self.decoder = FrameDecoder()  # Finds binary telemetry frames.
+        self.pending_timer = QTimer(self)
+        self.pending_timer.setSingleShot(True)
+        self.pending_timer.setInterval(self.frame_timeout)
+        self.pending_timer.timeout.connect(self.release_pending)
 
         # Holds deques for each slot of incoming data (assumes 1 to start with)
         self.data = [deque([0] * self.max_x), ]
@@ -1580,25 +1629,59 @@ class PlotterPane(QChartView):
     def process_bytes(self, data):
         """
         Takes raw bytes and, if a valid tuple is detected, adds the data to
-        the plotter.
+        the plotter. Samples in binary telemetry frames (see mu.telemetry)
+        mixed in with the text are added too.
 
         The the length of the bytes data > 1024 then a data_flood signal is
-        emitted to ensure Mu can take action to remain responsive.
+        emitted to ensure Mu can take action to remain responsive. Frames
+        don't count towards this, since they're cheap to decode and their
+        samples are added to the chart all at once.
         """
         # Data flooding guards.
         if self.flooded:
             return
+        data, samples = self.decoder.feed(data)
+        if self.decoder.pending:
+            # Perhaps the start of a frame. If no more arrives for a while it
+            # was text after all (such as the garbage a board prints as it
+            # boots), so the tuples after it aren't held back.
+            self.pending_timer.start()
+        else:
+            self.pending_timer.stop()
+        self.plot_bytes(data, samples)
+
+    def release_pending(self):
+        """
+        Nothing more has arrived of what looked like the start of a
+        telemetry frame, so look for tuples in it as text.
+        """
+        data, samples = self.decoder.flush()
+        if self.decoder.pending and not self.flooded:
+            self.pending_timer.start()
+        else:
+            self.pending_timer.stop()
+        if not self.flooded:
+            self.plot_bytes(data, samples)
+
+    def plot_bytes(self, data, samples):
+        """
+        Add the samples decoded from telemetry frames, and any tuples found
+        in the bytes of text in data, to the plotter.
+        """
         if len(data) > 1024:
             self.flooded = True
             self.data_flood.emit()
             return
-        data = data.replace(b'\r\n', b'\n')
+        if samples:
+            self.add_samples(samples)
         self.input_buffer.append(data)
         # Check if the data contains a Python tuple, containing numbers, on a
-        # single line (i.e. ends with \n).
-        input_bytes = b''.join(self.input_buffer)
+        # single line (i.e. ends with \n). A \r\n may be split between reads,
+        # so they're replaced once the buffered bytes are joined.
+        input_bytes = b''.join(self.input_buffer).replace(b'\r\n', b'\n')
         lines = input_bytes.split(b'\n')
-        for line in lines:
+        # The last line isn't complete until its \n arrives.
+        for line in lines[:-1]:
             if line.startswith(b'(') and line.endswith(b')'):
                 # Candidate tuple. Extract the raw bytes into a numeric tuple.
                 raw_values = [val.strip() for val in line[1:-1].split(b',')]
@@ -1632,37 +1715,45 @@ class PlotterPane(QChartView):
         series, add the data to the line series, update the range of the chart
         so the chart displays nicely.
         """
-        # Store incoming data to dump as CSV at the end of the session.
-        self.raw_data.append(values)
-        # Check the number of incoming values.
-        if len(values) != len(self.series):
-            # Adjust the number of line series.
-            value_len = len(values)
-            series_len = len(self.series)
-            if value_len > series_len:
-                # Add new line series.
-                for i in range(value_len - series_len):
-                    new_series = QLineSeries()
-                    self.chart.addSeries(new_series)
-                    self.chart.setAxisX(self.axis_x, new_series)
-                    self.chart.setAxisY(self.axis_y, new_series)
-                    self.series.append(new_series)
-                    self.data.append(deque([0] * self.max_x))
-            else:
-                # Remove old line series.
-                for old_series in self.series[value_len:]:
-                    self.chart.removeSeries(old_series)
-                self.series = self.series[:value_len]
-                self.data = self.data[:value_len]
-
-        # Add the incoming values to the data to be displayed, and compute
-        # max range.
-        max_ranges = []
-        for i, value in enumerate(values):
-            self.data[i].appendleft(value)
-            max_ranges.append(max([max(self.data[i]), abs(min(self.data[i]))]))
-            if len(self.data[i]) > self.max_x:
-                self.data[i].pop()
+        self.add_samples([values])
+
+    def add_samples(self, samples):
+        """
+        Add a list of tuples of values as add_data does, but only update the
+        chart once, after they've all been added.
+        """
+        for values in samples:
+            # Store incoming data to dump as CSV at the end of the session.
+            self.raw_data.append(values)
+            # Check the number of incoming values.
+            if len(values) != len(self.series):
+                # Adjust the number of line series.
+                value_len = len(values)
+                series_len = len(self.series)
+                if value_len > series_len:
+                    # Add new line series.
+                    for i in range(value_len - series_len):
+                        new_series = QLineSeries()
+                        self.chart.addSeries(new_series)
+                        self.chart.setAxisX(self.axis_x, new_series)
+                        self.chart.setAxisY(self.axis_y, new_series)
+                        self.series.append(new_series)
+                        self.data.append(deque([0] * self.max_x))
+                else:
+                    # Remove old line series.
+                    for old_series in self.series[value_len:]:
+                        self.chart.removeSeries(old_series)
+                    self.series = self.series[:value_len]
+                    self.data = self.data[:value_len]
+
+            # Add the incoming values to the data to be displayed.
+            for i, value in enumerate(values):
+                self.data[i].appendleft(value)
+                if len(self.data[i]) > self.max_x:
+                    self.data[i].pop()
+
+        # Compute max range.
+        max_ranges = [max([max(data), abs(min(data))]) for data in self.data]
 
         # Re-scale y-axis.
         max_y_range = max(max_ranges)
@@ -1701,3 +1792,80 @@ class PlotterPane(QChartView):
             self.chart.setTheme(QChart.ChartThemeDark)
         else:
             self.chart.setTheme(QChart.ChartThemeHighContrast)
+
+
+class MPythonDisplayPane(QWidget):
+    """
+    Shows what the display and RGB LEDs of the emulated mPython board (see
+    mu.emulator) are showing, by reading the state file the emulator keeps
+    up to date every so often.
+    """
+
+    #: Milliseconds between looks at the state file.
+    interval = 40
+    #: The diameter of the RGB LEDs, in (screen) pixels.
+    led_size = 16
+
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.state = None  # The bytes of the state file being shown.
+        self.image = QImage(128, 64, QImage.Format_Grayscale8)
+        self.image.fill(0)
+        self.leds = []
+        self.setObjectName('mpythondisplaypane')
+        self.setMinimumSize(2 * 128, 2 * 64 + 2 * self.led_size)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(self.interval)
+
+    def refresh(self):
+        """
+        Show what's in the state file, if it has changed.
+        """
+        try:
+            with open(self.path, 'rb') as state_file:
+                data = state_file.read()
+        except OSError:
+            # The emulator hasn't written it yet.
+            return
+        if data == self.state:
+            return
+        try:
+            width, height, display, leds = unpack_state(data)
+        except ValueError:
+            return
+        self.state = data
+        # The display holds a column of 8 pixels in each byte.
+        pixels = bytearray(width * height)
+        for y in range(height):
+            row = (y // 8) * width
+            bit = 1 << (y % 8)
+            for x in range(width):
+                if display[row + x] & bit:
+                    pixels[y * width + x] = 0xff
+        self.image = QImage(bytes(pixels), width, height, width,
+                            QImage.Format_Grayscale8).copy()
+        self.leds = leds
+        self.update()
+
+    def paintEvent(self, event):
+        """
+        Draw the display, scaled up a whole number of times so its pixels
+        stay square, with the RGB LEDs underneath.
+        """
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.black)
+        width, height = self.image.width(), self.image.height()
+        scale = max(1, min(self.width() // width,
+                           (self.height() - 2 * self.led_size) // height))
+        left = (self.width() - width * scale) // 2
+        painter.drawImage(QRect(left, 0, width * scale, height * scale),
+                          self.image)
+        top = height * scale + self.led_size // 2
+        left = (self.width() - (2 * len(self.leds) - 1) * self.led_size) // 2
+        painter.setPen(Qt.gray)
+        for i, colour in enumerate(self.leds):
+            painter.setBrush(QColor(*colour))
+            painter.drawEllipse(left + 2 * i * self.led_size, top,
+                                self.led_size, self.led_size)
@@ -17,24 +17,35 @@ GNU General Public License for more details.
 You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
+import io
 import os
 import sys
+import ast
+import time
+import bisect
 import codecs
-import io
+import contextlib
+import hashlib
 import re
 import json
 import logging
-import tempfile
 import platform
 import webbrowser
 import random
 import locale
+import mmap
 import shutil
+import tempfile
+import threading
 import appdirs
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
 from PyQt5.QtWidgets import QMessageBox
-from pyflakes.api import check
-from pycodestyle import StyleGuide, Checker
+from PyQt5.QtSerialPort import QSerialPortInfo
+from pyflakes.checker import Checker as FlakesChecker
+from pyflakes.messages import UnusedImport
+from pycodestyle import StyleGuide, Checker, BaseReport, expand_indent
 from mu.resources import path
+from mu import volumes
 from mu.debugger.utils import is_breakpoint_line
 from mu import __version__
 
@@ -49,14 +60,18 @@ DATA_DIR = appdirs.user_data_dir(appname='mu', appauthor='python')
 LOG_DIR = appdirs.user_log_dir(appname='mu', appauthor='python')
 # The path to the log file for the application.
 LOG_FILE = os.path.join(LOG_DIR, 'mu.log')
-# Regex to match pycodestyle (PEP8) output.
-STYLE_REGEX = re.compile(r'.*:(\d+):(\d+):\s+(.*)')
-# Regex to match flake8 output.
-FLAKE_REGEX = re.compile(r'.*:(\d+):\s+(.*)')
-# Regex to match false positive flake errors if microbit.* is expanded.
-EXPAND_FALSE_POSITIVE = re.compile(r"^'microbit\.(\w+)' imported but unused$")
-EXPAND_FALSE_POSITIVE_MACHINE = re.compile(r"^'machine\.(\w+)' imported but unused$")
-EXPAND_FALSE_POSITIVE_MPYTHON = re.compile(r"^'mpython\.(\w+)' imported but unused$")
+# PEP8 rules Mu doesn't report.
+STYLE_IGNORE = ('E121', 'E123', 'E126', 'E226', 'E302', 'E305', 'E24', 'E704',
+                'W291', 'W292', 'W293', 'W391', 'W503', )
+# Arguments that make a pycodestyle check depend on lines other than the one
+# being checked, so its results cannot be reused when other lines change.
+STYLE_CONTEXT_ARGS = {'lines', 'line_number', 'total_lines', 'blank_lines',
+                      'blank_before', 'previous_unindented_logical_line',
+                      'checker_state', }
+# Maximum number of cached per-line pycodestyle results kept between checks.
+STYLE_CACHE_SIZE = 20000
+# Extensions of files Mu opens as plain text rather than asking the modes.
+TEXT_EXTENSIONS = ('.py', '.txt', '.json', '.ini')
 # The text to which "from microbit import \*" should be expanded.
 EXPANDED_IMPORT = ("from microbit import pin15, pin2, pin0, pin1, "
                    " pin3, pin6, pin4, i2c, pin5, pin7, pin8, Image, "
@@ -73,6 +88,15 @@ EXPANDED_IMPORT_MPYTHON = ("from mpython import Font, Accelerometer, TextMode,"
                            "rgb, light, sound, button_a, button_b, display, "
                            "touchPad_P, touchPad_Y, touchPad_T, "
                            "touchPad_H, touchPad_O, touchPad_N, i2c")
+# The names "import \*" is taken to bring in from each of these modules.
+STAR_IMPORT_NAMES = {
+    expanded.split()[1]: list(dict.fromkeys(
+        name.strip() for name in expanded.split(' import ', 1)[1].split(',')))
+    for expanded in (EXPANDED_IMPORT, EXPANDED_IMPORT_MACHINE,
+                     EXPANDED_IMPORT_MPYTHON)
+}
+# Maximum number of pyflakes results kept between checks.
+FLAKE_CACHE_SIZE = 64
 # Port number for debugger.
 DEBUGGER_PORT = 31415
 MOTD = [  # Candidate phrases for the message of the day (MOTD).
@@ -149,6 +173,15 @@ NEWLINE = "\n"
 ENCODING = "utf-8"
 ENCODING_COOKIE_RE = re.compile(
     "^[ \t\v]*#.*?coding[:=][ \t]*([-_.a-zA-Z0-9]+)")
+#: How many bytes at the start of a file to look for its encoding in.
+SNIFF_SIZE = 4096
+#: Files at least this big are memory mapped rather than read into memory.
+MMAP_THRESHOLD = 1024 * 1024
+# Results of pycodestyle checks shared between calls to check_pycodestyle.
+STYLE_CACHE = {}
+# Results of pyflakes checks, keyed by a hash of the code checked (and the
+# filename and builtins it was checked with).
+FLAKE_CACHE = {}
 
 logger = logging.getLogger(__name__)
 
@@ -170,11 +203,36 @@ def write_and_flush(fileobj, content):
     os.fsync(fileobj)
 
 
-def save_and_encode(text, filepath, newline=os.linesep):
+def write_atomically(content, filepath, encoding):
+    """
+    Write the content to a temporary file next to the referenced file and
+    then rename it over that file, so the file never holds half of what was
+    written (even if Mu crashes or a device is unplugged part way through).
+    """
+    filepath = os.path.realpath(filepath)  # Replace the target of a link.
+    directory, name = os.path.split(filepath)
+    fd, temp_path = tempfile.mkstemp(prefix='.{}.'.format(name),
+                                     suffix='.tmp', dir=directory)
+    try:
+        with open(fd, "w", encoding=encoding, newline='') as f:
+            write_and_flush(f, content)
+        with contextlib.suppress(OSError):
+            shutil.copymode(filepath, temp_path)
+        os.replace(temp_path, filepath)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+
+
+def save_and_encode(text, filepath, newline=os.linesep, atomic=False):
     """
     Detect the presence of an encoding cookie and use that encoding; if
     none is present, do not add one and use the Mu default encoding.
     If the codec is invalid, log a warning and fall back to the default.
+
+    If atomic is set, the file is written with write_atomically where the
+    filesystem allows it.
     """
     match = ENCODING_COOKIE_RE.match(text)
     if match:
@@ -187,12 +245,28 @@ def save_and_encode(text, filepath, newline=os.linesep):
     else:
         encoding = ENCODING
 
+    content = newline.join(text.splitlines())
+    if atomic:
+        try:
+            write_atomically(content, filepath, encoding)
+            return
+        except OSError as ex:
+            logger.warning('Could not replace {} ({}), so writing it in '
+                           'place.'.format(filepath, ex))
     with open(filepath, "w", encoding=encoding, newline='') as f:
-        write_and_flush(f, newline.join(text.splitlines()))
+        write_and_flush(f, content)
 
 
-def sniff_encoding(filepath):
-    """Determine the encoding of a file:
+def text_digest(text):
+    """
+    Return a hash of the text, to tell whether it has changed since it was
+    last saved.
+    """
+    return hashlib.md5(text.encode(ENCODING, 'surrogatepass')).hexdigest()
+
+
+def sniff_encoding_from(head):
+    """Determine the encoding of a file from the bytes at its start:
 
     * If there is a BOM, return the appropriate encoding
     * If there is a PEP 263 encoding cookie, return the appropriate encoding
@@ -206,15 +280,14 @@ def sniff_encoding(filepath):
     #
     # Try for a BOM
     #
-    with open(filepath, "rb") as f:
-        line = f.readline()
     for bom, encoding in boms:
-        if line.startswith(bom):
+        if head.startswith(bom):
             return encoding
 
     #
-    # Look for a PEP 263 encoding cookie
+    # Look for a PEP 263 encoding cookie on the first line
     #
+    line = head.split(b"\n", 1)[0]
     default_encoding = locale.getpreferredencoding()
     try:
         uline = line.decode(default_encoding)
@@ -234,6 +307,15 @@ def sniff_encoding(filepath):
     return None
 
 
+def sniff_encoding(filepath):
+    """
+    Determine the encoding of the referenced file (see sniff_encoding_from).
+    """
+    with open(filepath, "rb") as f:
+        line = f.readline()
+    return sniff_encoding_from(line)
+
+
 def sniff_newline_convention(text):
     """Determine which line-ending convention predominates in the text.
 
@@ -242,20 +324,19 @@ def sniff_newline_convention(text):
     But editors can produce either convention from either platform. And
     a file which has been copied and edited around might even have both!
     """
+    crlf = text.count("\r\n")
     candidates = [
-        ("\r\n", "\r\n"),
-        # Match \n at the start of the string
-        # or \n preceded by any character other than \r
-        ("\n", "^\n|[^\r]\n")
+        ("\r\n", crlf),
+        # Every \n not preceded by \r
+        ("\n", text.count("\n") - crlf),
     ]
     #
     # If no lines are present, default to the platform newline
     # If there's a tie, use the platform default
     #
     conventions_found = [(0, 1, os.linesep)]
-    for candidate, pattern in candidates:
-        instances = re.findall(pattern, text)
-        convention = (len(instances), candidate == os.linesep, candidate)
+    for candidate, instances in candidates:
+        convention = (instances, candidate == os.linesep, candidate)
         conventions_found.append(convention)
     majority_convention = max(conventions_found)
     return majority_convention[-1]
@@ -263,31 +344,45 @@ def sniff_newline_convention(text):
 
 def read_and_decode(filepath):
     """
-    Read the contents of a file,
-    """
-    sniffed_encoding = sniff_encoding(filepath)
-    #
-    # If sniff_encoding has found enough clues to indicate an encoding,
-    # use that. Otherwise try a series of defaults before giving up.
-    #
-    if sniffed_encoding:
-        logger.debug("Detected encoding %s", sniffed_encoding)
-        candidate_encodings = [sniffed_encoding]
-    else:
-        candidate_encodings = [ENCODING, locale.getpreferredencoding()]
+    Read the contents of a file, returning the decoded text (with Mu's
+    newlines) and the newline convention it had.
 
+    The file is read once: the encoding is sniffed from the start of the
+    buffer that is then decoded. Big files are memory mapped rather than
+    copied into memory before decoding.
+    """
     with open(filepath, "rb") as f:
-        btext = f.read()
-    for encoding in candidate_encodings:
-        logger.debug("Trying to decode with %s", encoding)
-        try:
-            text = btext.decode(encoding)
-            logger.info("Decoded with %s", encoding)
-            break
-        except UnicodeDecodeError:
-            continue
-    else:
-        raise UnicodeDecodeError(encoding, btext, 0, 0, "Unable to decode")
+        if os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+            btext = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            btext = f.read()
+    try:
+        sniffed_encoding = sniff_encoding_from(btext[:SNIFF_SIZE])
+        #
+        # If sniff_encoding_from has found enough clues to indicate an
+        # encoding, use that. Otherwise try a series of defaults before
+        # giving up.
+        #
+        if sniffed_encoding:
+            logger.debug("Detected encoding %s", sniffed_encoding)
+            candidate_encodings = [sniffed_encoding]
+        else:
+            candidate_encodings = [ENCODING, locale.getpreferredencoding()]
+
+        for encoding in candidate_encodings:
+            logger.debug("Trying to decode with %s", encoding)
+            try:
+                text = str(btext, encoding)
+                logger.info("Decoded with %s", encoding)
+                break
+            except UnicodeDecodeError:
+                continue
+        else:
+            raise UnicodeDecodeError(encoding, btext[:SNIFF_SIZE], 0, 0,
+                                     "Unable to decode")
+    finally:
+        if not isinstance(btext, bytes):
+            btext.close()  # Unmap it.
 
     #
     # Sniff and convert newlines here so that, by the time
@@ -296,7 +391,7 @@ def read_and_decode(filepath):
     #
     newline = sniff_newline_convention(text)
     logger.debug("Detected newline %r", newline)
-    text = re.sub("\r\n", NEWLINE, text)
+    text = text.replace("\r\n", NEWLINE)
     return text, newline
 
 
@@ -372,6 +467,24 @@ def extract_envars(raw):
     return result
 
 
+def expand_star_imports(tree):
+    """
+    Replace "from microbit import *" (and the same for machine and mpython)
+    anywhere in the referenced AST (e.g. in a try: block) with imports of the
+    names the module provides, so pyflakes knows where they come from.
+    Returns the line numbers of the imports that were expanded.
+    """
+    expanded = set()
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.ImportFrom) and
+                node.module in STAR_IMPORT_NAMES and
+                [alias.name for alias in node.names] == ['*']):
+            node.names = [ast.alias(name=name, asname=None)
+                          for name in STAR_IMPORT_NAMES[node.module]]
+            expanded.add(node.lineno)
+    return expanded
+
+
 def check_flake(filename, code, builtins=None):
     """
     Given a filename and some code to be checked, uses the PyFlakesmodule to
@@ -381,45 +494,39 @@ def check_flake(filename, code, builtins=None):
 
     If a list symbols is passed in as "builtins" these are assumed to be
     additional builtins available when run by Mu.
+
+    The code is parsed once and the same tree is used to expand star imports
+    from microbit, machine and mpython and by pyflakes itself. Results are
+    cached by a hash of the code, so checking unchanged code again (for
+    example, after switching tabs) is free. The result must not be changed.
     """
-    import_all = "from microbit import *" in code
-    import_machine = "from machine import *" in code
-    import_mpython = "from mpython import *" in code
-    if import_all:
-        # Massage code so "from microbit import *" is expanded so the symbols
-        # are known to flake.
-        code = code.replace("from microbit import *", EXPANDED_IMPORT)
-    if import_machine:
-        code = code.replace("from machine import *", EXPANDED_IMPORT_MACHINE)
-    if import_mpython:
-        code = code.replace("from mpython import *", EXPANDED_IMPORT_MPYTHON)
+    builtins = tuple(builtins or ())
+    key = (hashlib.sha1(code.encode('utf-8', 'surrogatepass')).digest(),
+           filename, builtins)
+    feedback = FLAKE_CACHE.get(key)
+    if feedback is not None:
+        return feedback
     reporter = MuFlakeCodeReporter()
-    check(code, filename, reporter)
-    if builtins:
-        builtins_regex = re.compile(r"^undefined name '(" +
-                                    '|'.join(builtins) + r")'")
-    feedback = {}
-    for log in reporter.log:
-        if import_all:
-            # Guard to stop unwanted "microbit.* imported but unused" messages.
-            message = log['message']
-            if EXPAND_FALSE_POSITIVE.match(message):
-                continue
-        if import_machine:
-            message = log['message']
-            if EXPAND_FALSE_POSITIVE_MACHINE.match(message):
-                continue
-        if import_mpython:
-            message = log['message']
-            if EXPAND_FALSE_POSITIVE_MPYTHON.match(message):
-                continue
-        if builtins:
-            if builtins_regex.match(log['message']):
+    try:
+        tree = ast.parse(code, filename=filename)
+    except SyntaxError as ex:
+        reporter.syntaxError(filename, ex.args[0], ex.lineno, ex.offset,
+                             ex.text)
+    except Exception:
+        reporter.unexpectedError(filename, 'problem decoding source')
+    else:
+        expanded = expand_star_imports(tree)
+        flakes = FlakesChecker(tree, filename=filename, builtins=builtins)
+        for message in sorted(flakes.messages, key=lambda m: m.lineno):
+            if (isinstance(message, UnusedImport) and
+                    message.lineno in expanded):
+                # Names from an expanded star import needn't all be used.
                 continue
-        if log['line_no'] not in feedback:
-            feedback[log['line_no']] = []
-        feedback[log['line_no']].append(log)
-    return feedback
+            reporter.flake(message)
+    if len(FLAKE_CACHE) >= FLAKE_CACHE_SIZE:
+        del FLAKE_CACHE[next(iter(FLAKE_CACHE))]
+    FLAKE_CACHE[key] = reporter.feedback
+    return reporter.feedback
 
 
 def check_pycodestyle(code):
@@ -428,62 +535,236 @@ def check_pycodestyle(code):
     of items describing issues of coding style. See:
 
     https://pycodestyle.readthedocs.io/en/latest/intro.html
+
+    The code is checked in memory and the results of each line are cached
+    (see MuStyleChecker) so re-checking an edited script only re-runs the
+    checks for the lines that changed and their immediate neighbours.
     """
-    # PyCodeStyle reads input from files, so make a temporary file containing
-    # the code.
-    code_fd, code_filename = tempfile.mkstemp()
-    os.close(code_fd)
-    save_and_encode(code, code_filename)
-    # Configure which PEP8 rules to ignore.
-    ignore = ('E121', 'E123', 'E126', 'E226', 'E302', 'E305', 'E24', 'E704',
-              'W291', 'W292', 'W293', 'W391', 'W503', )
     style = StyleGuide(parse_argv=False, config_file=False)
-    style.options.ignore = ignore
-    checker = Checker(code_filename, options=style.options)
-    # Re-route stdout to a temporary buffer to be parsed below.
-    temp_out = io.StringIO()
-    sys.stdout = temp_out
-    # Check the code.
+    style.options.ignore = STYLE_IGNORE
+    report = MuStyleReport(style.options)
+    # Split lines as reading a file would: str.splitlines also splits on form
+    # feeds, U+2028 and the like, which Python doesn't treat as line breaks.
+    lines = io.StringIO(code, newline='').readlines()
+    checker = MuStyleChecker(lines, style.options, report, STYLE_CACHE)
     checker.check_all()
-    # Put stdout back and read the content of the buffer. Remove the temporary
-    # file created at the start.
-    sys.stdout = sys.__stdout__
-    temp_out.seek(0)
-    results = temp_out.read()
-    temp_out.close()
-    os.remove(code_filename)
-    # Parse the output from the tool into a dictionary of structured data.
     style_feedback = {}
-    for result in results.split('\n'):
-        matcher = STYLE_REGEX.match(result)
-        if matcher:
-            line_no, col, msg = matcher.groups()
-            line_no = int(line_no) - 1
-            code, description = msg.split(' ', 1)
-            if code == 'E303':
-                description += _(' above this line')
-            if line_no not in style_feedback:
-                style_feedback[line_no] = []
-            style_feedback[line_no].append({
-                'line_no': line_no,
-                'column': int(col) - 1,
-                'message': description.capitalize(),
-                'code': code,
-            })
+    for line_no, column, code, description in report.log:
+        line_no = line_no - 1  # Zero based counting in Mu.
+        if code == 'E303':
+            description += _(' above this line')
+        if line_no not in style_feedback:
+            style_feedback[line_no] = []
+        style_feedback[line_no].append({
+            'line_no': line_no,
+            'column': column,
+            'message': description.capitalize(),
+            'code': code,
+        })
     return style_feedback
 
 
+class MuStyleReport(BaseReport):
+    """
+    Collects pycodestyle's results as structured data for Mu, rather than
+    printing them to stdout.
+    """
+
+    def __init__(self, options):
+        """
+        Set up the report to collect (line_no, column, code, description)
+        tuples for each problem found.
+        """
+        super().__init__(options)
+        self.log = []
+
+    def error(self, line_number, offset, text, check):
+        """
+        Record the problem unless it's one of the ignored codes.
+        """
+        code = super().error(line_number, offset, text, check)
+        if code:
+            self.log.append((line_number, offset, code, text[5:]))
+        return code
+
+
+class MuStyleChecker(Checker):
+    """
+    A pycodestyle Checker for in-memory lines which caches the results of the
+    checks run against each line.
+
+    Checks that only look at the line being checked (and a few attributes of
+    the checker, such as the indentation of the previous logical line) are
+    cached against the tokens of the line and the values of those attributes.
+    The remaining checks (those that take one of STYLE_CONTEXT_ARGS) are cheap
+    and are always run. The cache is a dictionary shared between checkers so
+    results are reused from one check of the code to the next.
+    """
+
+    def __init__(self, lines, options, report, cache):
+        super().__init__(lines=lines, options=options, report=report)
+        self.cache = cache
+        self.touched = {}
+        (self._cached_physical, self._fresh_physical,
+         self._physical_context) = self._split_checks(self._physical_checks)
+        (self._cached_logical, self._fresh_logical,
+         self._logical_context) = self._split_checks(self._logical_checks)
+
+    def _split_checks(self, checks):
+        """
+        Split the checks into those whose results may be cached and those
+        which must always run. Also return the names of the checker
+        attributes the cacheable checks depend upon.
+        """
+        cached, fresh, context = [], [], set()
+        for name, check, argument_names in checks:
+            if STYLE_CONTEXT_ARGS.intersection(argument_names):
+                fresh.append((name, check, argument_names))
+            else:
+                cached.append((name, check, argument_names))
+                context.update(argument_names)
+        context -= {'physical_line', 'logical_line', 'tokens', }
+        return cached, fresh, tuple(sorted(context))
+
+    def _context_key(self, names):
+        """
+        Return a hashable snapshot of the named checker attributes.
+        """
+        values = []
+        for name in names:
+            value = getattr(self, name)
+            if name == 'noqa':
+                # A regex match (or not) for a "# noqa" comment.
+                value = bool(value)
+            values.append(value)
+        return tuple(values)
+
+    def _lookup(self, key, run):
+        """
+        Return the cached results for the key, calling run to produce (and
+        cache) them if they're not known.
+        """
+        results = self.cache.get(key)
+        if results is None:
+            results = run()
+            self.cache[key] = results
+        self.touched[key] = results
+        return results
+
+    def _run_physical(self):
+        """
+        Run the cacheable physical checks on the current physical line.
+        """
+        results = []
+        for name, check, argument_names in self._cached_physical:
+            self.init_checker_state(name, argument_names)
+            result = self.run_check(check, argument_names)
+            if result is not None:
+                offset, text = result
+                results.append((offset, text, check))
+        return tuple(results)
+
+    def check_physical(self, line):
+        """
+        Run all physical checks on a raw input line.
+        """
+        self.physical_line = line
+        key = ('physical', line,
+               self._context_key(self._physical_context))
+        results = self._lookup(key, self._run_physical)
+        for name, check, argument_names in self._fresh_physical:
+            self.init_checker_state(name, argument_names)
+            result = self.run_check(check, argument_names)
+            if result is not None:
+                offset, text = result
+                results += ((offset, text, check), )
+        for offset, text, check in results:
+            self.report_error(self.line_number, offset, text, check)
+            if text[:4] == 'E101':
+                self.indent_char = line[0]
+
+    def _run_logical(self, checks, mapping, start_row):
+        """
+        Run the given logical checks against the current logical line.
+        Results are returned with line numbers relative to start_row.
+        """
+        mapping_offsets = [offset for offset, _ in mapping]
+        results = []
+        for name, check, argument_names in checks:
+            self.init_checker_state(name, argument_names)
+            for offset, text in self.run_check(check, argument_names) or ():
+                if not isinstance(offset, tuple):
+                    token_offset, pos = mapping[bisect.bisect_left(
+                        mapping_offsets, offset)]
+                    offset = (pos[0], pos[1] + offset - token_offset)
+                results.append((offset[0] - start_row, offset[1], text,
+                                check))
+        return tuple(results)
+
+    def check_logical(self):
+        """
+        Build a line from tokens and run all logical checks on it.
+        """
+        self.report.increment_logical_line()
+        mapping = self.build_tokens_line()
+        if not mapping:
+            return
+        (start_row, start_col) = mapping[0][1]
+        start_line = self.lines[start_row - 1]
+        self.indent_level = expand_indent(start_line[:start_col])
+        if self.blank_before < self.blank_lines:
+            self.blank_before = self.blank_lines
+        # The tokens (with rows relative to the start of the logical line)
+        # identify the line wherever it moves to in the code.
+        tokens = tuple((token[0], token[1], token[2][0] - start_row,
+                        token[2][1], token[3][0] - start_row, token[3][1],
+                        token[4]) for token in self.tokens)
+        key = ('logical', tokens, self._context_key(self._logical_context))
+        results = self._lookup(key, lambda: self._run_logical(
+            self._cached_logical, mapping, start_row))
+        results += self._run_logical(self._fresh_logical, mapping, start_row)
+        for row, column, text, check in results:
+            self.report_error(start_row + row, column, text, check)
+        if self.logical_line:
+            self.previous_indent_level = self.indent_level
+            self.previous_logical = self.logical_line
+            if not self.indent_level:
+                self.previous_unindented_logical_line = self.logical_line
+        self.blank_lines = 0
+        self.tokens = []
+
+    def check_all(self, expected=None, line_offset=0):
+        """
+        Run all checks on the lines then, if the cache has grown too big,
+        drop all the results not used by this check.
+        """
+        result = super().check_all(expected, line_offset)
+        if len(self.cache) > STYLE_CACHE_SIZE:
+            self.cache.clear()
+            self.cache.update(self.touched)
+        return result
+
+
 class MuFlakeCodeReporter:
     """
     The class instantiates a reporter that creates structured data about
-    code quality for Mu. Used by the PyFlakes module.
+    code quality for Mu, keyed by (zero based) line number. Used with the
+    PyFlakes module.
     """
 
     def __init__(self):
         """
         Set up the reporter object to be used to report PyFlake's results.
         """
-        self.log = []
+        self.feedback = {}
+
+    def record(self, line_no, column, message, **kwargs):
+        """
+        Add a message about the referenced line and column to the feedback.
+        """
+        entry = dict(line_no=line_no, column=column, message=message,
+                     **kwargs)
+        self.feedback.setdefault(line_no, []).append(entry)
 
     def unexpectedError(self, filename, message):
         """
@@ -491,11 +772,7 @@ class MuFlakeCodeReporter:
         called filename. The message parameter contains a description of the
         problem.
         """
-        self.log.append({
-            'line_no': 0,
-            'filename': filename,
-            'message': str(message)
-        })
+        self.record(0, 0, str(message), filename=filename)
 
     def syntaxError(self, filename, message, line_no, column, source):
         """
@@ -508,31 +785,17 @@ class MuFlakeCodeReporter:
         """
         msg = _('Syntax error. Python cannot understand this line. Check for '
                 'missing characters!')
-        self.log.append({
-            'message': msg,
-            'line_no': int(line_no) - 1,  # Zero based counting in Mu.
-            'column': column - 1,
-            'source': source
-        })
+        # Zero based counting in Mu.
+        self.record(int(line_no or 1) - 1, (column or 1) - 1, msg,
+                    source=source)
 
     def flake(self, message):
         """
-        PyFlakes found something wrong with the code.
+        PyFlakes found something wrong with the code. The message is one of
+        pyflakes' Message instances, which know their line and column.
         """
-        matcher = FLAKE_REGEX.match(str(message))
-        if matcher:
-            line_no, msg = matcher.groups()
-            self.log.append({
-                'line_no': int(line_no) - 1,  # Zero based counting in Mu.
-                'column': 0,
-                'message': msg,
-            })
-        else:
-            self.log.append({
-                'line_no': 0,
-                'column': 0,
-                'message': str(message),
-            })
+        self.record(message.lineno - 1,  # Zero based counting in Mu.
+                    message.col, message.message % message.message_args)
 
 
 class REPL:
@@ -556,6 +819,103 @@ class REPL:
         logger.info('Created new REPL object with port: {}'.format(self.port))
 
 
+class FileLoader(QObject):
+    """
+    Reads and decodes files in a separate thread so opening restored tabs
+    doesn't block the GUI.
+    """
+
+    # Emitted with the path of a file to read.
+    load = pyqtSignal(str)
+    # Emitted with the path, text and newline convention of a file read.
+    on_load = pyqtSignal(str, str, str)
+    # Emitted with the path and exception raised when a file can't be read.
+    on_load_fail = pyqtSignal(str, object)
+
+    def read(self, path):
+        """
+        Read and decode the file at the referenced path.
+        """
+        try:
+            text, newline = read_and_decode(path)
+        except (OSError, UnicodeDecodeError) as ex:
+            self.on_load_fail.emit(path, ex)
+        else:
+            self.on_load.emit(path, text, newline)
+
+
+class FileSaver(QThread):
+    """
+    Writes autosaved files in a separate thread so slow drives (such as
+    USB sticks and boards) don't block the GUI.
+
+    Only the latest text queued for each path is written: if a file is
+    autosaved again before its previous text was written, the previous text
+    is skipped.
+    """
+
+    # Emitted with the path and digest of the text of a file written.
+    on_save = pyqtSignal(str, str)
+    # Emitted with the path and exception raised when a file can't be written.
+    on_save_fail = pyqtSignal(str, object)
+
+    def __init__(self):
+        super().__init__()
+        self.pending = {}  # Path: (text, newline, digest) to be written.
+        self.writing = None  # The path being written.
+        self.stopping = False
+        self.condition = threading.Condition()
+
+    def queue(self, path, text, newline, digest):
+        """
+        Queue the text to be written to the referenced path.
+        """
+        with self.condition:
+            self.pending[path] = (text, newline, digest)
+            self.condition.notify_all()
+
+    def discard(self, path):
+        """
+        Forget any text still to be written to the referenced path and wait
+        for any write of it in progress to finish (because the file is about
+        to be saved by other means).
+        """
+        with self.condition:
+            self.pending.pop(path, None)
+            while self.writing == path:
+                self.condition.wait()
+
+    def stop(self):
+        """
+        Write whatever is still pending, then stop the thread.
+        """
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        self.wait()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not (self.pending or self.stopping):
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                path = next(iter(self.pending))
+                text, newline, digest = self.pending.pop(path)
+                self.writing = path
+            try:
+                save_and_encode(text, path, newline, atomic=True)
+            except (OSError, UnicodeEncodeError) as ex:
+                self.on_save_fail.emit(path, ex)
+            else:
+                self.on_save.emit(path, digest)
+            finally:
+                with self.condition:
+                    self.writing = None
+                    self.condition.notify_all()
+
+
 class Editor:
     """
     Application logic for the editor itself.
@@ -573,11 +933,20 @@ class Editor:
         self.minify = False
         self.microbit_runtime = ''
         self.connected_devices = set()
+        self.usb_ports = None  # Serial ports seen by the last check_usb.
         self.find = ''
         self.replace = ''
         self.global_replace = False
+        self.use_regex = False
         self.selecting_mode = False  # Flag to stop auto-detection of modes.
         self.update_bin_status = False
+        self.file_loader = None  # Created on first use, see load_tab.
+        self.file_loader_thread = None
+        self._loading = set()  # Paths being read by the file_loader.
+        self.file_saver = None  # Created on first use, see autosave.
+        # Digests of the text last saved to (or loaded from) each path.
+        self.saved_digests = {}
+        self._autosaving = {}  # Path: digest being written by file_saver.
         if not os.path.exists(DATA_DIR):
             logger.debug('Creating directory: {}'.format(DATA_DIR))
             os.makedirs(DATA_DIR)
@@ -591,6 +960,8 @@ class Editor:
             # Open the file
             self.direct_load(file)
 
+        view.load_tab.connect(self.load_tab)
+
     def setup(self, modes):
         """
         Define the available modes and ensure there's a default working
@@ -661,14 +1032,26 @@ class Editor:
                     # So ask for the desired mode.
                     self.select_mode(None)
                 if 'paths' in old_session:
+                    start = time.perf_counter()
                     old_paths = self._abspath(old_session['paths'])
                     launch_paths = self._abspath(paths) if paths else set()
+                    placeholder = None
                     for old_path in old_paths:
                         # if the os passed in a file, defer loading it now
                         if old_path in launch_paths or "__temp__" in old_path:
                             continue
-                        self.direct_load(old_path)
-                    logger.info('Loaded files.')
+                        if (old_path.lower().endswith(TEXT_EXTENSIONS) and
+                                os.path.isfile(old_path)):
+                            # Only read the file when its tab is focussed.
+                            placeholder = self._view.add_placeholder_tab(
+                                old_path)
+                        else:
+                            placeholder = None
+                            self.direct_load(old_path)
+                    if placeholder is not None and not launch_paths:
+                        self._view.focus_tab(placeholder)
+                    logger.info('Restored files in {:.3f}s.'.format(
+                        time.perf_counter() - start))
                 if 'envars' in old_session:
                     self.envars = old_session['envars']
                     logger.info('User defined environment variables: '
@@ -730,12 +1113,6 @@ class Editor:
         manner.
         """
         logger.info('Loading script from: {}'.format(path))
-        error = _("The file contains characters Mu expects to be encoded as "
-                  "{0} or as the computer's default encoding {1}, but which "
-                  "are encoded in some other way.\n\nIf this file was saved "
-                  "in another application, re-save the file via the "
-                  "'Save as' option and set the encoding to {0}")
-        error = error.format(ENCODING, locale.getpreferredencoding())
         # Does the file even exist?
         if not os.path.isfile(path):
             logger.info('The file {} does not exist.'.format(path))
@@ -752,15 +1129,13 @@ class Editor:
                 return
         name, text, newline, file_mode = None, None, None, None
         try:
-            if path.lower().endswith('.py') or path.lower().endswith('.txt') or path.lower().endswith('.json') or path.lower().endswith('.ini'):
+            if path.lower().endswith(TEXT_EXTENSIONS):
                 # Open the file, read the textual content and set the name as
                 # the path to the file.
                 try:
                     text, newline = read_and_decode(path)
-                except UnicodeDecodeError:
-                    message = _("Mu cannot read the characters in {}")
-                    filename = os.path.basename(path)
-                    self._view.show_message(message.format(filename), error)
+                except UnicodeDecodeError as ex:
+                    self.show_load_error(path, ex)
                     return
                 name = path
             else:
@@ -787,12 +1162,8 @@ class Editor:
                              'MicroPython code.')
                     self._view.show_message(message, info)
                     return
-        except OSError:
-            message = _("Could not load {}").format(path)
-            logger.exception('Could not load {}'.format(path))
-            info = _("Does this file exist?\nIf it does, do you have "
-                     "permission to read it?\n\nPlease check and try again.")
-            self._view.show_message(message, info)
+        except OSError as ex:
+            self.show_load_error(path, ex)
         else:
             if file_mode and self.mode != file_mode:
                 device_name = self.modes[file_mode].name
@@ -803,9 +1174,94 @@ class Editor:
                 if self._view.show_confirmation(
                         message, info, icon='Question') == QMessageBox.Ok:
                     self.change_mode(file_mode)
-            logger.debug(text)
-            self._view.add_tab(
+            tab = self._view.add_tab(
                 name, text, self.modes[self.mode].api(), newline)
+            if name:
+                self.saved_digests[name] = text_digest(text)
+            if tab.large:
+                self.show_large_file_notice(path)
+            else:
+                logger.debug(text)
+
+    def show_large_file_notice(self, path):
+        """
+        Tell the user the referenced file is so big it was opened in large
+        file mode.
+        """
+        message = _('{} is a large file, so it is read-only and not '
+                    'highlighted. Press Ctrl+Shift+E to edit it.').format(
+                        os.path.basename(path))
+        self.show_status_message(message, 10)
+
+    def show_load_error(self, path, exception):
+        """
+        Tell the user why the file at the referenced path could not be read.
+        """
+        if isinstance(exception, UnicodeDecodeError):
+            message = _("Mu cannot read the characters in {}")
+            message = message.format(os.path.basename(path))
+            info = _("The file contains characters Mu expects to be encoded "
+                     "as {0} or as the computer's default encoding {1}, but "
+                     "which are encoded in some other way.\n\nIf this file "
+                     "was saved in another application, re-save the file "
+                     "via the 'Save as' option and set the encoding to {0}")
+            info = info.format(ENCODING, locale.getpreferredencoding())
+        else:
+            message = _("Could not load {}").format(path)
+            logger.error('Could not load {}'.format(path), exc_info=exception)
+            info = _("Does this file exist?\nIf it does, do you have "
+                     "permission to read it?\n\nPlease check and try again.")
+        self._view.show_message(message, info)
+
+    def load_tab(self, path, wait=False):
+        """
+        Load the content of the placeholder tab for the referenced path (see
+        restore_session). The file is read by the FileLoader thread unless
+        wait is set, in which case it is read straight away because the
+        caller needs the editor now.
+        """
+        if wait:
+            try:
+                text, newline = read_and_decode(path)
+            except (OSError, UnicodeDecodeError) as ex:
+                self.on_file_load_fail(path, ex)
+            else:
+                self.on_file_loaded(path, text, newline)
+        elif path not in self._loading:
+            self._loading.add(path)
+            if self.file_loader is None:
+                self.file_loader_thread = QThread()
+                self.file_loader = FileLoader()
+                self.file_loader.moveToThread(self.file_loader_thread)
+                self.file_loader.on_load.connect(self.on_file_loaded)
+                self.file_loader.on_load_fail.connect(self.on_file_load_fail)
+                self.file_loader.load.connect(self.file_loader.read)
+                self.file_loader_thread.start()
+            self.file_loader.load.emit(path)
+
+    def on_file_loaded(self, path, text, newline):
+        """
+        The file behind a placeholder tab has been read, so replace the
+        placeholder with an editor.
+        """
+        self._loading.discard(path)
+        tab = self._view.replace_placeholder(path, text,
+                                             self.modes[self.mode].api(),
+                                             newline)
+        if tab is not None:
+            self.saved_digests[path] = text_digest(text)
+            logger.info('Loaded script from: {}'.format(path))
+            if tab.large:
+                self.show_large_file_notice(path)
+
+    def on_file_load_fail(self, path, exception):
+        """
+        The file behind a placeholder tab could not be read, so tell the user
+        and close the tab.
+        """
+        self._loading.discard(path)
+        self._view.remove_placeholder(path)
+        self.show_load_error(path, exception)
 
     def load(self):
         """
@@ -853,14 +1309,17 @@ class Editor:
     def _abspath(self, paths):
         """
         Safely convert an arrary of paths to their absolute forms and remove
-        duplicate items.
+        duplicate items (keeping the order, so tabs are restored as they were).
         """
-        result = set()
+        result = []
         for p in paths:
             try:
-                result.add(os.path.abspath(p))
+                abs_path = os.path.abspath(p)
             except Exception as ex:
                 logger.error('Could not get path for {}: {}'.format(p, ex))
+            else:
+                if abs_path not in result:
+                    result.append(abs_path)
         return result
 
     def save_tab_to_file(self, tab):
@@ -870,9 +1329,14 @@ class Editor:
         reported and the tab status will continue to show as Modified.
         """
         logger.info('Saving script to: {}'.format(tab.path))
-        logger.debug(tab.text())
+        text = tab.text()
+        logger.debug(text)
+        if self.file_saver is not None:
+            # Don't let an older autosave overwrite this.
+            self.file_saver.discard(tab.path)
+            self._autosaving.pop(tab.path, None)
         try:
-            save_and_encode(tab.text(), tab.path, tab.newline)
+            save_and_encode(text, tab.path, tab.newline)
         except OSError as e:
             logger.error(e)
             error_message = _('Could not save file (disk problem)')
@@ -890,6 +1354,7 @@ class Editor:
         if error_message:
             self._view.show_message(error_message, information)
         else:
+            self.saved_digests[tab.path] = text_digest(text)
             tab.setModified(False)
             self.show_status_message(_("Saved file: {}").format(tab.path))
 
@@ -915,6 +1380,11 @@ class Editor:
         if tab is None:
             # There is no active text editor so abort.
             return
+        if tab.loading:
+            # Don't save half a large file.
+            self.show_status_message(_('Please wait, the file is still '
+                                       'loading.'))
+            return
         if not tab.path:
             # Unsaved file.
             workspace = self.modes[self.mode].workspace_dir()
@@ -947,6 +1417,11 @@ class Editor:
         if tab is None:
             # There is no active text editor so abort.
             return
+        if tab.loading:
+            # Don't save half a large file.
+            self.show_status_message(_('Please wait, the file is still '
+                                       'loading.'))
+            return
         workspace = self.modes[self.mode].workspace_dir()
         path = self._view.get_save_path(workspace)
         if path == '':
@@ -979,7 +1454,8 @@ class Editor:
                 tab_path = os.path.normcase(os.path.abspath(tab.path))
                 if tab_path == normalised_path:
                     self._view.focus_tab(tab)
-                    return tab
+                    # Ensures a restored tab is loaded.
+                    return self._view.current_tab
         self.direct_load(path)
         return self._view.current_tab
 
@@ -1006,6 +1482,9 @@ class Editor:
         if tab is None:
             # There is no active text editor so abort.
             return
+        if tab.large:
+            self.show_status_message(_('Mu does not check large files.'))
+            return
         tab.has_annotations = not tab.has_annotations
         if tab.has_annotations:
             logger.info('Checking code.')
@@ -1086,6 +1565,11 @@ class Editor:
             logger.debug('Session: {}'.format(session))
             logger.debug('Saving session to: {}'.format(session_path))
             json.dump(session, out, indent=2)
+        if self.file_saver is not None:
+            self.file_saver.stop()
+        if self.file_loader_thread is not None:
+            self.file_loader_thread.quit()
+            self.file_loader_thread.wait()
         logger.info('Quitting.\n\n')
         sys.exit(0)
 
@@ -1189,15 +1673,56 @@ class Editor:
 
     def autosave(self):
         """
-        Cycles through each tab and, if changed, saves it to the filesystem.
+        Cycles through each tab and, if changed, queues its text to be saved
+        to the filesystem by the file_saver thread. Tabs whose text is the
+        same as when it was last saved (e.g. because a change was undone) or
+        is already being saved are skipped.
         """
         if self._view.modified:
             # Something has changed, so save it!
             for tab in self._view.widgets:
-                if tab.path and tab.isModified():
-                    self.save_tab_to_file(tab)
-                    logger.info('Autosave detected and saved '
-                                'changes in {}.'.format(tab.path))
+                if not (tab.path and tab.isModified()):
+                    continue
+                text = tab.text()
+                digest = text_digest(text)
+                if self.saved_digests.get(tab.path) == digest:
+                    tab.setModified(False)
+                elif self._autosaving.get(tab.path) != digest:
+                    if self.file_saver is None:
+                        self.file_saver = FileSaver()
+                        self.file_saver.on_save.connect(self.on_autosaved)
+                        self.file_saver.on_save_fail.connect(
+                            self.on_autosave_fail)
+                        self.file_saver.start()
+                    self._autosaving[tab.path] = digest
+                    self.file_saver.queue(tab.path, text, tab.newline, digest)
+
+    def on_autosaved(self, path, digest):
+        """
+        The file_saver has written the text with the referenced digest to
+        the path, so the tab for it is no longer modified (unless it has
+        changed since). Results for writes that are no longer wanted (the
+        file has been saved by hand since they were queued) are ignored, so
+        they don't replace the digest of what's really on disk.
+        """
+        if self._autosaving.get(path) != digest:
+            return
+        del self._autosaving[path]
+        self.saved_digests[path] = digest
+        for tab in self._view.widgets:
+            if (tab.path == path and tab.isModified() and
+                    text_digest(tab.text()) == digest):
+                tab.setModified(False)
+        logger.info('Autosave detected and saved changes in {}.'.format(path))
+
+    def on_autosave_fail(self, path, exception):
+        """
+        The file_saver couldn't write the path, so say so (the tab still
+        shows as modified, so it'll be tried again).
+        """
+        self._autosaving.pop(path, None)
+        logger.error('Could not autosave {}: {}'.format(path, exception))
+        self.show_status_message(_('Could not save file: {}').format(path))
 
     def check_usb(self):
         """
@@ -1206,13 +1731,25 @@ class Editor:
         If a single device is found and Mu is in a different mode ask the user
         if they'd like to change mode.
         """
+        # Enumerate the serial ports once for all the modes and don't bother
+        # them at all if nothing was plugged in or out since the last check.
+        available_ports = QSerialPortInfo.availablePorts()
+        usb_ports = [(p.portName(), p.vendorIdentifier(),
+                      p.productIdentifier(), p.serialNumber())
+                     for p in available_ports]
+        if usb_ports == self.usb_ports:
+            return
+        self.usb_ports = usb_ports
+        # A device may have come or gone with its drive, so look again.
+        volumes.invalidate()
         devices = []
         device_types = set()
         # Detect connected devices.
         for name, mode in self.modes.items():
             if hasattr(mode, 'find_device'):
                 # The mode can detect an attached device.
-                port, serial = mode.find_device(with_logging=False)
+                port, serial = mode.find_device(
+                    with_logging=False, available_ports=available_ports)
                 if port:
                     devices.append((name, port))
                     device_types.add(name)
@@ -1336,13 +1873,16 @@ class Editor:
         a status message.
         """
         result = self._view.show_find_replace(self.find, self.replace,
-                                              self.global_replace)
+                                              self.global_replace,
+                                              self.use_regex)
         if result:
-            self.find, self.replace, self.global_replace = result
+            (self.find, self.replace, self.global_replace,
+             self.use_regex) = result
             if self.find:
                 if self.replace:
                     replaced = self._view.replace_text(self.find, self.replace,
-                                                       self.global_replace)
+                                                       self.global_replace,
+                                                       self.use_regex)
                     if replaced == 1:
                         msg = _('Replaced "{}" with "{}".')
                         self.show_status_message(msg.format(self.find,
@@ -1356,7 +1896,8 @@ class Editor:
                         msg = _('Could not find "{}".')
                         self.show_status_message(msg.format(self.find))
                 else:
-                    matched = self._view.highlight_text(self.find)
+                    matched = self._view.highlight_text(self.find,
+                                                        self.use_regex)
                     if matched:
                         msg = _('Highlighting matches for "{}".')
                     else:
@@ -1373,3 +1914,19 @@ class Editor:
         Ensure all highlighted lines are toggled between comments/uncommented.
         """
         self._view.toggle_comments()
+
+    def unlock_tab(self):
+        """
+        Make the large file in the current tab, which is opened read-only,
+        editable (it's still not highlighted or checked).
+        """
+        tab = self._view.current_tab
+        if tab is None or not tab.locked:
+            return
+        if tab.loading:
+            self.show_status_message(_('Please wait, the file is still '
+                                       'loading.'))
+            return
+        self._view.unlock_tab(tab)
+        self.show_status_message(_('{} can now be edited.').format(
+            os.path.basename(tab.path) if tab.path else tab.label))
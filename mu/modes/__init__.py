@@ -1,9 +1,100 @@
-from .python3 import PythonMode
-from .adafruit import AdafruitMode
-from .microbit import MicrobitMode
-from .esp import EspMode
-from .debugger import DebugMode
-from .pygamezero import PyGameZeroMode
+"""
+Mu's modes.
+
+Importing a mode pulls in everything it needs to talk to its device or
+runtime (qtconsole, uflash and friends), so the mode classes are only
+imported when first asked for and the editor refers to modes via
+ModeDescriptor instances until they are actually used.
+"""
+import importlib
+import logging
+import time
+from mu.trace import tracer
+
+
+logger = logging.getLogger(__name__)
+
+
+# The module defining each of the mode classes exported by this package.
+MODE_MODULES = {
+    'PythonMode': 'mu.modes.python3',
+    'AdafruitMode': 'mu.modes.adafruit',
+    'MicrobitMode': 'mu.modes.microbit',
+    'EspMode': 'mu.modes.esp',
+    'DebugMode': 'mu.modes.debugger',
+    'PyGameZeroMode': 'mu.modes.pygamezero',
+}
+
+
+def __getattr__(name):
+    """
+    Import mode classes on first access (e.g. "from mu.modes import
+    PythonMode").
+    """
+    if name in MODE_MODULES:
+        return getattr(importlib.import_module(MODE_MODULES[name]), name)
+    raise AttributeError('module {} has no attribute {}'.format(
+        __name__, name))
+
+
+class ModeDescriptor:
+    """
+    Describes a mode well enough to list it in the mode selector without
+    importing it.
+
+    Any other attribute is looked up on the mode itself, which is imported
+    and instantiated the first time such an attribute is needed.
+    """
+
+    def __init__(self, editor, view, import_path, name, description, icon,
+                 is_debugger=False, finds_devices=False):
+        """
+        The import_path is the dotted path of the mode class. Set
+        finds_devices if the mode can detect an attached device with
+        find_device.
+        """
+        self.editor = editor
+        self.view = view
+        self.import_path = import_path
+        self.name = name
+        self.description = description
+        self.icon = icon
+        self.is_debugger = is_debugger
+        self.finds_devices = finds_devices
+        self._mode = None
+
+    @property
+    def loaded(self):
+        """
+        Whether the mode has been imported and instantiated.
+        """
+        return self._mode is not None
+
+    @property
+    def mode(self):
+        """
+        The instance of the mode, created on first use.
+        """
+        if self._mode is None:
+            start = time.perf_counter()
+            module_name, class_name = self.import_path.rsplit('.', 1)
+            with tracer.phase('mode:{}'.format(class_name)):
+                mode_class = getattr(importlib.import_module(module_name),
+                                     class_name)
+                self._mode = mode_class(self.editor, self.view)
+            logger.info('Loaded mode {} in {:.3f}s.'.format(
+                class_name, time.perf_counter() - start))
+        return self._mode
+
+    def __getattr__(self, attr):
+        # Only called for attributes the descriptor doesn't have itself.
+        if attr.startswith('__') or attr == '_mode':
+            raise AttributeError(attr)
+        if attr == 'find_device' and not self.finds_devices:
+            # Don't load a mode just to find out it has no devices.
+            raise AttributeError(attr)
+        return getattr(self.mode, attr)
+
 
 __all__ = ['PythonMode', 'AdafruitMode', 'MicrobitMode', 'EspMode', 'DebugMode',
-           'PyGameZeroMode', ]
+           'PyGameZeroMode', 'ModeDescriptor', ]
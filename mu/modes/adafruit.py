@@ -18,7 +18,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 import os
 import ctypes
-from subprocess import check_output
+from mu.volumes import find_volume
 from mu.modes.base import MicroPythonMode
 from mu.modes.api import ADAFRUIT_APIS, SHARED_APIS
 from mu.interface.panes import CHARTS
@@ -93,15 +93,7 @@ class AdafruitMode(MicroPythonMode):
         # plugged in CIRCUITPY board.
         if os.name == 'posix':
             # We're on Linux or OSX
-            for mount_command in ['mount', '/sbin/mount']:
-                try:
-                    mount_output = check_output(mount_command).splitlines()
-                    mounted_volumes = [x.split()[2] for x in mount_output]
-                    for volume in mounted_volumes:
-                        if volume.endswith(b'CIRCUITPY'):
-                            device_dir = volume.decode('utf-8')
-                except FileNotFoundError:
-                    next
+            device_dir = find_volume('CIRCUITPY')
         elif os.name == 'nt':
             # We're on Windows.
 
@@ -202,13 +202,17 @@ class MicroPythonMode(BaseMode):
     valid_boards = BOARD_IDS
     force_interrupt = True
 
-    def find_device(self, with_logging=True):
+    def find_device(self, with_logging=True, available_ports=None):
         """
         Returns the port and serial number for the first MicroPython-ish device
         found connected to the host computer. If no device is found, returns
         the tuple (None, None).
+
+        Callers checking several modes can pass in the available_ports they
+        have already enumerated.
         """
-        available_ports = QSerialPortInfo.availablePorts()
+        if available_ports is None:
+            available_ports = QSerialPortInfo.availablePorts()
         for port in available_ports:
             pid = port.productIdentifier()
             vid = port.vendorIdentifier()
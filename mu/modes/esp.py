@@ -25,14 +25,18 @@ import semver
 import time
 import re
 import platform
+import threading
 import subprocess
+import tempfile
 import configparser
 from tokenize import TokenError
-from mu.logic import HOME_DIRECTORY
+from mu import emulator, shrink
+from mu.logic import HOME_DIRECTORY, write_and_flush
 from mu.contrib import uflash, espfs
 from mu.modes.api import ESP_APIS, SHARED_APIS
 from mu.modes.base import MicroPythonMode
 from mu.interface.panes import CHARTS
+from mu.resources import load_icon
 from PyQt5.QtCore import QObject, QThread, pyqtSignal, QTimer
 from PyQt5.QtWidgets import QMessageBox
 
@@ -83,40 +87,149 @@ class DeviceFlasher(QThread):
 
 
 class DeviceRunner(QThread):
-
+    """
+    Runs a script, or a file on the board, on the mPython board and streams
+    what it prints as it arrives, until it ends or is stopped.
+    """
+    # Emitted with each chunk of output from the running program.
+    on_output = pyqtSignal(bytes)
+    # Emitted with a description of the error if the program fails.
     on_error = pyqtSignal(str)
 
     def __init__(self):
         QThread.__init__(self)
         self.running = False
-        
+        self.stopping = False
+        self.condition = threading.Condition()
+        self.serial = None
+        self.active_serial = None
+
     def set(self, filename, content, serial):
+        """
+        Set the file on the board (or, if filename is None, the content) to
+        run when the thread is started, over the referenced serial connection
+        (or, if None, one of its own).
+        """
         self.filename = filename
         self.content = content
         self.serial = serial
+        with self.condition:
+            self.running = True
+            self.stopping = False
 
     def run(self):
+        serial = self.serial
         try:
-            self.running = True
+            if serial is None:
+                serial = espfs.get_serial()
+            with self.condition:
+                self.active_serial = serial
             if self.filename is None:
-                result, err = espfs.run_content(self, content=self.content, serial=self.serial)
-                # print(result, err)
+                command = self.content
             else:
-                result, err = espfs.run_py(self, filename=self.filename, serial=self.serial)
-                # print(result, err)
-            if result == 1:
-                self.on_error.emit(str(err, "utf8"))
-                self.running = False
-            elif result == 2:
-                size = re.findall("\d+", str(err, "utf8"))[0]
-                self.on_error.emit(_("MemoryError: memory allocation failed,"
-                                     " allocating {} bytes").format(size))
-                self.running = False
+                command = espfs.file_command(self.filename)
+            espfs.start_command(command, serial)
+            reader = espfs.RawReplReader()
+            while not (reader.finished or self.stopping):
+                output = reader.feed(serial.read(serial.inWaiting() or 1))
+                if output:
+                    self.on_output.emit(output)
+            if reader.error:
+                self.on_error.emit(run_error(reader.error))
+            # CTRL-C to interrupt the program if need be, CTRL-B to leave the
+            # raw REPL.
+            serial.write(b'\x03\x02' if self.stopping else b'\x02')
         except Exception as ex:
             logger.error(ex)
+        finally:
+            if self.serial is None and serial is not None:
+                serial.close()
+            with self.condition:
+                self.active_serial = None
+                self.running = False
+                self.condition.notify_all()
 
-    def stop(self):
-        self.running = False
+    def request_stop(self):
+        """
+        Ask the running program to stop, without waiting for it to, so it's
+        safe to call from the GUI thread. Returns True if it was running.
+        """
+        with self.condition:
+            if not self.running:
+                return False
+            self.stopping = True
+            if self.active_serial is not None and \
+                    hasattr(self.active_serial, 'cancel_read'):
+                # Wake the runner if it is waiting for output.
+                self.active_serial.cancel_read()
+            return True
+
+    def stop(self, timeout=2):
+        """
+        Stop the running program and wait (for up to timeout seconds) until
+        the serial connection to the board is free for something else. This
+        blocks, so the GUI thread should use request_stop instead.
+        """
+        if self.request_stop():
+            with self.condition:
+                self.condition.wait_for(lambda: not self.running, timeout)
+
+
+def shrink_upload(filename, content):
+    """
+    Return the content (str or bytes) to send to the board as filename:
+    Python source is shrunk (see mu.shrink), keeping its line numbers. Also
+    return a message about how many bytes this saved, or None.
+    """
+    if not filename.endswith('.py'):
+        return content, None
+    text = content
+    if isinstance(content, bytes):
+        try:
+            text = content.decode('utf-8')
+        except UnicodeDecodeError:
+            return content, None
+    shrunk = shrink.shrink(text)
+    before = len(text.encode('utf-8'))
+    after = len(shrunk.encode('utf-8'))
+    logger.info('Shrank {} from {} to {} bytes.'.format(filename, before,
+                                                        after))
+    message = _('Sending {} bytes ({} before shrinking).').format(after,
+                                                                  before)
+    return shrunk, message
+
+
+def config_path(home, name):
+    """
+    Return the path of the copy of a file Mu gives the board (mpython.py or
+    target.bin) in the __config__ directory of the workspace at home, or of
+    the one that comes with Mu if there isn't one there. Return None if
+    there's neither.
+    """
+    path = os.path.join(home, '__config__', name)
+    if os.path.isfile(path):
+        return path
+    app_path = sys.executable if getattr(sys, 'frozen', False) else sys.argv[0]
+    app_dir = os.path.dirname(os.path.abspath(app_path))
+    if platform.system() == "Darwin":
+        path = os.path.join(app_dir, "../Resources", name)
+    else:
+        path = os.path.join(app_dir, name)
+    return path if os.path.isfile(path) else None
+
+
+def run_error(err):
+    """
+    Return a description of the error from the traceback (in bytes) of a
+    program that failed on the board.
+    """
+    err = str(err, 'utf8', 'replace')
+    if 'MemoryError:' in err:
+        size = re.findall(r'\d+', err.split('MemoryError:', 1)[1])
+        if size:
+            return _("MemoryError: memory allocation failed, allocating {} "
+                     "bytes").format(size[0])
+    return err
 
 
 class DeviceRestorer(QThread):
@@ -213,6 +326,64 @@ class DeviceRestoreTimer(QThread):
         self.running = False
 
 
+def get_firmware_version(response):
+    """
+    Extract the MicroPython version and build date from the banner the board
+    prints on a soft reset. Returns (None, None) if there is no banner.
+    """
+    if b'icroPython ' in response:
+        i = response.find(b'icroPython ') + 11
+        response = response[i:]
+        j = response.find(b';')
+        response = response[0:j]
+        k = response.find(b' on ') + 4
+        date = response[k:]
+        return str(response, encoding="utf8"), str(date, encoding="utf8")
+    else:
+        return None, None
+
+
+class FirmwareReader(QThread):
+    """
+    Used to read the version of the firmware on the mPython board without
+    blocking the UI while waiting for the board to answer.
+    """
+    # Emitted with the firmware version and date once they have been read.
+    on_version = pyqtSignal(str, str)
+
+    def run(self):
+        """
+        Interrupt the board and read the version from its banner.
+        """
+        try:
+            serial = espfs.get_serial()
+        except Exception as ex:
+            logger.error(ex)
+            return
+        try:
+            serial.write(b'\x02')
+            for i in range(3):
+                serial.write(b'\r\x03')
+                time.sleep(0.01)
+            response = serial.read_until(
+                b'Type "help()" for more information.')
+            firmware_ver, firmware_date = get_firmware_version(response)
+            if firmware_ver is None:
+                serial.write(b'\r\x03')
+                response = serial.read_until(
+                    b'Type "help()" for more information.')
+                firmware_ver, firmware_date = get_firmware_version(response)
+        except Exception as ex:
+            logger.error(ex)
+            return
+        finally:
+            serial.close()
+        if firmware_ver is None:
+            firmware_ver = ""
+            firmware_date = "None"
+        self.on_version.emit(firmware_ver, firmware_date)
+
+
 class FileManager(QObject):
     """
     Used to manage micro:bit filesystem operations in a manner such that the
@@ -260,12 +431,15 @@ class FileManager(QObject):
     on_run_content = pyqtSignal(str)
     on_info_start = pyqtSignal(str, int)
     
-    def __init__(self):
+    def __init__(self, editor=None):
         super(QObject, self).__init__()
+        # Has the user's settings (see minify).
+        self.editor = editor
         self.device_runner = DeviceRunner()
         self.device_restorer = DeviceRestorer()
         self.restorer_timer = DeviceRestoreTimer()
-        self.stop_py.connect(self.device_runner.stop)
+        # Emitted from the GUI thread, which mustn't wait for the runner.
+        self.stop_py.connect(self.device_runner.request_stop)
         self.device_runner.on_error.connect(self.on_error)
         self.device_restorer.on_info.connect(self.on_info)
         self.device_restorer.on_info10.connect(self.on_info10)
@@ -296,6 +470,27 @@ class FileManager(QObject):
     def on_restore_finish(self):
         self.restorer_timer.stop()
 
+    @property
+    def minify(self):
+        """
+        Whether to shrink Python source before sending it to the board. It's
+        read at the time of each transfer, so changes to the setting apply
+        straight away.
+        """
+        return bool(self.editor and self.editor.minify)
+
+    def shrink(self, filename, content):
+        """
+        Return the content to send to the board as filename, shrunk if
+        minify is set, and show how many bytes were saved.
+        """
+        if not self.minify:
+            return content
+        content, message = shrink_upload(filename, content)
+        if message:
+            self.on_info_start.emit(message, 2)
+        return content
+
     def ls(self):
         """
         List the files on the micro:bit. Emit the resulting tuple of filenames
@@ -317,8 +512,7 @@ class FileManager(QObject):
         failure signal.
         """
         try:
-            self.stop_py.emit()
-            time.sleep(0.5)
+            self.device_runner.stop()
             out = espfs.get(esp_filename)
             with open(local_filename, 'wb') as f:
                 f.write(out)
@@ -335,9 +529,13 @@ class FileManager(QObject):
         a failure signal.
         """
         try:
-            self.stop_py.emit()
-            time.sleep(0.5)
-            espfs.put(local_filename, target=None)
+            self.device_runner.stop()
+            if self.minify and local_filename.endswith('.py'):
+                with open(local_filename, 'rb') as local:
+                    content = self.shrink(local_filename, local.read())
+                espfs.put_py(local_filename, content, target=None)
+            else:
+                espfs.put(local_filename, target=None)
             self.on_put_file.emit(os.path.basename(local_filename))
         except Exception as ex:
             logger.error(ex)
@@ -346,8 +544,7 @@ class FileManager(QObject):
     def load_py(self, esp_filename, workspace_dir):
         try:
             self.on_load_start.emit(esp_filename)
-            self.stop_py.emit()
-            time.sleep(1)
+            self.device_runner.stop()
             out = espfs.get(esp_filename)
             if out == b'':
                 self.on_load_fail.emit(_("Failed to read file '{}', please try again.").format(esp_filename))
@@ -365,8 +562,8 @@ class FileManager(QObject):
     
     def run_py(self, esp_filename):
         try:
-            self.stop_py.emit()
-            time.sleep(1)
+            self.device_runner.stop()
+            self.device_runner.wait()
             self.device_runner.set(esp_filename, None, None)
             self.device_runner.start()
             self.on_run_file.emit(esp_filename)
@@ -376,8 +573,9 @@ class FileManager(QObject):
 
     def run_content(self, content):
         try:
-            self.stop_py.emit()
-            time.sleep(1)
+            self.device_runner.stop()
+            self.device_runner.wait()
+            content = self.shrink('__main__.py', content)
             self.device_runner.set(None, content, None)
             self.device_runner.start()
             # self.on_run_file.emit(esp_filename)
@@ -385,8 +583,8 @@ class FileManager(QObject):
             logger.error(ex)
             self.on_run_fail.emit("{}".format(ex))
     
-    def stop_run_py(self):   
-        self.stop_py.emit()
+    def stop_run_py(self):
+        self.device_runner.stop()
 
     def delete(self, esp_filename):
         """
@@ -394,8 +592,7 @@ class FileManager(QObject):
         of the file when complete, or emit a failure signal.
         """
         try:
-            self.stop_py.emit()
-            time.sleep(0.5)
+            self.device_runner.stop()
             espfs.rm(esp_filename)
             self.on_delete_file.emit(esp_filename)
         except Exception as ex:
@@ -404,8 +601,7 @@ class FileManager(QObject):
 
     def set_default(self, esp_filename):
         try:
-            self.stop_py.emit()
-            time.sleep(0.5)
+            self.device_runner.stop()
             espfs.set_default(esp_filename, None)
             self.on_set_default.emit(esp_filename)
             #self.ls()
@@ -416,28 +612,53 @@ class FileManager(QObject):
 
     def write_lib(self, _home):
         try:
-            self.stop_py.emit()
-            time.sleep(0.5)
+            self.device_runner.stop()
             self.on_write_lib_start.emit()
-            libpath = os.path.join(_home, '__config__', 'mpython.py')
-            if not os.path.isfile(libpath):
-                app_path = sys.executable if getattr(sys, 'frozen', False) else sys.argv[0]
-                app_dir = os.path.dirname(os.path.abspath(app_path))
-                if platform.system() == "Darwin":
-                    libpath = os.path.join(app_dir, "../Resources/mpython.py")
-                else:
-                    libpath = os.path.join(app_dir, "mpython.py")
-            # print(libpath)
-            espfs.write_lib(libpath)
+            libpath = config_path(_home, 'mpython.py')
+            if libpath is None:
+                raise IOError(_('Could not find mpython.py.'))
+            if self.minify:
+                with open(libpath, 'rb') as local:
+                    content = self.shrink('mpython.py', local.read())
+                if not self.write_lib_mpy(content):
+                    espfs.write_lib(libpath, content=content)
+            else:
+                espfs.write_lib(libpath)
             self.on_write_lib.emit()
         except Exception as ex:
             logger.error(ex)
             self.on_write_lib_fail.emit("{}".format(ex))
 
+    def write_lib_mpy(self, source):
+        """
+        Compile the source of the mpython library with mpy-cross, if it's
+        installed, and copy the result onto the board as mpython.mpy. Return
+        False if it isn't installed or the board can't import the result (the
+        .mpy format changes between versions of MicroPython).
+        """
+        mpy_cross = shrink.find_mpy_cross()
+        if not mpy_cross or isinstance(source, bytes):
+            return False
+        try:
+            content = shrink.compile_mpy(source, 'mpython.py', mpy_cross)
+        except IOError as ex:
+            logger.warning('Unable to compile mpython.py: {}'.format(ex))
+            return False
+        espfs.write_lib(None, content=content, target='mpython.mpy')
+        out, err = espfs.execute([
+            "import sys;sys.modules.pop('mpython', None);import mpython"])
+        if err:
+            logger.warning('Board cannot import mpython.mpy: {}'.format(
+                espfs.clean_error(err)))
+            return False
+        logger.info('Sent mpython.mpy, {} bytes.'.format(len(content)))
+        self.on_info_start.emit(_('Sending {} bytes of compiled library.')
+                                .format(len(content)), 2)
+        return True
+
     def rename(self, esp_filename, new_name):        
         try:
-            self.stop_py.emit()
-            time.sleep(0.5)
+            self.device_runner.stop()
             self.on_rename_start.emit()
             espfs.rename(esp_filename, new_name)
             self.on_rename.emit(esp_filename, new_name)
@@ -447,8 +668,7 @@ class FileManager(QObject):
 
     def reset_firmware(self, _home):
         try:
-            self.stop_py.emit()
-            time.sleep(0.5)
+            self.device_runner.stop()
             port, serial_number = espfs.find_device()
             if port is not None:
                 self.device_restorer.set(port, _home)
@@ -471,8 +691,10 @@ class EspMode(MicroPythonMode):
     icon = 'mPython'
     save_timeout = 0  #: Don't autosave
     fs = None  #: Reference to filesystem navigator.
+    emulator = None  #: The PythonProcessPane running the emulated board.
     flash_thread = None
     flash_timer = None
+    firmware_reader = None
     file_extensions = ['txt','json','ini']#'hex'
     
     builtins = ['I2C', 'PWM', 'Pin', 'ADC', 'TouchPad', 'SSD1106_I2C',
@@ -507,6 +729,14 @@ class EspMode(MicroPythonMode):
                 'handler': self.run_file,
                 'shortcut': 'F5',
             },
+            {
+                'name': 'play',
+                'display_name': _('Emulate'),
+                'description': _('Run your code on an mPython board emulated '
+                                 'on this computer.'),
+                'handler': self.emulate_toggle,
+                'shortcut': 'F6',
+            },
             {
                 'name': 'files',
                 'display_name': _('Files'),
@@ -828,6 +1058,7 @@ class EspMode(MicroPythonMode):
                 try:
                     #espfs.put(tab.path, target=None)
                     self.editor.show_status_message(_("Flashing to board ..."))
+                    content = self.shrink(tab.path, content)
                     espfs.put_py(tab.path, content, target=None)
                     self.add_fs()
                     if self.file_manager:
@@ -839,10 +1070,10 @@ class EspMode(MicroPythonMode):
             else:
                 try:
                     if self.file_manager:
-                        self.file_manager.stop_py.emit()
-                        time.sleep(0.5)
+                        self.file_manager.device_runner.stop()
                     # espfs.put(tab.path, target=None)
                     self.editor.show_status_message(_("Flashing to board ..."))
+                    content = self.shrink(tab.path, content)
                     espfs.put_py(tab.path, content, target=None)
                     if self.file_manager:
                         self.file_manager.on_put_file.emit(os.path.basename(tab.path))
@@ -852,6 +1083,18 @@ class EspMode(MicroPythonMode):
                     if self.file_manager:
                         self.file_manager.on_put_fail.emit(os.path.basename(tab.path))
 
+    def shrink(self, filename, content):
+        """
+        Return the content to send to the board as filename, shrunk if the
+        user has asked for scripts to be minified.
+        """
+        if not self.editor.minify:
+            return content
+        content, message = shrink_upload(filename, content)
+        if message:
+            self.editor.show_status_message(message)
+        return content
+
     def run_file(self):
         tab = self.editor._view.current_tab
         if tab is None:
@@ -873,12 +1116,87 @@ class EspMode(MicroPythonMode):
             else:
                 try:
                     if self.file_manager:
-                        self.file_manager.stop_py.emit()
-                        time.sleep(0.5)                        
+                        # run_content waits for it to stop, in the file
+                        # manager's thread.
+                        self.file_manager.device_runner.request_stop()
                         self.file_manager.on_run_content.emit(content)
                 except Exception as ex:
                     logger.error(ex)
 
+    def emulate_toggle(self, event):
+        """
+        Handles the toggling of the emulate button to start/stop running the
+        script on an emulated board.
+        """
+        if self.emulator:
+            self.stop_emulator()
+            play_slot = self.view.button_bar.slots['play']
+            play_slot.setIcon(load_icon('play'))
+            play_slot.setText(_('Emulate'))
+            play_slot.setToolTip(_('Run your code on an mPython board '
+                                   'emulated on this computer.'))
+            self.set_buttons(modes=True)
+        else:
+            self.run_emulator()
+            if self.emulator:
+                play_slot = self.view.button_bar.slots['play']
+                play_slot.setIcon(load_icon('stop'))
+                play_slot.setText(_('Stop'))
+                play_slot.setToolTip(_('Stop the emulated mPython board.'))
+                self.set_buttons(modes=False)
+
+    def run_emulator(self):
+        """
+        Run the current script against an mPython board emulated on this
+        computer (see mu.emulator), with its display in a pane of its own.
+        """
+        tab = self.view.current_tab
+        if tab is None:
+            logger.debug('There is no active text editor.')
+            return
+        if tab.path is None:
+            # Unsaved file.
+            self.editor.save()
+        if not tab.path:
+            return
+        if tab.isModified():
+            with open(tab.path, 'w', newline='') as f:
+                logger.info('Saving script to: {}'.format(tab.path))
+                write_and_flush(f, tab.text())
+                tab.setModified(False)
+        home = self.workspace_dir()
+        lib = config_path(home, 'mpython.py')
+        if lib is None:
+            message = _('Could not find mpython.py.')
+            information = _("The emulator needs a copy of mpython.py in the "
+                            "__config__ folder of Mu's workspace.")
+            self.view.show_message(message, information)
+            return
+        state = os.path.join(tempfile.gettempdir(),
+                             'mu-mpython-{}.state'.format(os.getpid()))
+        if os.path.exists(state):
+            # Left by the last run: don't show it.
+            os.remove(state)
+        envars = self.editor.envars + \
+            emulator.envars(lib, config_path(home, 'target.bin'), state)
+        self.view.add_mpython_display(state)
+        self.emulator = self.view.add_python3_runner(
+            tab.path, home, interactive=False, envars=envars,
+            python_args=['-m', 'mu.emulator'])
+        self.emulator.process.waitForStarted()
+
+    def stop_emulator(self):
+        """
+        Stop the emulated board, and remove its panes.
+        """
+        logger.debug('Stopping the emulator.')
+        if self.emulator:
+            self.emulator.process.kill()
+            self.emulator.process.waitForFinished()
+            self.emulator = None
+        self.view.remove_python_runner()
+        self.view.remove_mpython_display()
+
     def copy_main(self):
         """
         If the attribute self.python_script contains any code, copy it onto the
@@ -1015,7 +1333,7 @@ class EspMode(MicroPythonMode):
             self.view.show_message(message, information)
             return
         self.file_manager_thread = QThread(self)
-        self.file_manager = FileManager()
+        self.file_manager = FileManager(self.editor)
         self.file_manager.moveToThread(self.file_manager_thread)
         self.file_manager_thread.started.\
             connect(self.file_manager.on_start)
@@ -1026,6 +1344,8 @@ class EspMode(MicroPythonMode):
                                                self.file_manager)
         self.fs.set_message.connect(self.editor.show_status_message)
         self.fs.set_warning.connect(self.view.show_message)
+        self.file_manager.device_runner.started.connect(self.on_run_start)
+        self.file_manager.device_runner.on_output.connect(self.on_run_output)
         self.file_manager_thread.start()
 
     def remove_fs(self):
@@ -1036,6 +1356,27 @@ class EspMode(MicroPythonMode):
         self.file_manager = None
         self.file_manager_thread = None
         self.fs = None
+        if not self.repl:
+            # Remove the pane showing the output of programs run from it.
+            self.view.remove_repl()
+
+    def on_run_start(self):
+        """
+        Clear the output of any previous program before a new one starts
+        running on the board.
+        """
+        if self.view.repl and not self.repl:
+            self.view.repl_pane.clear()
+
+    def on_run_output(self, data):
+        """
+        Show the output of the program running on the board as it arrives,
+        in a pane of its own (since the REPL can't share the connection).
+        """
+        if not self.view.repl:
+            self.view.add_device_output(self.name)
+        if not self.repl:
+            self.view.repl_pane.process_bytes(data)
 
     def on_data_flood(self):
         """
@@ -1068,99 +1409,88 @@ class EspMode(MicroPythonMode):
             res_path = os.path.split(os.path.realpath(sys.argv[0]))[0] + '\\'
         return res_path
 
-    def get_firmware_version(self, _response):
-        if b'icroPython ' in _response:
-            i = _response.find(b'icroPython ') + 11
-            _response = _response[i:]
-            j = _response.find(b';')
-            _response = _response[0:j]
-            k = _response.find(b' on ') + 4
-            _date = _response[k:]
-            return str(_response, encoding="utf8"), str(_date, encoding="utf8")
-        else:
-            return None, None
-
     def do_reset_firmware(self):
         self.file_manager.reset_firmware(self.workspace_dir())
     
     def check_firmware(self):
-        # print("check_firmware")
+        """
+        Start reading the version of the firmware on the board. The result is
+        handled by on_firmware_version.
+        """
         if self.editor.mode != "mPython":
             return
         if not self.view.update_bin_status:
             return
+        if self.firmware_reader and self.firmware_reader.isRunning():
+            return
+        self.firmware_reader = FirmwareReader()
+        self.firmware_reader.on_version.connect(self.on_firmware_version)
+        self.firmware_reader.start()
+
+    def on_firmware_version(self, firmware_ver, firmware_date):
+        """
+        Offer to replace the firmware on the board if it differs from the one
+        shipped with Mu.
+        """
+        if self.editor.mode != "mPython":
+            return
         try:
-            serial = espfs.get_serial()
-            if serial:
-                serial.write(b'\x02')
-                for i in range(3):
-                    serial.write(b'\r\x03')
-                    time.sleep(0.01)
-                response = serial.read_until(b'Type "help()" for more information.')
-                # print(response)
-                firmware_ver, firmware_date = self.get_firmware_version(response)
-                if firmware_ver is None:
-                    serial.write(b'\r\x03')
-                    response = serial.read_until(b'Type "help()" for more information.')
-                    # print(response)
-                    firmware_ver, firmware_date = self.get_firmware_version(response)
-                if firmware_ver is None:
-                    firmware_ver = ""
-                    firmware_date = "None"
-                print(firmware_ver, firmware_date)
-                config_dir = os.path.join(self.workspace_dir(), "__config__")
-                ini_path = os.path.join(config_dir, "mpython.ini")
-                if not os.path.isfile(ini_path):
-                    return
-                cf = configparser.ConfigParser()
-                cf.read(ini_path)
-                if cf.has_section("firmware"):
-                    local_ver = None
-                    local_date = None
-                    local_ignore = None
-                    try:
-                        local_ver = cf.get("firmware","version")
-                        local_date = cf.get("firmware","date")
-                        local_ignore = cf.get("firmware","ignore")
-                    except Exception as ex:
-                        print(ex)
-                    print(local_ver, local_date, local_ignore)
-                    if local_ignore is not None:
-                        if local_ignore == "1":
-                            return
-                    if local_ver is not None:
-                        if firmware_ver == local_ver:
-                            return
-                        if firmware_ver == "":
-                            info = _("No onboard firmware detected, replace th"
-                                "e firmware in hardware by the firmware in sof"
-                                "tware (release date: {}).\n\nWarning: this op"
-                                "eration will cause all user files lost.").format(local_date)
-                            if self.view.show_update_firmware(info, config_dir):
+            logger.info('Firmware: {} {}'.format(firmware_ver,
+                                                 firmware_date))
+            config_dir = os.path.join(self.workspace_dir(), "__config__")
+            ini_path = os.path.join(config_dir, "mpython.ini")
+            if not os.path.isfile(ini_path):
+                return
+            cf = configparser.ConfigParser()
+            cf.read(ini_path)
+            if cf.has_section("firmware"):
+                local_ver = None
+                local_date = None
+                local_ignore = None
+                try:
+                    local_ver = cf.get("firmware","version")
+                    local_date = cf.get("firmware","date")
+                    local_ignore = cf.get("firmware","ignore")
+                except Exception as ex:
+                    logger.error(ex)
+                logger.debug('Local firmware: {} {} (ignore: {})'.format(
+                    local_ver, local_date, local_ignore))
+                if local_ignore is not None:
+                    if local_ignore == "1":
+                        return
+                if local_ver is not None:
+                    if firmware_ver == local_ver:
+                        return
+                    if firmware_ver == "":
+                        info = _("No onboard firmware detected, replace th"
+                            "e firmware in hardware by the firmware in sof"
+                            "tware (release date: {}).\n\nWarning: this op"
+                            "eration will cause all user files lost.").format(local_date)
+                        if self.view.show_update_firmware(info, config_dir):
+                            if self.fs is None:
+                                self.add_fs(_reset=True)
+                            else:
+                                self.file_manager.reset_firmware(self.workspace_dir())
+                    else:
+                        info = _("The firmware (release date: {}) "
+                            "which preloaded in hardware is different "
+                            "from the firmware (release date: {}) "
+                            "which preseted in software. The question "
+                            "is whether to replace the firmware in "
+                            "hardware by the firmware in software.\n\n"
+                            "Warning: this operation will cause all "
+                            "user files lost.").format(firmware_date,
+                            local_date)
+                        if self.view.show_update_firmware(info, config_dir):
+                            result = self.view.show_confirmation(_("WARNING: This operation "
+                                "will cause all user files lost.!!!\nWARNING: This operation "
+                                "will cause all user files lost !!!\nWARNING: This operation "
+                                "will cause all user files lost !!!"), icon='Warning')
+                            if result == QMessageBox.Ok:
                                 if self.fs is None:
                                     self.add_fs(_reset=True)
                                 else:
                                     self.file_manager.reset_firmware(self.workspace_dir())
-                        else:
-                            info = _("The firmware (release date: {}) "
-                                "which preloaded in hardware is different "
-                                "from the firmware (release date: {}) "
-                                "which preseted in software. The question "
-                                "is whether to replace the firmware in "
-                                "hardware by the firmware in software.\n\n"
-                                "Warning: this operation will cause all "
-                                "user files lost.").format(firmware_date,
-                                local_date)
-                            if self.view.show_update_firmware(info, config_dir):
-                                result = self.view.show_confirmation(_("WARNING: This operation "
-                                    "will cause all user files lost.!!!\nWARNING: This operation "
-                                    "will cause all user files lost !!!\nWARNING: This operation "
-                                    "will cause all user files lost !!!"), icon='Warning')
-                                if result == QMessageBox.Ok:
-                                    if self.fs is None:
-                                        self.add_fs(_reset=True)
-                                    else:
-                                        self.file_manager.reset_firmware(self.workspace_dir())
         except Exception as ex:
             return        
 
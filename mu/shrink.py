@@ -0,0 +1,388 @@
+"""
+Shrinking Python source before it is sent to a MicroPython board.
+
+Scripts and libraries are copied to the mPython board over a 115200 baud
+serial link and then compiled on the board itself, in a few tens of kilobytes
+of heap. Comments, docstrings, deep indentation and long local variable names
+cost transfer time and heap yet mean nothing to the board, so they are taken
+out first:
+
+* strip_source removes comments and docstrings and indents each block by a
+  single space. Every statement stays on its original line, so line numbers
+  in tracebacks from the board still match the editor.
+* rename_locals gives the local variables of simple functions the shortest
+  names that don't clash with anything else the function uses.
+* compile_mpy compiles source to MicroPython bytecode (a .mpy file) with the
+  mpy-cross tool, if it is installed, so the board needn't compile it at all.
+
+The results are cached by a hash of the source, since the same library is
+often flashed to several boards in a row.
+
+Copyright (c) 2015-2017 Nicholas H.Tollervey and others (see the AUTHORS file).
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import ast
+import hashlib
+import io
+import itertools
+import keyword
+import logging
+import os
+import shutil
+import string
+import subprocess
+import tempfile
+import tokenize
+
+
+logger = logging.getLogger(__name__)
+
+
+#: How many shrunk or compiled sources to remember.
+CACHE_SIZE = 32
+#: Calls that can see local variables by name, so rule out renaming them.
+INTROSPECTION = {'locals', 'vars', 'eval', 'exec', 'dir'}
+#: Nodes that make renaming the locals of a function unsafe: nested scopes
+#: (which may refer to the locals), declarations that make names non-local
+#: and nodes whose names aren't held in ast.Name nodes with exact positions.
+UNSAFE_NODES = tuple(getattr(ast, name) for name in (
+    'FunctionDef', 'AsyncFunctionDef', 'Lambda', 'ClassDef', 'ListComp',
+    'SetComp', 'DictComp', 'GeneratorExp', 'Global', 'Nonlocal',
+    'JoinedStr', 'Match') if hasattr(ast, name))
+#: Tokens that can't start or be part of a statement.
+SKIPPED_TOKENS = {tokenize.NL, tokenize.COMMENT}
+#: The names of string tokens on Pythons that split up f-strings.
+FSTRING_START = getattr(tokenize, 'FSTRING_START', None)
+FSTRING_END = getattr(tokenize, 'FSTRING_END', None)
+
+
+_cache = {}  # hash of the source and options -> result
+
+
+def _cached(key, make):
+    """
+    Return the cached result for key, calling make to create it if needed.
+    """
+    if key not in _cache:
+        if len(_cache) >= CACHE_SIZE:
+            del _cache[next(iter(_cache))]
+        _cache[key] = make()
+    return _cache[key]
+
+
+def _source_key(source, *options):
+    """
+    Return a key for caching results computed from the source.
+    """
+    if isinstance(source, str):
+        source = source.encode('utf-8')
+    return (hashlib.sha1(source).hexdigest(), ) + options
+
+
+def _next_token(tokens, index, step):
+    """
+    Return the index of the first token from index onwards (or backwards, if
+    step is -1) that isn't a comment or blank line, or None.
+    """
+    while 0 <= index < len(tokens):
+        if tokens[index].type not in SKIPPED_TOKENS:
+            return index
+        index += step
+    return None
+
+
+def _docstrings(tokens):
+    """
+    Yield (token, replacement) for each string on a line by itself (a
+    docstring or a string used as a comment). The replacement is "pass" for
+    strings that are the only statement in a block, otherwise nothing.
+    """
+    start_of_line = True
+    for i, token in enumerate(tokens):
+        if token.type in (tokenize.NEWLINE, tokenize.INDENT,
+                          tokenize.DEDENT):
+            start_of_line = True
+            continue
+        if token.type in SKIPPED_TOKENS:
+            continue
+        # f-strings are left alone since they may call things.
+        if start_of_line and token.type == tokenize.STRING and \
+                'f' not in token.string.split(token.string[-1])[0].lower():
+            end = _next_token(tokens, i + 1, 1)
+            if end is not None and tokens[end].type == tokenize.NEWLINE:
+                before = _next_token(tokens, i - 1, -1)
+                after = _next_token(tokens, end + 1, 1)
+                only = (before is not None and
+                        tokens[before].type == tokenize.INDENT and
+                        tokens[after].type in (tokenize.DEDENT,
+                                               tokenize.ENDMARKER))
+                yield token, 'pass' if only else ''
+        start_of_line = False
+
+
+def _remove_docstrings(lines, tokens):
+    """
+    Remove the docstrings found in tokens from lines, keeping the lines they
+    spanned as blank lines.
+    """
+    for token, replacement in _docstrings(tokens):
+        (start_row, start_col), (end_row, end_col) = token.start, token.end
+        first, last = lines[start_row - 1], lines[end_row - 1]
+        if start_row == end_row:
+            lines[start_row - 1] = (first[:start_col] + replacement +
+                                    first[end_col:])
+        else:
+            lines[start_row - 1] = first[:start_col] + replacement + '\n'
+            for row in range(start_row, end_row - 1):
+                lines[row] = '\n'
+            lines[end_row - 1] = last[end_col:]
+
+
+def _string_spans(tokens):
+    """
+    Yield the (start, end) positions of the strings in tokens.
+    """
+    fstring_starts = []
+    for token in tokens:
+        if token.type == tokenize.STRING:
+            yield token.start, token.end
+        elif FSTRING_START is not None and token.type == FSTRING_START:
+            fstring_starts.append(token.start)
+        elif FSTRING_END is not None and token.type == FSTRING_END:
+            yield fstring_starts.pop(), token.end
+
+
+def strip_source(source):
+    """
+    Return the source without comments or docstrings and with every block
+    indented by a single space. Lines are never joined or removed (emptied
+    instead) so line numbers stay the same.
+
+    Raises tokenize.TokenError, SyntaxError or IndentationError for source
+    that can't be tokenized.
+    """
+    lines = io.StringIO(source).readlines()
+    tokens = list(tokenize.generate_tokens(io.StringIO(source).readline))
+    _remove_docstrings(lines, tokens)
+    tokens = list(tokenize.generate_tokens(iter(lines).__next__))
+    # Rows that start inside a string, whose indentation is part of the
+    # string, and rows that end inside one, whose trailing space is.
+    in_string, open_string = set(), set()
+    for (start_row, _), (end_row, _) in _string_spans(tokens):
+        in_string.update(range(start_row + 1, end_row + 1))
+        open_string.update(range(start_row, end_row))
+    comments = {}  # row -> column the comment starts at
+    statements = {}  # row -> indentation depth of the statement starting it
+    depth = 0
+    start_of_line = True
+    for token in tokens:
+        if token.type == tokenize.INDENT:
+            depth += 1
+        elif token.type == tokenize.DEDENT:
+            depth -= 1
+        elif token.type == tokenize.NEWLINE:
+            start_of_line = True
+        elif token.type == tokenize.COMMENT:
+            comments[token.start[0]] = token.start[1]
+        elif token.type not in (tokenize.NL, tokenize.ENDMARKER):
+            if start_of_line:
+                statements[token.start[0]] = depth
+            start_of_line = False
+    result = []
+    for row, line in enumerate(lines, 1):
+        text = line.rstrip('\r\n')
+        newline = line[len(text):]
+        if row not in open_string:
+            text = text[:comments.get(row, len(text))].rstrip()
+        if row not in in_string:
+            code = text.lstrip()
+            if not code:
+                text = ''
+            elif row in statements:
+                text = ' ' * statements[row] + code
+            elif code != text:
+                # Continuation lines only need to be kept apart from the line
+                # before (after a backslash).
+                text = ' ' + code
+        result.append(text + newline)
+    return ''.join(result)
+
+
+def _decorated_for_micropython(function):
+    """
+    Return True if the function has a decorator from the micropython module
+    (e.g. @micropython.viper or @micropython.asm_thumb), whose code follows
+    different rules.
+    """
+    for decorator in function.decorator_list:
+        for node in ast.walk(decorator):
+            if isinstance(node, ast.Name) and node.id == 'micropython':
+                return True
+    return False
+
+
+def local_names(function):
+    """
+    Return the set of local variables of the function (an ast.FunctionDef
+    or ast.AsyncFunctionDef) that can safely be renamed. The arguments are
+    never included, since they can be passed by keyword.
+    """
+    if _decorated_for_micropython(function):
+        return set()
+    arguments = function.args
+    excluded = {arg.arg for arg in itertools.chain(
+        getattr(arguments, 'posonlyargs', []), arguments.args,
+        arguments.kwonlyargs, [arguments.vararg, arguments.kwarg]) if arg}
+    stored = set()
+    for statement in function.body:
+        for node in ast.walk(statement):
+            if isinstance(node, UNSAFE_NODES):
+                return set()
+            if isinstance(node, ast.Call) and \
+                    isinstance(node.func, ast.Name) and \
+                    node.func.id in INTROSPECTION:
+                return set()
+            if isinstance(node, ast.Name) and \
+                    not isinstance(node.ctx, ast.Load):
+                stored.add(node.id)
+            elif isinstance(node, (ast.Import, ast.ImportFrom)):
+                excluded.update((alias.asname or alias.name).split('.')[0]
+                                for alias in node.names)
+            elif isinstance(node, ast.ExceptHandler) and node.name:
+                excluded.add(node.name)
+    return stored - excluded
+
+
+def _short_names():
+    """
+    Yield identifiers from the shortest up.
+    """
+    first = string.ascii_letters
+    rest = string.ascii_letters + string.digits + '_'
+    for length in itertools.count(1):
+        for tail in itertools.product(rest, repeat=length - 1):
+            for head in first:
+                yield head + ''.join(tail)
+
+
+def _renames(function):
+    """
+    Return a dict mapping the function's renameable local variables to
+    shorter names, the most used first.
+    """
+    names = local_names(function)
+    if not names:
+        return {}
+    used = {arg.arg for arg in ast.walk(function.args)
+            if isinstance(arg, ast.arg)}
+    counts = {}
+    for statement in function.body:
+        for node in ast.walk(statement):
+            if isinstance(node, ast.Name):
+                used.add(node.id)
+                if node.id in names:
+                    counts[node.id] = counts.get(node.id, 0) + 1
+    candidates = (name for name in _short_names()
+                  if name not in used and not keyword.iskeyword(name) and
+                  name not in ('match', 'case', '_'))
+    renames = {}
+    new_name = next(candidates)
+    for name in sorted(names, key=lambda name: (-counts[name], name)):
+        if len(new_name) < len(name):
+            renames[name] = new_name
+            new_name = next(candidates)
+    return renames
+
+
+def rename_locals(source):
+    """
+    Return the source with the local variables of its functions renamed to
+    the shortest names that don't clash with anything else the function
+    uses (see local_names for which can be). Raises SyntaxError for source
+    that can't be parsed.
+    """
+    tree = ast.parse(source)
+    edits = {}  # line number -> list of (start, end, new name) byte offsets
+    for function in ast.walk(tree):
+        if not isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        renames = _renames(function)
+        for statement in function.body if renames else []:
+            for node in ast.walk(statement):
+                if isinstance(node, ast.Name) and node.id in renames:
+                    start = node.col_offset
+                    end = start + len(node.id.encode('utf-8'))
+                    edits.setdefault(node.lineno, []).append(
+                        (start, end, renames[node.id].encode('utf-8')))
+    if not edits:
+        return source
+    lines = io.StringIO(source).readlines()
+    for lineno, line_edits in edits.items():
+        line = lines[lineno - 1].encode('utf-8')
+        for start, end, new_name in sorted(line_edits, reverse=True):
+            line = line[:start] + new_name + line[end:]
+        lines[lineno - 1] = line.decode('utf-8')
+    return ''.join(lines)
+
+
+def shrink(source, rename=True):
+    """
+    Return the source stripped of comments, docstrings and indentation and,
+    if rename is set, with shorter local variable names. The line numbers of
+    the code don't change. Source that can't be parsed is returned as it is,
+    so the board reports the problem against the code the user wrote.
+    """
+    def make():
+        try:
+            result = strip_source(source)
+            return rename_locals(result) if rename else result
+        except (SyntaxError, tokenize.TokenError) as ex:
+            logger.info('Not shrinking source: {}'.format(ex))
+            return source
+    return _cached(_source_key(source, 'shrink', rename), make)
+
+
+def find_mpy_cross():
+    """
+    Return the path to the mpy-cross compiler, or None if it isn't installed.
+    The MPY_CROSS environment variable can point at a particular build (the
+    .mpy format must match the board's firmware).
+    """
+    return os.environ.get('MPY_CROSS') or shutil.which('mpy-cross')
+
+
+def compile_mpy(source, name, mpy_cross=None):
+    """
+    Return the bytes of the .mpy file mpy-cross compiles the source (of the
+    module called name, e.g. "mpython.py") to. Raises IOError if mpy-cross
+    isn't installed or can't compile the source.
+    """
+    mpy_cross = mpy_cross or find_mpy_cross()
+    if not mpy_cross:
+        raise IOError('mpy-cross is not installed.')
+
+    def make():
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, name)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(source)
+            result = subprocess.run([mpy_cross, '-s', name, path],
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT)
+            if result.returncode:
+                raise IOError(result.stdout.decode('utf-8', 'replace'))
+            with open(os.path.splitext(path)[0] + '.mpy', 'rb') as f:
+                return f.read()
+    return _cached(_source_key(source, 'mpy', name, mpy_cross), make)
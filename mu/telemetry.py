@@ -0,0 +1,144 @@
+"""
+Decodes the binary telemetry frames a board can send to Mu's plotter.
+
+Printing a tuple such as ``(1, 2.5, 3)`` costs a dozen or so bytes of text
+per sample, which Mu then has to parse. Instead, samples can be sent in
+binary frames (``send_frame`` and ``plot`` in ``mpython.py`` write them),
+which may be mixed freely with printed text. A frame is:
+
+====== ===== ================================================================
+Offset Bytes Contents
+====== ===== ================================================================
+0      2     Sync marker: ``0xff 0x55``.
+2      1     Kind of the values: ``h`` (int16) or ``f`` (float32).
+3      1     Channels: the number of values in each sample (1 to 255).
+4      1     Rows: the number of samples in the frame (1 to 255).
+5      n     The channels * rows values, little endian, a sample at a time.
+5 + n  4     CRC-32 (as ``zlib.crc32``) of bytes 2 to 5 + n, little endian.
+====== ===== ================================================================
+
+``0xff`` never appears in UTF-8, so the sync marker doesn't turn up in
+text. Bytes that look like the start of a frame but have a header that makes
+no sense or a CRC that doesn't match are treated as text, as is the start of
+a frame the rest of which never arrives (see ``FrameDecoder.flush``).
+
+Copyright (c) 2015-2017 Nicholas H.Tollervey and others (see the AUTHORS file).
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import struct
+import zlib
+
+
+#: Starts every frame.
+SYNC = b'\xff\x55'
+#: Bytes before the values: the sync marker, kind, channels and rows.
+HEADER_SIZE = 5
+#: Bytes after the values: the CRC.
+CRC_SIZE = 4
+#: The size in bytes of a value of each kind.
+VALUE_SIZES = {ord('h'): 2, ord('f'): 4}
+
+
+class FrameDecoder:
+    """
+    Separates frames from the text they're mixed with, in data that arrives
+    in chunks which needn't break between frames.
+    """
+
+    def __init__(self):
+        # The start of a frame that hasn't all arrived yet.
+        self.pending = b''
+        self.frames = 0  # Frames decoded.
+        self.errors = 0  # Sync markers that turned out not to start frames.
+
+    def feed(self, data):
+        """
+        Return (text, samples) for the next chunk of data: the text with the
+        frames taken out, and the samples (tuples of numbers) in the frames.
+        """
+        data = self.pending + data
+        self.pending = b''
+        text = []
+        samples = []
+        position = 0
+        while True:
+            start = data.find(SYNC, position)
+            if start < 0:
+                end = len(data)
+                if data.endswith(SYNC[:1]):
+                    # Perhaps the first half of a sync marker.
+                    end -= 1
+                text.append(data[position:end])
+                self.pending = data[end:]
+                break
+            text.append(data[position:start])
+            if len(data) < start + HEADER_SIZE:
+                self.pending = data[start:]
+                break
+            kind, channels, rows = data[start + 2:start + HEADER_SIZE]
+            if kind not in VALUE_SIZES or not channels or not rows:
+                self.errors += 1
+                text.append(data[start:start + 1])
+                position = start + 1
+                continue
+            end = start + HEADER_SIZE + VALUE_SIZES[kind] * channels * rows
+            if len(data) < end + CRC_SIZE:
+                self.pending = data[start:]
+                break
+            crc, = struct.unpack_from('<I', data, end)
+            if zlib.crc32(data[start + 2:end]) != crc:
+                self.errors += 1
+                text.append(data[start:start + 1])
+                position = start + 1
+                continue
+            values = struct.unpack_from(
+                '<{}{}'.format(channels * rows, chr(kind)), data,
+                start + HEADER_SIZE)
+            samples.extend(values[i:i + channels]
+                           for i in range(0, len(values), channels))
+            self.frames += 1
+            position = end + CRC_SIZE
+        return b''.join(text), samples
+
+    def flush(self):
+        """
+        Stop waiting for the rest of the frame that's pending: it wasn't one,
+        so its first byte is text and what follows is fed again. Return
+        (text, samples) as feed does.
+        """
+        data = self.pending
+        self.pending = b''
+        if not data:
+            return b'', []
+        if data.startswith(SYNC):
+            self.errors += 1
+        text, samples = self.feed(data[1:])
+        return data[:1] + text, samples
+
+
+def encode(samples, kind='h'):
+    """
+    Return the frames (as bytes) for a list of samples, each a tuple of the
+    same number of values, as mpython.send_frame would send them.
+    """
+    frames = []
+    for start in range(0, len(samples), 255):
+        rows = samples[start:start + 255]
+        channels = len(rows[0])
+        body = struct.pack('<cBB', kind.encode('ascii'), channels, len(rows))
+        body += struct.pack('<{}{}'.format(channels * len(rows), kind),
+                            *[value for row in rows for value in row])
+        frames.append(SYNC + body + struct.pack('<I', zlib.crc32(body)))
+    return b''.join(frames)
@@ -0,0 +1,242 @@
+"""
+A tracer for working out where Mu's start up time goes.
+
+It is switched on by setting the MU_TRACE_STARTUP environment variable or
+passing --trace-startup on the command line. When on, the wall time and the
+time spent importing modules is recorded for each phase of start up until
+the first time the window is painted. A report is then written to the log
+directory as JSON and in the "folded stacks" format understood by
+flamegraph.pl and speedscope.
+
+This module is imported before anything else in Mu (so it can time the
+imports too) and must only depend on the standard library until then.
+
+Copyright (c) 2015-2017 Nicholas H.Tollervey and others (see the AUTHORS file).
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import builtins
+import contextlib
+import datetime
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+
+#: Environment variable that switches the start up tracer on.
+TRACE_ENV_VAR = 'MU_TRACE_STARTUP'
+#: Command line flag that switches the start up tracer on.
+TRACE_FLAG = '--trace-startup'
+
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTracer:
+    """
+    Records nested start up phases. Each phase is timed from begin to end
+    and the part of that time spent importing modules (in the main thread)
+    is measured by wrapping __import__ and importlib.import_module.
+
+    Everything is a no-op until start is called.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.origin = None
+        self.records = []
+        self.marks = {}
+        self._stack = []
+        self._import_time = 0.0
+        self._import_depth = 0
+        self._thread_id = None
+        self._original_import = None
+        self._original_import_module = None
+
+    def start(self):
+        """
+        Start tracing, with an "imports" phase that lasts until it is ended
+        (when Mu's imports are done).
+        """
+        if self.enabled:
+            return
+        self.enabled = True
+        self.origin = time.perf_counter()
+        self._thread_id = threading.get_ident()
+        self._original_import = builtins.__import__
+        self._original_import_module = importlib.import_module
+        builtins.__import__ = self._timed(self._original_import)
+        importlib.import_module = self._timed(self._original_import_module)
+        self.begin('imports')
+
+    def stop(self):
+        """
+        Stop tracing, closing any phases still open.
+        """
+        if not self.enabled:
+            return
+        while self._stack:
+            self.end()
+        builtins.__import__ = self._original_import
+        importlib.import_module = self._original_import_module
+        self.enabled = False
+
+    def _timed(self, import_function):
+        """
+        Wrap the import function so the time spent in it is added up. Nested
+        imports are only counted once.
+        """
+        def timed_import(*args, **kwargs):
+            if threading.get_ident() != self._thread_id:
+                return import_function(*args, **kwargs)
+            self._import_depth += 1
+            start = time.perf_counter()
+            try:
+                return import_function(*args, **kwargs)
+            finally:
+                self._import_depth -= 1
+                if not self._import_depth:
+                    self._import_time += time.perf_counter() - start
+        return timed_import
+
+    def begin(self, name):
+        """
+        Start timing a phase, nested in the current phase (if any).
+        """
+        if self.enabled:
+            self._stack.append((name, time.perf_counter(),
+                                self._import_time))
+
+    def end(self):
+        """
+        Stop timing the current phase.
+        """
+        if not (self.enabled and self._stack):
+            return
+        now = time.perf_counter()
+        name, start, import_start = self._stack.pop()
+        stack = [phase[0] for phase in self._stack] + [name]
+        self.records.append({
+            'name': name,
+            'stack': stack,
+            'start': start - self.origin,
+            'wall': now - start,
+            'imports': self._import_time - import_start,
+        })
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Context manager to time the enclosed code as the named phase.
+        """
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def mark(self, name):
+        """
+        Record the time since tracing started at which something happened.
+        """
+        if self.enabled:
+            self.marks[name] = time.perf_counter() - self.origin
+
+    def folded(self):
+        """
+        Return the records as "folded stacks": one line per phase with the
+        semicolon separated stack and the microseconds spent in the phase
+        itself (i.e. not in the phases nested within it). Time spent
+        importing is shown as an "(imports)" frame on top of the phase.
+        """
+        children = {}
+        for record in self.records:
+            parent = tuple(record['stack'][:-1])
+            wall, imports = children.get(parent, (0.0, 0.0))
+            children[parent] = (wall + record['wall'],
+                                imports + record['imports'])
+        lines = []
+        for record in sorted(self.records, key=lambda r: r['start']):
+            stack = ';'.join(record['stack'])
+            child_wall, child_imports = children.get(tuple(record['stack']),
+                                                     (0.0, 0.0))
+            imports = max(record['imports'] - child_imports, 0.0)
+            own = max(record['wall'] - child_wall - imports, 0.0)
+            lines.append('{} {}'.format(stack, round(own * 1e6)))
+            if imports:
+                lines.append('{};(imports) {}'.format(stack,
+                                                      round(imports * 1e6)))
+        return '\n'.join(lines) + '\n'
+
+    def write_report(self, directory):
+        """
+        Write the JSON and folded stack reports to the referenced directory.
+        Returns the path to the JSON report.
+        """
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        name = os.path.join(directory, 'startup-{}'.format(stamp))
+        report = {
+            'argv': sys.argv,
+            'phases': sorted(self.records, key=lambda r: r['start']),
+            'marks': self.marks,
+        }
+        with open(name + '.json', 'w') as json_file:
+            json.dump(report, json_file, indent=2)
+        with open(name + '.folded', 'w') as folded_file:
+            folded_file.write(self.folded())
+        logger.info('Start up trace written to: {}.json'.format(name))
+        return name + '.json'
+
+    def finish_on_first_paint(self, app, directory):
+        """
+        Stop tracing and write the report once the application first paints
+        a widget.
+        """
+        if not self.enabled:
+            return
+        from PyQt5.QtCore import QObject, QEvent
+
+        tracer = self
+
+        class FirstPaintFilter(QObject):
+
+            def eventFilter(self, obj, event):
+                if event.type() == QEvent.Paint:
+                    app.removeEventFilter(self)
+                    tracer.mark('first_paint')
+                    tracer.stop()
+                    try:
+                        tracer.write_report(directory)
+                    except OSError as ex:
+                        logger.error('Could not write start up trace: '
+                                     '{}'.format(ex))
+                return False
+
+        self._paint_filter = FirstPaintFilter()
+        app.installEventFilter(self._paint_filter)
+
+
+#: The tracer used throughout Mu.
+tracer = StartupTracer()
+
+
+if os.environ.get(TRACE_ENV_VAR) or TRACE_FLAG in sys.argv:
+    # Don't leave the flag for Mu to treat as a file to open.
+    while TRACE_FLAG in sys.argv:
+        sys.argv.remove(TRACE_FLAG)
+    tracer.start()
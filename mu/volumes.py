@@ -0,0 +1,116 @@
+"""
+Finding the mounted volumes of devices such as the micro:bit (MICROBIT) and
+CircuitPython boards (CIRCUITPY) on Linux and OSX.
+
+On Linux the mount points are read straight from /proc/self/mountinfo,
+elsewhere the "mount" command is run. Either way the list is cached for a
+couple of seconds (or until invalidate is called when a device is plugged in
+or unplugged) since it is asked for on every open and save.
+
+Copyright (c) 2015-2017 Nicholas H.Tollervey and others (see the AUTHORS file).
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+import os
+import re
+import threading
+import time
+from subprocess import check_output
+
+
+#: Where Linux lists the mount points seen by this process.
+MOUNTINFO = '/proc/self/mountinfo'
+#: Commands to list mounted volumes. When the user doesn't have
+#: administrative privileges on OSX the mount command isn't on their path.
+MOUNT_COMMANDS = ['mount', '/sbin/mount']
+#: How many seconds a list of mounted volumes is good for.
+CACHE_TTL = 2.0
+
+
+_lock = threading.Lock()
+_cache = None  # (time read, list of mount points)
+
+
+def parse_mountinfo(content):
+    """
+    Return the mount points listed in the bytes content of a mountinfo file.
+    Spaces and other awkward characters in the paths are octal escaped.
+    """
+    volumes = []
+    for line in content.splitlines():
+        fields = line.split(b' ')
+        if len(fields) > 4:
+            path = re.sub(br'\\([0-7]{3})',
+                          lambda m: bytes([int(m.group(1), 8)]), fields[4])
+            volumes.append(os.fsdecode(path))
+    return volumes
+
+
+def parse_mount(output):
+    """
+    Return the mount points listed in the bytes output of the mount command
+    (lines like "/dev/sdb on /media/CIRCUITPY type vfat (rw)").
+    """
+    return [os.fsdecode(line.split()[2]) for line in output.splitlines()
+            if len(line.split()) > 2]
+
+
+def read_volumes():
+    """
+    Return a list of the mount points of all the mounted volumes.
+    """
+    try:
+        with open(MOUNTINFO, 'rb') as mountinfo:
+            return parse_mountinfo(mountinfo.read())
+    except OSError:
+        pass  # Not on Linux.
+    for command in MOUNT_COMMANDS:
+        try:
+            return parse_mount(check_output(command))
+        except FileNotFoundError:
+            continue
+    return []
+
+
+def mounted_volumes():
+    """
+    Return a (cached) list of the mount points of all the mounted volumes.
+    """
+    global _cache
+    with _lock:
+        now = time.monotonic()
+        if _cache is None or now - _cache[0] > CACHE_TTL:
+            _cache = (now, read_volumes())
+        return _cache[1]
+
+
+def invalidate():
+    """
+    Forget the cached volumes, e.g. because a device has been plugged in or
+    unplugged.
+    """
+    global _cache
+    with _lock:
+        _cache = None
+
+
+def find_volume(name):
+    """
+    Return the mount point of the volume whose path ends with name, or None
+    if there isn't one.
+    """
+    for volume in mounted_volumes():
+        if volume.endswith(name):
+            return volume
+    return None
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the font drawn for the emulated board when there's no real one.
+"""
+import struct
+from mu.emulator.font import RenderedFont
+
+
+def glyph_at(font, code):
+    """
+    Return the glyph for code, found the way the board finds it.
+    """
+    entry = font.header_size + (code - font.first_char) * 6
+    offset, length = struct.unpack('IH', font[entry:entry + 6])
+    return font[offset:offset + length]
+
+
+def test_header():
+    """
+    The header says how tall the glyphs are and which characters there are.
+    """
+    font = RenderedFont()
+    magic, height = struct.unpack('4sH', font[0:6])
+    first, last = struct.unpack('HH', font[14:18])
+    assert (magic, height, first, last) == (b'FONT', 16, 32, 0xffff)
+
+
+def test_glyphs():
+    """
+    ASCII glyphs are half width, others full width, and something's drawn.
+    """
+    font = RenderedFont()
+    a = glyph_at(font, ord('A'))
+    assert struct.unpack('HH', a[:4]) == (8, 1)
+    assert len(a) == 4 + 16 and any(a[4:])
+    wide = glyph_at(font, 0x4e2d)
+    assert struct.unpack('HH', wide[:4]) == (16, 2)
+    assert len(wide) == 4 + 32
+    assert not any(glyph_at(font, ord(' '))[4:])
+
+
+def test_glyphs_drawn_once():
+    """
+    Only the glyphs that are read are drawn, and each is drawn once.
+    """
+    font = RenderedFont()
+    glyph_at(font, ord('A'))
+    glyph_at(font, ord('A'))
+    assert list(font.glyphs) == [ord('A')]
+
+
+def test_slice_across_slots():
+    """
+    A slice spanning several glyphs has each in its slot, half width glyphs
+    padded to the slot's size.
+    """
+    font = RenderedFont()
+    start = font.table_size
+    data = font[start:start + font.slot_size * 2]
+    assert len(data) == font.slot_size * 2
+    assert data[:20] == font.glyph(32)
+    assert data[20:font.slot_size] == bytes(font.slot_size - 20)
+    assert data[font.slot_size:font.slot_size + 20] == font.glyph(33)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the state file and environment shared by Mu and the emulator.
+"""
+import os
+import pytest
+from unittest import mock
+import mu.emulator
+
+
+def test_envars():
+    """
+    The emulator is told where mpython.py, the font and the state file are,
+    and Mu is put on its PYTHONPATH ahead of what's there already.
+    """
+    with mock.patch.dict(os.environ, {'PYTHONPATH': 'elsewhere'}):
+        result = dict(mu.emulator.envars('lib.py', 'font.bin', 'state'))
+    assert result[mu.emulator.LIB_ENV] == 'lib.py'
+    assert result[mu.emulator.FONT_ENV] == 'font.bin'
+    assert result[mu.emulator.STATE_ENV] == 'state'
+    root, rest = result['PYTHONPATH'].split(os.pathsep)
+    assert os.path.isdir(os.path.join(root, 'mu', 'emulator'))
+    assert rest == 'elsewhere'
+
+
+def test_envars_no_font():
+    """
+    Without a font the variable is empty, so the emulator draws its own.
+    """
+    with mock.patch.dict(os.environ, clear=True):
+        result = dict(mu.emulator.envars('lib.py', None, 'state'))
+    assert result[mu.emulator.FONT_ENV] == ''
+    assert os.pathsep not in result['PYTHONPATH']
+
+
+def test_pack_state():
+    """
+    What's packed is unpacked unchanged.
+    """
+    display = bytes(range(256)) * 4
+    leds = [(255, 0, 0), (0, 1, 2), (3, 4, 5)]
+    data = mu.emulator.pack_state(128, 64, display, leds)
+    assert mu.emulator.unpack_state(data) == (128, 64, display, leds)
+
+
+def test_unpack_state_wrong_size():
+    """
+    A state file that's short, or not the size its header says, is refused.
+    """
+    data = mu.emulator.pack_state(128, 64, bytes(1024), [(1, 2, 3)])
+    with pytest.raises(ValueError):
+        mu.emulator.unpack_state(data[:3])
+    with pytest.raises(ValueError):
+        mu.emulator.unpack_state(data[:-1])
+    with pytest.raises(ValueError):
+        mu.emulator.unpack_state(data + b'\x00')
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for running scripts against the emulated mPython board.
+"""
+import os
+import sys
+import time
+from unittest import mock
+import pytest
+import mu.emulator
+from mu.emulator import runner, standins
+
+
+@pytest.fixture
+def stand_ins():
+    """
+    Put back the modules and time functions the emulator replaces.
+    """
+    saved = set(dir(time))
+    with mock.patch.dict(sys.modules), \
+            mock.patch.object(sys, 'argv', list(sys.argv)), \
+            mock.patch.object(sys, 'path', list(sys.path)):
+        yield
+    for name in set(dir(time)) - saved:
+        delattr(time, name)
+
+
+def test_StatePublisher_publish(tmpdir):
+    """
+    What the display and RGB LEDs show is written to the state file, but
+    only when it changes.
+    """
+    path = str(tmpdir.join('state'))
+    board = standins.Board()
+    publisher = runner.StatePublisher(board, path)
+    publisher.publish()
+    assert not os.path.exists(path)
+    board.display = mock.MagicMock(width=8, height=8)
+    board.display.shown.return_value = b'\x01' * 8
+    board.neopixels = [mock.MagicMock(shown=[(1, 2, 3)])]
+    publisher.publish()
+    with open(path, 'rb') as state:
+        assert mu.emulator.unpack_state(state.read()) == \
+            (8, 8, b'\x01' * 8, [(1, 2, 3)])
+    os.remove(path)
+    publisher.publish()
+    assert not os.path.exists(path)
+
+
+def test_StatePublisher_publish_fails(tmpdir):
+    """
+    If the state file can't be written it's tried again next time.
+    """
+    board = standins.Board()
+    board.display = mock.MagicMock(width=8, height=8)
+    board.display.shown.return_value = bytes(8)
+    publisher = runner.StatePublisher(board, str(tmpdir.join('no', 'state')))
+    publisher.publish()
+    assert publisher.published is None
+
+
+def test_main_no_script(capsys):
+    """
+    Without a script there's nothing to run.
+    """
+    runner.main([])
+    assert 'requires a Python script' in capsys.readouterr().out
+
+
+def test_main(tmpdir, stand_ins, capsys):
+    """
+    The script runs against the emulated board, with its arguments, and
+    what it leaves on the display ends up in the state file.
+    """
+    script = tmpdir.join('script.py')
+    script.write('import sys\n'
+                 'from mpython import *\n'
+                 'oled.fill(1)\n'
+                 'oled.show()\n'
+                 'rgb[0] = (255, 0, 0)\n'
+                 'rgb.write()\n'
+                 'print(sys.argv[1:], round(accelerometer.get_z()))\n')
+    font = tmpdir.join('font.bin')
+    font.write_binary(standins.make_font('A'))
+    state = str(tmpdir.join('state'))
+    environ = dict(mu.emulator.envars(None, str(font), state))
+    environ[mu.emulator.LIB_ENV] = ''
+    with mock.patch.dict(os.environ, environ):
+        runner.main([str(script), 'one'])
+    assert capsys.readouterr().out == "['one'] 1\n"
+    with open(state, 'rb') as state_file:
+        width, height, display, leds = mu.emulator.unpack_state(
+            state_file.read())
+    assert (width, height) == (128, 64)
+    assert display == b'\xff' * 1024
+    assert leds[0] == (255, 0, 0)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the stand-ins for the mPython board's modules.
+"""
+import sys
+import time
+from unittest import mock
+import pytest
+from mu.emulator import standins
+
+
+@pytest.fixture
+def board():
+    """
+    Install the stand-ins for the length of a test.
+    """
+    saved = {name: getattr(time, name) for name in dir(time)}
+    with mock.patch.dict(sys.modules):
+        yield standins.install()
+    for name in dir(time):
+        if name not in saved:
+            delattr(time, name)
+
+
+def test_load_font(tmpdir):
+    """
+    A font on its own goes where the font lives in flash, a copy of all the
+    flash goes at the start.
+    """
+    font = tmpdir.join('font.bin')
+    font.write_binary(b'FONT')
+    flash = tmpdir.join('target.bin')
+    flash.write_binary(bytes(standins.FONT_ADDRESS + 1))
+    board = standins.Board()
+    board.load_font(str(font))
+    assert board.flash == {standins.FONT_ADDRESS: b'FONT'}
+    board = standins.Board()
+    board.load_font(str(flash))
+    assert list(board.flash) == [0]
+
+
+def test_flash_read_out_of_range():
+    """
+    Reading flash where nothing was put is an OSError, as on the board.
+    """
+    board = standins.Board()
+    with pytest.raises(OSError):
+        board.flash_read(0, bytearray(4))
+
+
+def test_i2c_register_pointer(board):
+    """
+    Reads start at the register last written to, from memory every I2C
+    instance shares.
+    """
+    import machine
+    board.i2c_memory[(38, 6)] = 1
+    board.i2c_memory[(38, 7)] = 2
+    i2c = machine.I2C()
+    i2c.writeto(38, b'\x06')
+    assert machine.I2C().readfrom(38, 1) == b'\x00'
+    assert i2c.readfrom(38, 2) == b'\x01\x02'
+    assert i2c.readfrom_mem(38, 7, 1) == b'\x02'
+
+
+def test_display_and_neopixels(board):
+    """
+    The board knows what its display and RGB LEDs show.
+    """
+    import machine
+    import neopixel
+    import ssd1106
+    display = ssd1106.SSD1106_I2C(128, 64, machine.I2C())
+    display.fill(1)
+    display.show()
+    assert board.display is display
+    assert display.shown() == b'\xff' * 1024
+    pixels = neopixel.NeoPixel(machine.Pin(17), 3)
+    pixels[0] = (1, 2, 3)
+    pixels.write()
+    assert board.neopixels == [pixels]
+    assert pixels.shown[0] == (1, 2, 3)
+
+
+def test_micropython_names(board):
+    """
+    CPython's standard modules are there under their MicroPython names.
+    """
+    import ujson
+    import utime
+    assert ujson.dumps([1]) == '[1]'
+    assert utime.ticks_diff(5, 3) == 2
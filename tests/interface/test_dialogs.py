@@ -161,6 +161,7 @@ def test_FindReplaceDialog_setup():
     assert frd.find() == ''
     assert frd.replace() == ''
     assert frd.replace_flag() is False
+    assert frd.regex_flag() is False
 
 
 def test_FindReplaceDialog_setup_with_args():
@@ -176,3 +177,24 @@ def test_FindReplaceDialog_setup_with_args():
     assert frd.find() == find
     assert frd.replace() == replace
     assert frd.replace_flag()
+
+
+def test_FindReplaceDialog_match_count():
+    """
+    The number of matches is shown as the find term or regular expression
+    flag changes, or a warning if the regular expression is invalid.
+    """
+    count_matches = mock.MagicMock(return_value=3)
+    frd = mu.interface.dialogs.FindReplaceDialog()
+    frd.setup('foo', '', False, False, count_matches)
+    count_matches.assert_called_once_with('foo', False)
+    assert frd.match_count.text() == 'Matches: 3'
+    frd.regex_checkbox.setChecked(True)
+    assert frd.regex_flag() is True
+    count_matches.assert_called_with('foo', True)
+    count_matches.return_value = None
+    frd.find_term.setText('(foo')
+    assert frd.match_count.text() == 'Invalid regular expression.'
+    count_matches.return_value = 0
+    frd.find_term.setText('')
+    assert frd.match_count.text() == ''
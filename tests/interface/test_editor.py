@@ -5,9 +5,13 @@ Tests for the user interface elements of Mu.
 from unittest import mock
 import mu.interface.editor
 import keyword
+import os
 import re
+import pytest
 from PyQt5.QtCore import Qt, QMimeData, QUrl, QPointF
 from PyQt5.QtGui import QDropEvent
+from PyQt5.Qsci import QsciScintilla
+import mu.interface.themes
 
 
 def test_pythonlexer_keywords():
@@ -125,12 +129,81 @@ def test_EditorPane_set_theme():
     ep = mu.interface.editor.EditorPane('/foo/bar.py', 'baz')
     ep.lexer = mock.MagicMock()
     mock_api = mock.MagicMock()
-    with mock.patch('mu.interface.editor.QsciAPIs',
-                    return_value=mock_api) as mapi:
+    with mock.patch('mu.interface.editor.get_api',
+                    return_value=mock_api) as mock_get_api:
         ep.set_api(api)
-        mapi.assert_called_once_with(ep.lexer)
-        mock_api.add.assert_called_once_with('api help text')
-        mock_api.prepare.assert_called_once_with()
+        mock_get_api.assert_called_once_with(api)
+    assert ep.api == mock_api
+    ep.lexer.setAPIs.assert_called_once_with(mock_api)
+
+
+def test_api_key():
+    """
+    The key depends on the content and order of the API definitions.
+    """
+    key = mu.interface.editor.api_key(['foo', 'bar'])
+    assert key == mu.interface.editor.api_key(['foo', 'bar'])
+    assert key != mu.interface.editor.api_key(['bar', 'foo'])
+    assert key != mu.interface.editor.api_key(['foobar'])
+
+
+def test_get_api_prepares_once():
+    """
+    An API database is built, prepared and saved the first time its
+    definitions are seen and then shared.
+    """
+    mock_api = mock.MagicMock()
+    mock_api.isPrepared.return_value = False
+    mock_api.savePrepared.return_value = True
+    with mock.patch('mu.interface.editor.API_DATABASES', {}), \
+            mock.patch('mu.interface.editor.QsciAPIs',
+                       return_value=mock_api) as mock_qsciapis, \
+            mock.patch('mu.interface.editor.DATA_DIR', 'data'):
+        api = mu.interface.editor.get_api(['foo', 'bar'])
+        assert mu.interface.editor.get_api(['foo', 'bar']) == api
+    assert api == mock_api
+    assert mock_qsciapis.call_count == 1
+    assert mock_api.add.call_args_list == [mock.call('foo'),
+                                           mock.call('bar')]
+    mock_api.prepare.assert_called_once_with()
+    on_prepared = mock_api.apiPreparationFinished.connect.call_args[0][0]
+    on_prepared()
+    key = mu.interface.editor.api_key(['foo', 'bar'])
+    mock_api.savePrepared.assert_called_once_with(
+        os.path.join('data', 'api-{}.pap'.format(key)))
+
+
+def test_get_api_save_fails():
+    """
+    Failing to save the prepared database is logged.
+    """
+    mock_api = mock.MagicMock()
+    mock_api.isPrepared.return_value = False
+    mock_api.savePrepared.return_value = False
+    with mock.patch('mu.interface.editor.API_DATABASES', {}), \
+            mock.patch('mu.interface.editor.QsciAPIs',
+                       return_value=mock_api), \
+            mock.patch('mu.interface.editor.logger') as mock_logger:
+        mu.interface.editor.get_api(['foo'])
+        on_prepared = mock_api.apiPreparationFinished.connect.call_args[0][0]
+        on_prepared()
+    assert mock_logger.warning.call_count == 1
+
+
+def test_get_api_loads_prepared():
+    """
+    A database prepared by a previous session is loaded rather than built.
+    """
+    mock_api = mock.MagicMock()
+    mock_api.isPrepared.return_value = True
+    mock_api.loadPrepared.return_value = True
+    with mock.patch('mu.interface.editor.API_DATABASES', {}), \
+            mock.patch('mu.interface.editor.QsciAPIs',
+                       return_value=mock_api):
+        mu.interface.editor.get_api(['foo'])
+    assert mock_api.loadPrepared.call_count == 1
+    assert mock_api.add.call_count == 0
+    assert mock_api.prepare.call_count == 0
 
 
 def test_EditorPane_label():
@@ -336,6 +409,123 @@ def test_EditorPane_find_next_match():
                                          show=False, posix=False)
 
 
+def test_search_pattern():
+    """
+    The target is escaped unless it's a regular expression.
+    """
+    assert mu.interface.editor.search_pattern('a.b').findall('a.b axb') == \
+        ['a.b']
+    assert mu.interface.editor.search_pattern('a.b', True).findall(
+        'a.b axb') == ['a.b', 'axb']
+
+
+def test_EditorPane_count_matches():
+    """
+    Matches are counted in the text, with None for an invalid regular
+    expression.
+    """
+    ep = mu.interface.editor.EditorPane(None, 'foo\nfood\nfo(o)')
+    assert ep.count_matches('foo') == 2
+    assert ep.count_matches('fo+', True) == 3
+    assert ep.count_matches('') == 0
+    assert ep.count_matches('fo(o', True) is None
+
+
+def test_EditorPane_replace_all():
+    """
+    All the matches are replaced by a single edit which is undone in one go,
+    leaving the cursor and breakpoints where they were.
+    """
+    text = 'x = 1  # \u00e9\nprint(x)\ny = x\n'
+    ep = mu.interface.editor.EditorPane(None, text)
+    ep.breakpoint_handles = {ep.markerAdd(1, ep.BREAKPOINT_MARKER),
+                             ep.markerAdd(2, ep.BREAKPOINT_MARKER)}
+    ep.setCursorPosition(2, 1)
+    assert ep.replace_all('x', 'value') == 3
+    assert ep.text() == ('value = 1  # \u00e9\nprint(value)\n'
+                         'y = value\n')
+    assert ep.getCursorPosition() == (2, 1)
+    assert sorted(ep.markerLine(h) for h in ep.breakpoint_handles) == [1, 2]
+    ep.undo()
+    assert ep.text() == text
+    assert not ep.isUndoAvailable()
+
+
+def test_EditorPane_replace_all_regex():
+    """
+    Regular expression replacements may refer to groups in the match, and an
+    invalid regular expression is an error.
+    """
+    ep = mu.interface.editor.EditorPane(None, 'foo(1)\nbar(22)\n')
+    assert ep.replace_all(r'(\w+)\((\d+)\)', r'\2:\1', True) == 2
+    assert ep.text() == '1:foo\n22:bar\n'
+    with pytest.raises(re.error):
+        ep.replace_all('(', 'x', True)
+
+
+def test_EditorPane_replace_all_nothing_to_do():
+    """
+    Nothing is changed if there's no match or the editor is read only.
+    """
+    ep = mu.interface.editor.EditorPane(None, 'foo')
+    assert ep.replace_all('bar', 'baz') == 0
+    assert not ep.isUndoAvailable()
+    ep.setReadOnly(True)
+    assert ep.replace_all('foo', 'baz') == 0
+    assert ep.text() == 'foo'
+
+
+def test_EditorPane_find_match():
+    """
+    The match after the cursor is selected, wrapping round to the start,
+    with the same regular expression syntax as count_matches.
+    """
+    ep = mu.interface.editor.EditorPane(None,
+                                        'color colour\ncat, dog caf\u00e9')
+    assert ep.count_matches('cat|dog', True) == 2
+    assert ep.find_match('cat|dog', True).group() == 'cat'
+    assert ep.selectedText() == 'cat'
+    assert ep.find_match('cat|dog', True).group() == 'dog'
+    assert ep.find_match('cat|dog', True).group() == 'cat'
+    assert ep.find_match('cat|dog') is None
+    assert ep.find_match('caf\u00e9').group() == 'caf\u00e9'
+    assert ep.selectedText() == 'caf\u00e9'
+    assert ep.find_match(r'colou?r', True).start() == 0
+    assert ep.find_match('') is None
+    with pytest.raises(re.error):
+        ep.find_match('(', True)
+
+
+def test_EditorPane_find_match_empty():
+    """
+    An empty match at the cursor is passed over, so finding it again moves
+    on to the next one.
+    """
+    ep = mu.interface.editor.EditorPane(None, 'a\nb')
+    ep.setCursorPosition(0, 1)
+    assert ep.find_match('^', True).start() == 2
+    assert ep.find_match('^', True).start() == 0
+    assert ep.find_match('^', True).start() == 2
+
+
+def test_EditorPane_replace_match():
+    """
+    The next match is replaced, and a regular expression's replacement may
+    refer to its groups.
+    """
+    ep = mu.interface.editor.EditorPane(None, 'foo(1)\nbar(22)\n')
+    assert ep.replace_match(r'(\w+)\((\d+)\)', r'\2:\1', True) == 1
+    assert ep.text() == '1:foo\nbar(22)\n'
+    assert ep.replace_match(r'(\w+)\((\d+)\)', r'\2:\1', True) == 1
+    assert ep.text() == '1:foo\n22:bar\n'
+    assert ep.replace_match('foo', r'\1') == 1
+    assert ep.text() == '1:\\1\n22:bar\n'
+    assert ep.replace_match('baz', 'x') == 0
+    ep.setReadOnly(True)
+    assert ep.replace_match('bar', 'x') == 0
+    assert ep.text() == '1:\\1\n22:bar\n'
+
+
 def _ranges_in_text(text, search_for):
     """Find any instances of `search_for` inside text and return the equivalent
     Scintilla Ranges of (line_start, column_start, line_end, column_end).
@@ -490,6 +680,112 @@ def test_EditorPane_highlight_selected_matches_cursor_remains():
     assert ep.getCursorPosition() == (line1, index1 - select_n_chars)
 
 
+def test_EditorPane_highlight_selected_matches_not_regex():
+    """
+    Ensure the selected word is matched as a whole word, rather than used as a
+    regular expression that matches parts of other words.
+    """
+    text = "foo foobar barfoo foo"
+    ep = mu.interface.editor.EditorPane(None, text)
+    ep.setSelection(0, 0, 0, 3)
+    assert ep.search_indicators['selection']['positions'] == [
+        {'line_start': 0, 'col_start': 18, 'line_end': 0, 'col_end': 21},
+    ]
+
+
+def test_EditorPane_highlight_visible_matches_only_viewport():
+    """
+    Only matches in the lines visible in the editor are highlighted, and they
+    are only highlighted once.
+    """
+    ep = mu.interface.editor.EditorPane(None, 'foo\n' * 100)
+    ep.highlighted_word = 'foo'
+    ep.highlighted_range = (0, 0, 0, 3)
+    ep.visible_lines = mock.MagicMock(return_value=(0, 9))
+    ep.fillIndicatorRange = mock.MagicMock()
+    ep.highlight_visible_matches()
+    assert ep.fillIndicatorRange.call_count == 9
+    ep.visible_lines.return_value = (5, 14)
+    ep.highlight_visible_matches()
+    assert ep.fillIndicatorRange.call_count == 14
+    positions = ep.search_indicators['selection']['positions']
+    assert [p['line_start'] for p in positions] == list(range(1, 15))
+    ep.reset_search_indicators()
+    assert ep.highlighted_word is None
+    assert ep.highlighted_lines == set()
+
+
+def test_EditorPane_highlight_visible_matches_no_word():
+    """
+    If no word is highlighted, there's nothing to look up.
+    """
+    ep = mu.interface.editor.EditorPane(None, 'foo')
+    ep.visible_lines = mock.MagicMock()
+    ep.highlight_visible_matches()
+    assert ep.visible_lines.call_count == 0
+
+
+def test_EditorPane_on_modified():
+    """
+    Ensure the word index is kept up to date as the text is edited.
+    """
+    ep = mu.interface.editor.EditorPane(None, 'foo bar\nbaz\n')
+    ep.insertAt('qux\nquux ', 1, 0)
+    ep.setSelection(0, 4, 0, 7)
+    ep.removeSelectedText()
+    expected = mu.interface.editor.WordIndex(ep.text()).lines
+    assert ep.word_index.lines == expected
+    assert ep.word_index.lines[1] == {'qux': [0]}
+
+
+def test_EditorPane_on_modified_ignores_other_changes():
+    """
+    Changes other than to the text (e.g. styling) don't touch the index.
+    """
+    ep = mu.interface.editor.EditorPane(None, 'foo')
+    ep.word_index = mock.MagicMock()
+    ep.on_modified(0, mu.interface.editor.QsciScintilla.SC_MOD_CHANGESTYLE,
+                   None, 3, 0)
+    assert ep.word_index.update.call_count == 0
+
+
+def test_EditorPane_on_update_ui():
+    """
+    Matches are highlighted when the editor scrolls vertically.
+    """
+    ep = mu.interface.editor.EditorPane(None, 'foo')
+    ep.highlight_visible_matches = mock.MagicMock()
+    ep.on_update_ui(mu.interface.editor.QsciScintilla.SC_UPDATE_SELECTION)
+    assert ep.highlight_visible_matches.call_count == 0
+    ep.on_update_ui(mu.interface.editor.QsciScintilla.SC_UPDATE_V_SCROLL)
+    assert ep.highlight_visible_matches.call_count == 1
+
+
+def test_WordIndex():
+    """
+    Ensure the words in each line, and where they start, are indexed.
+    """
+    index = mu.interface.editor.WordIndex('foo bar foo\r\n\nbaz(foo)')
+    assert index.lines == [{'foo': [0, 8], 'bar': [4]}, {},
+                           {'baz': [0], 'foo': [4]}]
+    assert list(index.find('foo')) == [(0, 0, 0, 3), (0, 8, 0, 11),
+                                       (2, 4, 2, 7)]
+    assert list(index.find('foo', 1, 1)) == []
+    assert list(index.find('foo', -5, 100)) == list(index.find('foo'))
+
+
+def test_WordIndex_update():
+    """
+    Ensure lines are replaced by the newly indexed lines.
+    """
+    index = mu.interface.editor.WordIndex('a\nb\nc')
+    index.update(1, 1, ['x y', 'z'])
+    assert index.lines == [{'a': [0]}, {'x': [0], 'y': [2]}, {'z': [0]},
+                           {'c': [0]}]
+    index.update(0, 3, [''])
+    assert index.lines == [{}, {'c': [0]}]
+
+
 def test_EditorPane_selection_change_listener():
     """
     Enusure that is there is a change to the selected text then controll is
@@ -662,3 +958,75 @@ def test_EditorPane_toggle_comments_selected_hash_space_comment_lines():
     ep.toggle_comments()
     ep.replaceSelectedText.assert_called_once_with('foo\nbar\nbaz')
     ep.setSelection.assert_called_once_with(0, 0, 2, 2)
+
+
+def test_split_chunks():
+    """
+    Chunks double in size up to the maximum and add up to the text.
+    """
+    text = 'a' * 100
+    chunks = list(mu.interface.editor.split_chunks(text, 5, 20))
+    assert [len(c) for c in chunks] == [5, 10, 20, 20, 20, 20, 5]
+    assert ''.join(chunks) == text
+    assert list(mu.interface.editor.split_chunks('', 5)) == []
+
+
+def test_EditorPane_large_file():
+    """
+    Large files are loaded a chunk at a time into a read-only editor without
+    a lexer, autocompletion or highlighting of matches.
+    """
+    text = 'x = 1\n' * 10
+    with mock.patch('mu.interface.editor.LARGE_FILE_SIZE', 20), \
+            mock.patch('mu.interface.editor.LARGE_FILE_CHUNK', 25):
+        ep = mu.interface.editor.EditorPane('/foo/log.txt', text)
+    assert ep.large
+    assert ep.locked
+    assert ep.loading
+    assert ep.isReadOnly()
+    assert ep.text() == text[:25]
+    assert QsciScintilla.lexer(ep) is None
+    assert ep.autoCompletionSource() == QsciScintilla.AcsNone
+    ep.set_api(['foo'])
+    assert ep.api is None
+    while ep.loading:
+        ep.load_next_chunk()
+    assert not ep.chunk_timer.isActive()
+    assert ep.text() == text
+    assert ep.isReadOnly()
+    assert not ep.isModified()
+    assert not ep.isUndoAvailable()
+    assert ep.word_index.lines == [{}]
+    with mock.patch.object(ep, 'highlight_selected_matches') as mock_hsm:
+        ep.setSelection(0, 0, 0, 1)
+    assert mock_hsm.call_count == 0
+
+
+def test_EditorPane_large_file_set_theme():
+    """
+    Large files just get the theme's default colours.
+    """
+    with mock.patch('mu.interface.editor.LARGE_FILE_SIZE', 1):
+        ep = mu.interface.editor.EditorPane('/foo/log.txt', 'abc')
+    ep.set_theme(mu.interface.themes.NightTheme)
+    assert ep.color().name() == '#dddddd'
+    assert ep.paper().name() == '#222222'
+    assert QsciScintilla.lexer(ep) is None
+
+
+def test_PlaceholderPane():
+    """
+    A placeholder has the label of the file it stands in for, is never
+    modified and ignores the calls made to every tab.
+    """
+    pp = mu.interface.editor.PlaceholderPane('/foo/bar.py')
+    assert pp.path == '/foo/bar.py'
+    assert pp.label == 'bar.py'
+    assert pp.isModified() is False
+    assert pp.breakpoint_handles == set()
+    pp.set_theme()
+    pp.set_api(['api'])
+    pp.setReadOnly(True)
+    pp.reset_annotations()
+    pp.reset_debugger_highlight()
+    pp.setSelection(0, 0, 0, 0)
@@ -2,6 +2,9 @@
 """
 Tests for the user interface elements of Mu.
 """
+import configparser
+import os
+import re
 from PyQt5.QtWidgets import QAction, QWidget, QFileDialog, QMessageBox
 from PyQt5.QtCore import Qt, QSize, QIODevice
 from PyQt5.QtGui import QIcon, QKeySequence
@@ -228,6 +231,42 @@ def test_FileTabs_change_tab_no_tabs():
     mock_window.update_title.assert_called_once_with(None)
 
 
+def test_FileTabs_change_tab_placeholder():
+    """
+    When a placeholder tab is selected, loading its file is scheduled for
+    once the tab change has been handled.
+    """
+    qtw = mu.interface.main.FileTabs()
+    placeholder = mu.interface.editor.PlaceholderPane('/foo/bar.py')
+    qtw.widget = mock.MagicMock(return_value=placeholder)
+    qtw.load_placeholder = mock.MagicMock()
+    qtw.nativeParentWidget = mock.MagicMock()
+    with mock.patch('mu.interface.main.QTimer') as mock_timer:
+        qtw.change_tab(0)
+    assert mock_timer.singleShot.call_count == 1
+    delay, callback = mock_timer.singleShot.call_args[0]
+    assert delay == 0
+    callback()
+    qtw.load_placeholder.assert_called_once_with(placeholder)
+
+
+def test_FileTabs_load_placeholder():
+    """
+    The placeholder's file is loaded in the background only if its tab is
+    still the current one.
+    """
+    qtw = mu.interface.main.FileTabs()
+    placeholder = mu.interface.editor.PlaceholderPane('/foo/bar.py')
+    mock_window = mock.MagicMock()
+    qtw.nativeParentWidget = mock.MagicMock(return_value=mock_window)
+    qtw.currentWidget = mock.MagicMock(return_value=None)
+    qtw.load_placeholder(placeholder)
+    assert mock_window.load_tab.emit.call_count == 0
+    qtw.currentWidget = mock.MagicMock(return_value=placeholder)
+    qtw.load_placeholder(placeholder)
+    mock_window.load_tab.emit.assert_called_once_with('/foo/bar.py', False)
+
+
 def test_Window_attributes():
     """
     Expect the title and icon to be set correctly.
@@ -356,6 +395,36 @@ def test_Window_current_tab():
     assert w.current_tab == 'foo'
 
 
+def test_Window_current_tab_placeholder():
+    """
+    If the current tab is a placeholder, its file is loaded (blocking) and the
+    resulting editor returned.
+    """
+    w = mu.interface.main.Window()
+    placeholder = mu.interface.editor.PlaceholderPane('/foo/bar.py')
+    editor = mock.MagicMock()
+    w.tabs = mock.MagicMock()
+    w.tabs.currentWidget = mock.MagicMock(return_value=placeholder)
+
+    def load_tab(path, wait):
+        assert (path, wait) == ('/foo/bar.py', True)
+        w.tabs.currentWidget.return_value = editor
+
+    w.load_tab.connect(load_tab)
+    assert w.current_tab == editor
+
+
+def test_Window_current_tab_placeholder_not_loaded():
+    """
+    If nothing loads the placeholder, it is returned rather than looping.
+    """
+    w = mu.interface.main.Window()
+    placeholder = mu.interface.editor.PlaceholderPane('/foo/bar.py')
+    w.tabs = mock.MagicMock()
+    w.tabs.currentWidget = mock.MagicMock(return_value=placeholder)
+    assert w.current_tab == placeholder
+
+
 def test_Window_set_read_only():
     """
     Ensure all the tabs have the setReadOnly method set to the boolean passed
@@ -373,6 +442,41 @@ def test_Window_set_read_only():
     tab2.setReadOnly.assert_called_once_with(True)
 
 
+def test_Window_set_read_only_large_file():
+    """
+    Large files stay read-only, until they're unlocked, when the other tabs
+    are made editable.
+    """
+    w = mu.interface.main.Window()
+    w.tabs = mock.MagicMock()
+    w.tabs.count = mock.MagicMock(return_value=2)
+    tab1 = mock.MagicMock()
+    tab1.locked = False
+    tab2 = mock.MagicMock()
+    tab2.locked = True
+    w.tabs.widget = mock.MagicMock(side_effect=[tab1, tab2])
+    w.set_read_only(False)
+    tab1.setReadOnly.assert_called_once_with(False)
+    tab2.setReadOnly.assert_called_once_with(True)
+
+
+def test_Window_unlock_tab():
+    """
+    An unlocked tab is editable, unless all the tabs are read-only (e.g.
+    while a script runs), in which case it's editable once they aren't.
+    """
+    w = mu.interface.main.Window()
+    tab = mock.MagicMock()
+    tab.locked = True
+    w.read_only_tabs = True
+    w.unlock_tab(tab)
+    assert tab.locked is False
+    tab.setReadOnly.assert_called_once_with(True)
+    w.read_only_tabs = False
+    w.unlock_tab(tab)
+    tab.setReadOnly.assert_called_with(False)
+
+
 def test_Window_get_load_path():
     """
     Ensure the QFileDialog is called with the expected arguments and the
@@ -471,6 +575,58 @@ def test_Window_add_tab():
     w.tabs.setTabText.assert_called_once_with(new_tab_index, ep.label)
 
 
+def test_Window_add_placeholder_tab():
+    """
+    A placeholder tab is added without being focussed.
+    """
+    w = mu.interface.main.Window()
+    w.tabs = mock.MagicMock()
+    placeholder = w.add_placeholder_tab('/foo/bar.py')
+    assert isinstance(placeholder, mu.interface.editor.PlaceholderPane)
+    assert placeholder.path == '/foo/bar.py'
+    w.tabs.addTab.assert_called_once_with(placeholder, 'bar.py')
+    assert w.tabs.setCurrentIndex.call_count == 0
+
+
+def test_Window_replace_placeholder():
+    """
+    The placeholder is swapped for an editor at the same position, which
+    becomes the current tab if the placeholder was.
+    """
+    w = mu.interface.main.Window()
+    w.tabs = mu.interface.main.FileTabs()
+    w.tabs.currentChanged.disconnect()
+    w.read_only_tabs = True
+    w.breakpoint_toggle = mock.MagicMock()
+    w.tabs.addTab(mu.interface.editor.PlaceholderPane('/foo/a.py'), 'a.py')
+    w.add_placeholder_tab('/foo/b.py')
+    w.tabs.setCurrentIndex(1)
+    tab = w.replace_placeholder('/foo/b.py', 'baz', ['api'], '\n')
+    assert isinstance(tab, mu.interface.editor.EditorPane)
+    assert w.widgets[1] == tab
+    assert w.tab_count == 2
+    assert w.tabs.currentWidget() == tab
+    assert tab.text() == 'baz'
+    assert tab.isReadOnly()
+    assert w.replace_placeholder('/foo/b.py', 'baz', ['api'], '\n') is None
+
+
+def test_Window_remove_placeholder():
+    """
+    The placeholder tab for the path is closed without confirmation.
+    """
+    w = mu.interface.main.Window()
+    w.tabs = mu.interface.main.FileTabs()
+    w.tabs.currentChanged.disconnect()
+    w.show_confirmation = mock.MagicMock()
+    w.add_placeholder_tab('/foo/bar.py')
+    w.remove_placeholder('/foo/baz.py')
+    assert w.tab_count == 1
+    w.remove_placeholder('/foo/bar.py')
+    assert w.tab_count == 0
+    assert w.show_confirmation.call_count == 0
+
+
 def test_Window_focus_tab():
     """
     Given a tab instance, ensure it has focus.
@@ -683,6 +839,22 @@ def test_Window_add_filesystem_open_signal():
     mock_open_emit.assert_called_once_with('test')
 
 
+def test_Window_add_device_output():
+    """
+    A read only REPL pane with no serial connection of its own is added to
+    show the output of a program running on a device.
+    """
+    w = mu.interface.main.Window()
+    w.add_repl = mock.MagicMock()
+    mock_repl = mock.MagicMock()
+    mock_repl_class = mock.MagicMock(return_value=mock_repl)
+    with mock.patch('mu.interface.main.MicroPythonREPLPane', mock_repl_class):
+        w.add_device_output('mPython')
+    mock_repl_class.assert_called_once_with(serial=None)
+    mock_repl.setReadOnly.assert_called_once_with(True)
+    w.add_repl.assert_called_once_with(mock_repl, 'mPython')
+
+
 def test_Window_add_micropython_repl():
     """
     Ensure the expected object is instantiated and add_repl is called for a
@@ -841,6 +1013,25 @@ def test_Window_add_plotter():
     w.addDockWidget.assert_called_once_with(Qt.BottomDockWidgetArea, mock_dock)
 
 
+def test_Window_add_mpython_display():
+    """
+    Ensure the emulated mPython board's display is shown in a pane reading
+    the given state file.
+    """
+    w = mu.interface.main.Window()
+    w.addDockWidget = mock.MagicMock()
+    mock_dock = mock.MagicMock()
+    mock_dock_class = mock.MagicMock(return_value=mock_dock)
+    with mock.patch('mu.interface.main.QDockWidget', mock_dock_class), \
+            mock.patch('mu.interface.main.MPythonDisplayPane') as mock_pane:
+        result = w.add_mpython_display('state')
+    mock_pane.assert_called_once_with('state')
+    assert result == w.emulator_pane == mock_pane.return_value
+    assert w.emulator == mock_dock
+    mock_dock.setWidget.assert_called_once_with(w.emulator_pane)
+    w.addDockWidget.assert_called_once_with(Qt.RightDockWidgetArea, mock_dock)
+
+
 def test_Window_add_python3_runner():
     """
     Ensure a Python 3 runner (to capture stdin/out/err) is displayed correctly.
@@ -1021,6 +1212,22 @@ def test_Window_remove_plotter_active_repl():
     assert w.serial
 
 
+def test_Window_remove_mpython_display():
+    """
+    Check all the necessary calls to remove the emulated mPython board's
+    display are made.
+    """
+    w = mu.interface.main.Window()
+    mock_emulator = mock.MagicMock()
+    w.emulator = mock_emulator
+    w.emulator_pane = mock.MagicMock()
+    w.remove_mpython_display()
+    mock_emulator.setParent.assert_called_once_with(None)
+    mock_emulator.deleteLater.assert_called_once_with()
+    assert w.emulator is None
+    assert w.emulator_pane is None
+
+
 def test_Window_remove_python_runner():
     """
     Check all the necessary calls to remove / reset the Python3 runner are
@@ -1538,16 +1745,21 @@ def test_Window_show_find_replace():
     successfully closed, returns the expected result.
     """
     window = mu.interface.main.Window()
+    window.tabs = mock.MagicMock()
+    mock_tab = mock.MagicMock()
+    window.tabs.currentWidget.return_value = mock_tab
     mock_dialog = mock.MagicMock()
     mock_dialog.find.return_value = 'foo'
     mock_dialog.replace.return_value = 'bar'
     mock_dialog.replace_flag.return_value = True
+    mock_dialog.regex_flag.return_value = False
     mock_FRDialog = mock.MagicMock(return_value=mock_dialog)
     mock_FRDialog.exec.return_value = True
     with mock.patch('mu.interface.main.FindReplaceDialog', mock_FRDialog):
         result = window.show_find_replace('', '', False)
-    mock_dialog.setup.assert_called_once_with('', '', False)
-    assert result == ('foo', 'bar', True)
+    mock_dialog.setup.assert_called_once_with('', '', False, False,
+                                              mock_tab.count_matches)
+    assert result == ('foo', 'bar', True, False)
 
 
 def test_Window_replace_text_not_current_tab():
@@ -1570,9 +1782,9 @@ def test_Window_replace_text_not_global_found():
     mock_tab = mock.MagicMock()
     w.tabs = mock.MagicMock()
     w.tabs.currentWidget.return_value = mock_tab
-    mock_tab.findFirst.return_value = True
+    mock_tab.replace_match.return_value = 1
     assert w.replace_text('foo', 'bar', False) == 1
-    mock_tab.replace.assert_called_once_with('bar')
+    mock_tab.replace_match.assert_called_once_with('foo', 'bar', False)
 
 
 def test_Window_replace_text_not_global_missing():
@@ -1582,26 +1794,42 @@ def test_Window_replace_text_not_global_missing():
     """
     w = mu.interface.main.Window()
     mock_tab = mock.MagicMock()
-    mock_tab.findFirst.return_value = False
+    mock_tab.replace_match.return_value = 0
     w.tabs = mock.MagicMock()
     w.tabs.currentWidget.return_value = mock_tab
     assert w.replace_text('foo', 'bar', False) == 0
 
 
+def test_Window_replace_text_not_global_regex():
+    """
+    A single replacement of a regular expression uses the same syntax as
+    replacing them all, and an invalid one replaces nothing.
+    """
+    w = mu.interface.main.Window()
+    mock_tab = mock.MagicMock()
+    w.tabs = mock.MagicMock()
+    w.tabs.currentWidget.return_value = mock_tab
+    mock_tab.replace_match.return_value = 1
+    assert w.replace_text('fo+', 'bar', False, True) == 1
+    mock_tab.replace_match.assert_called_once_with('fo+', 'bar', True)
+    mock_tab.replace_match.side_effect = re.error('bad')
+    assert w.replace_text('(foo', 'bar', False, True) == 0
+
+
 def test_Window_replace_text_global_found():
     """
     If the text to be replaced is found several times in the source, and the
     global_replace flag is true, return X (to indicate X changes made) -- where
-    X is some integer.
+    X is some integer. All the matches are replaced by the tab in one go.
     """
     w = mu.interface.main.Window()
     mock_tab = mock.MagicMock()
-    mock_tab.findFirst.return_value = True
-    mock_tab.findNext.side_effect = [True, False, ]
+    mock_tab.replace_all.return_value = 2
     w.tabs = mock.MagicMock()
     w.tabs.currentWidget.return_value = mock_tab
     assert w.replace_text('foo', 'bar', True) == 2
-    assert mock_tab.replace.call_count == 2
+    mock_tab.replace_all.assert_called_once_with('foo', 'bar', False)
+    assert mock_tab.findNext.call_count == 0
 
 
 def test_Window_replace_text_global_missing():
@@ -1611,24 +1839,43 @@ def test_Window_replace_text_global_missing():
     """
     w = mu.interface.main.Window()
     mock_tab = mock.MagicMock()
-    mock_tab.findFirst.return_value = False
+    mock_tab.replace_all.return_value = 0
     w.tabs = mock.MagicMock()
     w.tabs.currentWidget.return_value = mock_tab
     assert w.replace_text('foo', 'bar', True) == 0
 
 
+def test_Window_replace_text_global_invalid_regex():
+    """
+    An invalid regular expression replaces nothing.
+    """
+    w = mu.interface.main.Window()
+    mock_tab = mock.MagicMock()
+    mock_tab.replace_all.side_effect = re.error('bad')
+    w.tabs = mock.MagicMock()
+    w.tabs.currentWidget.return_value = mock_tab
+    assert w.replace_text('(foo', 'bar', True, True) == 0
+
+
 def test_Window_highlight_text():
     """
-    Given target_text, highlights the first instance via Scintilla's findFirst
-    method.
+    Given target_text, highlights the first instance via the tab's find_match
+    method. The text is only treated as a regular expression if asked, and
+    an invalid one matches nothing.
     """
     w = mu.interface.main.Window()
     mock_tab = mock.MagicMock()
-    mock_tab.findFirst.return_value = True
     w.tabs = mock.MagicMock()
     w.tabs.currentWidget.return_value = mock_tab
     assert w.highlight_text('foo')
-    mock_tab.findFirst.assert_called_once_with('foo', True, True, False, True)
+    mock_tab.find_match.assert_called_once_with('foo', False)
+    mock_tab.find_match.reset_mock()
+    assert w.highlight_text('fo+', True)
+    mock_tab.find_match.assert_called_once_with('fo+', True)
+    mock_tab.find_match.return_value = None
+    assert w.highlight_text('bar') is False
+    mock_tab.find_match.side_effect = re.error('bad')
+    assert w.highlight_text('(foo', True) is False
 
 
 def test_Window_highlight_text_no_tab():
@@ -1660,6 +1907,25 @@ def test_Window_connect_toggle_comments():
     shortcut.activated.connect.assert_called_once_with(mock_handler)
 
 
+def test_Window_connect_unlock_tab():
+    """
+    Ensure the passed in handler is connected to a shortcut triggered by the
+    shortcut.
+    """
+    window = mu.interface.main.Window()
+    mock_handler = mock.MagicMock()
+    mock_shortcut = mock.MagicMock()
+    mock_sequence = mock.MagicMock()
+    with mock.patch('mu.interface.main.QShortcut', mock_shortcut), \
+            mock.patch('mu.interface.main.QKeySequence', mock_sequence):
+        window.connect_unlock_tab(mock_handler, 'Ctrl+Shift+E')
+    mock_sequence.assert_called_once_with('Ctrl+Shift+E')
+    ks = mock_sequence('Ctrl+Shift+E')
+    mock_shortcut.assert_called_once_with(ks, window)
+    shortcut = mock_shortcut(ks, window)
+    shortcut.activated.connect.assert_called_once_with(mock_handler)
+
+
 def test_Window_toggle_comments():
     """
     If there's a current tab, call its toggle_comments method.
@@ -1672,6 +1938,34 @@ def test_Window_toggle_comments():
     mock_tab.toggle_comments.assert_called_once_with()
 
 
+def test_Window_update_pylib():
+    """
+    The library is already in place, so just say so.
+    """
+    w = mu.interface.main.Window()
+    w.status_bar = mock.MagicMock()
+    w.update_pylib('/config/mpython.py')
+    assert w.status_bar.set_message.call_count == 1
+
+
+def test_Window_update_bin(tmpdir):
+    """
+    The firmware is already in place, so record its version in mpython.ini
+    next to it.
+    """
+    w = mu.interface.main.Window()
+    w.status_bar = mock.MagicMock()
+    path = os.path.join(str(tmpdir), 'target.bin')
+    w.update_bin('MicroPython v1.0 on 2018-01-01', path)
+    cf = configparser.ConfigParser()
+    cf.read(os.path.join(str(tmpdir), 'mpython.ini'))
+    assert cf.get('firmware', 'version') == 'MicroPython v1.0 on 2018-01-01'
+    assert cf.get('firmware', 'date') == '2018-01-01'
+    assert cf.get('firmware', 'ignore') == '0'
+    assert w.update_bin_status
+    assert w.status_bar.set_message.call_count == 1
+
+
 def test_StatusBar_init():
     """
     Ensure the status bar is set up as expected.
@@ -13,7 +13,9 @@ import signal
 import mu
 import platform
 from collections import deque
+import mu.emulator
 import mu.interface.panes
+import mu.telemetry
 
 # Required so the QWidget tests don't abort with the message:
 # "QWidget: Must construct a QApplication before a QWidget"
@@ -162,6 +164,20 @@ def test_MicroPythonREPLPane_keyPressEvent():
     mock_serial.write.assert_called_once_with(bytes('a', 'utf-8'))
 
 
+def test_MicroPythonREPLPane_keyPressEvent_no_serial():
+    """
+    Key presses (and pastes) are ignored by a REPL pane with no serial
+    connection, which only shows output.
+    """
+    rp = mu.interface.panes.MicroPythonREPLPane(None)
+    data = mock.MagicMock()
+    data.key = mock.MagicMock(return_value=Qt.Key_A)
+    data.text = mock.MagicMock(return_value='a')
+    data.modifiers = mock.MagicMock(return_value=None)
+    rp.keyPressEvent(data)
+    rp.paste()
+
+
 def test_MicroPythonREPLPane_keyPressEvent_backspace():
     """
     Ensure backspaces in the REPL are handled correctly.
@@ -357,6 +373,39 @@ def test_MicroPythonREPLPane_process_bytes():
     rp.ensureCursorVisible.assert_called_once_with()
 
 
+def test_MicroPythonREPLPane_process_bytes_telemetry():
+    """
+    Binary telemetry frames meant for the plotter aren't shown in the REPL.
+    """
+    rp = mu.interface.panes.MicroPythonREPLPane(mock.MagicMock())
+    rp.insertPlainText = mock.MagicMock(return_value=None)
+    frame = mu.telemetry.encode([(1, 2)])
+    rp.process_bytes(b'A' + frame + b'B')
+    assert rp.insertPlainText.call_args_list == [mock.call('A'),
+                                                 mock.call('B')]
+
+
+def test_MicroPythonREPLPane_process_bytes_pending():
+    """
+    What looks like the start of a frame is held back, but shown if no more
+    of it arrives, and the REPL carries on as usual.
+    """
+    rp = mu.interface.panes.MicroPythonREPLPane(mock.MagicMock())
+    rp.insertPlainText = mock.MagicMock(return_value=None)
+    rp.process_bytes(b'>>> \xff\x55h\xff\xff')
+    assert rp.pending_timer.isActive()
+    rp.process_bytes(b'x')
+    assert rp.insertPlainText.call_args_list == [mock.call(c) for c in '>>> ']
+    rp.pending_timer.timeout.emit()
+    shown = ''.join(c[0][0] for c in rp.insertPlainText.call_args_list)
+    assert shown == '>>> \xff\x55h\xff\xffx'
+    assert not rp.pending_timer.isActive()
+    rp.process_bytes(b'y')
+    assert shown + 'y' == ''.join(c[0][0] for c in
+                                  rp.insertPlainText.call_args_list)
+    assert not rp.pending_timer.isActive()
+
+
 def test_MicroPythonREPLPane_process_bytes_VT100():
     """
     Ensure bytes coming from the device to the application are processed as
@@ -2030,6 +2079,71 @@ def test_PlotterPane_process_bytes_overrun_input_buffer():
     pp.add_data.assert_called_once_with((1, 2.3, 4))
 
 
+def test_PlotterPane_process_bytes_telemetry():
+    """
+    The samples in binary telemetry frames are added to the plotter all at
+    once, and text tuples mixed in with them are still found.
+    """
+    pp = mu.interface.panes.PlotterPane()
+    pp.add_data = mock.MagicMock()
+    pp.add_samples = mock.MagicMock()
+    frames = mu.telemetry.encode([(1, 2), (3, 4)])
+    pp.process_bytes(b'(5, 6)\r\n' + frames + b'(7, 8)\r\n')
+    pp.add_samples.assert_called_once_with([(1, 2), (3, 4)])
+    assert pp.add_data.call_args_list == [mock.call((5, 6)),
+                                          mock.call((7, 8))]
+
+
+def test_PlotterPane_process_bytes_telemetry_split():
+    """
+    A frame split between reads is decoded once all of it has arrived.
+    """
+    pp = mu.interface.panes.PlotterPane()
+    pp.add_samples = mock.MagicMock()
+    frame = mu.telemetry.encode([(1.5, )], 'f')
+    pp.process_bytes(frame[:7])
+    assert pp.add_samples.call_count == 0
+    pp.process_bytes(frame[7:])
+    pp.add_samples.assert_called_once_with([(1.5, )])
+
+
+def test_PlotterPane_process_bytes_pending():
+    """
+    What looks like the start of a frame (such as garbage printed as a board
+    boots) holds back the tuples after it only until no more of it arrives.
+    """
+    pp = mu.interface.panes.PlotterPane()
+    pp.add_data = mock.MagicMock()
+    pp.add_samples = mock.MagicMock()
+    pp.process_bytes(b'\xff\x55h\xff\xff\r\n(1, 2)\r\n')
+    assert pp.pending_timer.isActive()
+    pp.process_bytes(b'(3, 4)\r\n')
+    assert pp.add_data.call_count == 0
+    pp.pending_timer.timeout.emit()
+    assert pp.add_data.call_args_list == [mock.call((1, 2)),
+                                          mock.call((3, 4))]
+    assert pp.add_samples.call_count == 0
+    assert not pp.pending_timer.isActive()
+    pp.process_bytes(b'(5, 6)\r\n')
+    assert pp.add_data.call_args_list[-1] == mock.call((5, 6))
+    assert not pp.pending_timer.isActive()
+
+
+def test_PlotterPane_process_bytes_telemetry_not_a_flood():
+    """
+    Lots of data in binary telemetry frames doesn't count as a data flood,
+    since it's cheap to decode.
+    """
+    pp = mu.interface.panes.PlotterPane()
+    pp.data_flood = mock.MagicMock()
+    pp.add_samples = mock.MagicMock()
+    samples = [(i, -i) for i in range(500)]
+    pp.process_bytes(mu.telemetry.encode(samples))
+    assert pp.flooded is False
+    assert pp.data_flood.emit.call_count == 0
+    pp.add_samples.assert_called_once_with(samples)
+
+
 def test_PlotterPane_add_data():
     """
     Given a tuple with a single value, ensure it is logged and correctly added
@@ -2046,6 +2160,23 @@ def test_PlotterPane_add_data():
     mock_line_series.append.call_args_list[99][0] == (99, 1)
 
 
+def test_PlotterPane_add_samples():
+    """
+    Given several tuples, ensure they're all logged and added to the chart,
+    which is only redrawn once.
+    """
+    pp = mu.interface.panes.PlotterPane()
+    mock_line_series = mock.MagicMock()
+    pp.series = [mock_line_series, ]
+    pp.add_samples([(1, ), (2, ), (3, )])
+    assert pp.raw_data == [(1, ), (2, ), (3, )]
+    assert list(pp.data[0])[:4] == [3, 2, 1, 0]
+    assert len(pp.data[0]) == pp.max_x
+    mock_line_series.clear.assert_called_once_with()
+    assert mock_line_series.append.call_count == pp.max_x
+    assert pp.max_y == 5
+
+
 def test_PlotterPane_add_data_adjust_values_up():
     """
     If more values than have been encountered before are added to the incoming
@@ -2156,3 +2287,65 @@ def test_PlotterPane_set_theme():
     pp.chart.setTheme.reset_mock()
     pp.set_theme('contrast')
     pp.chart.setTheme.assert_called_once_with(QChart.ChartThemeHighContrast)
+
+
+def test_MPythonDisplayPane_refresh(tmpdir):
+    """
+    What's in the state file is shown: lit pixels are white and the LEDs
+    have their colours.
+    """
+    path = os.path.join(str(tmpdir), 'state')
+    display = bytearray(1024)
+    display[0] = 0x01  # (0, 0)
+    display[128 + 5] = 0x80  # (5, 15)
+    with open(path, 'wb') as state_file:
+        state_file.write(mu.emulator.pack_state(128, 64, display,
+                                                [(255, 0, 0), (0, 0, 9)]))
+    dp = mu.interface.panes.MPythonDisplayPane(path)
+    dp.update = mock.MagicMock()
+    dp.refresh()
+    assert dp.image.pixelColor(0, 0).value() == 255
+    assert dp.image.pixelColor(5, 15).value() == 255
+    assert dp.image.pixelColor(5, 14).value() == 0
+    assert dp.image.pixelColor(1, 0).value() == 0
+    assert dp.leds == [(255, 0, 0), (0, 0, 9)]
+    dp.update.assert_called_once_with()
+    # Nothing's changed, so there's nothing to do.
+    dp.refresh()
+    assert dp.update.call_count == 1
+
+
+def test_MPythonDisplayPane_refresh_no_state(tmpdir):
+    """
+    Until the emulator has written the state file, or if it's not a state
+    file, the display stays blank.
+    """
+    path = os.path.join(str(tmpdir), 'state')
+    dp = mu.interface.panes.MPythonDisplayPane(path)
+    dp.update = mock.MagicMock()
+    dp.refresh()
+    with open(path, 'wb') as state_file:
+        state_file.write(b'\x80\x00\x40')
+    dp.refresh()
+    assert dp.update.call_count == 0
+    assert dp.state is None
+
+
+def test_MPythonDisplayPane_paintEvent():
+    """
+    The display is drawn scaled up as far as it fits, with an LED each
+    side of the middle.
+    """
+    dp = mu.interface.panes.MPythonDisplayPane('state')
+    dp.resize(400, 200)
+    dp.leds = [(1, 2, 3), (4, 5, 6)]
+    mock_painter = mock.MagicMock()
+    with mock.patch('mu.interface.panes.QPainter',
+                    return_value=mock_painter):
+        dp.paintEvent(None)
+    rect, image = mock_painter.drawImage.call_args[0]
+    # Twice the size leaves room for the LEDs underneath, three times doesn't.
+    assert (rect.x(), rect.y(), rect.width(), rect.height()) == \
+        (72, 0, 256, 128)
+    assert image is dp.image
+    assert mock_painter.drawEllipse.call_count == 2
@@ -47,57 +47,32 @@ def test_adafruit_mode_no_charts():
 
 def test_workspace_dir_posix_exists():
     """
-    Simulate being on os.name == 'posix' and a call to "mount" returns a
-    record indicating a connected device.
+    Simulate being on os.name == 'posix' and the mounted volumes include a
+    connected device.
     """
     editor = mock.MagicMock()
     view = mock.MagicMock()
     am = AdafruitMode(editor, view)
-    with open('tests/modes/mount_exists.txt', 'rb') as fixture_file:
-        fixture = fixture_file.read()
-        with mock.patch('os.name', 'posix'):
-            with mock.patch('mu.modes.adafruit.check_output',
-                            return_value=fixture):
-                assert am.workspace_dir() == '/media/ntoll/CIRCUITPY'
-
-
-def test_workspace_dir_posix_no_mount_command():
-    """
-    When the user doesn't have administrative privileges on OSX then the mount
-    command isn't on their path. In which case, check Mu uses the more
-    explicit /sbin/mount instead.
-    """
-    editor = mock.MagicMock()
-    view = mock.MagicMock()
-    am = AdafruitMode(editor, view)
-    with open('tests/modes/mount_exists.txt', 'rb') as fixture_file:
-        fixture = fixture_file.read()
-    mock_check = mock.MagicMock(side_effect=[FileNotFoundError, fixture])
     with mock.patch('os.name', 'posix'), \
-            mock.patch('mu.modes.adafruit.check_output', mock_check):
+            mock.patch('mu.volumes.mounted_volumes',
+                       return_value=['/', '/media/ntoll/CIRCUITPY']):
         assert am.workspace_dir() == '/media/ntoll/CIRCUITPY'
-        assert mock_check.call_count == 2
-        assert mock_check.call_args_list[0][0][0] == 'mount'
-        assert mock_check.call_args_list[1][0][0] == '/sbin/mount'
 
 
 def test_workspace_dir_posix_missing():
     """
-    Simulate being on os.name == 'posix' and a call to "mount" returns a
-    no records associated with a micro:bit device.
+    Simulate being on os.name == 'posix' and the mounted volumes don't
+    include a CircuitPython device.
     """
     editor = mock.MagicMock()
     view = mock.MagicMock()
     am = AdafruitMode(editor, view)
-    with open('tests/modes/mount_missing.txt', 'rb') as fixture_file:
-        fixture = fixture_file.read()
-        with mock.patch('os.name', 'posix'):
-            with mock.patch('mu.modes.adafruit.check_output',
-                            return_value=fixture),\
-                    mock.patch('mu.modes.adafruit.'
-                               'MicroPythonMode.workspace_dir') as mpm:
-                mpm.return_value = 'foo'
-                assert am.workspace_dir() == 'foo'
+    with mock.patch('os.name', 'posix'), \
+            mock.patch('mu.volumes.mounted_volumes', return_value=['/']), \
+            mock.patch('mu.modes.adafruit.'
+                       'MicroPythonMode.workspace_dir') as mpm:
+        mpm.return_value = 'foo'
+        assert am.workspace_dir() == 'foo'
 
 
 def test_workspace_dir_nt_exists():
@@ -225,6 +225,27 @@ def test_micropython_mode_find_device_no_ports():
         assert mm.find_device() == (None, None)
 
 
+def test_micropython_mode_find_device_available_ports():
+    """
+    Ports already enumerated by the caller are used rather than listing them
+    again.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    mm = MicroPythonMode(editor, view)
+    mm.valid_boards = [(0x0D28, 0x0204), ]
+    mock_port = mock.MagicMock()
+    mock_port.vendorIdentifier.return_value = 0x0D28
+    mock_port.productIdentifier.return_value = 0x0204
+    mock_port.portName.return_value = 'ttyACM0'
+    mock_port.serialNumber.return_value = '12345'
+    with mock.patch('mu.modes.base.QSerialPortInfo.availablePorts') as ports, \
+            mock.patch('mu.modes.base.os.name', 'posix'):
+        result = mm.find_device(available_ports=[mock_port, ])
+    assert result == ('/dev/ttyACM0', '12345')
+    assert ports.call_count == 0
+
+
 def test_micropython_mode_find_device_but_no_device():
     """
     None of the connected devices is a valid board so return None.
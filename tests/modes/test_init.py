@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the lazily loaded modes.
+"""
+import pytest
+import mu.modes
+from mu.modes import ModeDescriptor
+from unittest import mock
+
+
+def test_mode_classes_exported():
+    """
+    Mode classes can still be imported from the package.
+    """
+    from mu.modes import DebugMode
+    from mu.modes.debugger import DebugMode as debugger_DebugMode
+    assert DebugMode is debugger_DebugMode
+    with pytest.raises(AttributeError):
+        mu.modes.FooMode
+
+
+def test_ModeDescriptor_describes_without_loading():
+    """
+    The details shown in the mode selector don't need the mode to be loaded.
+    """
+    md = ModeDescriptor(mock.MagicMock(), mock.MagicMock(),
+                        'mu.modes.debugger.DebugMode', 'Graphical Debugger',
+                        'Debug your Python 3 code.', 'python',
+                        is_debugger=True)
+    with mock.patch('mu.modes.importlib.import_module') as mock_import:
+        assert md.name == 'Graphical Debugger'
+        assert md.description == 'Debug your Python 3 code.'
+        assert md.icon == 'python'
+        assert md.is_debugger is True
+        assert not hasattr(md, 'find_device')
+    assert mock_import.call_count == 0
+    assert not md.loaded
+
+
+def test_ModeDescriptor_loads_on_first_use():
+    """
+    Other attributes come from the mode, which is created once.
+    """
+    editor = mock.MagicMock()
+    view = mock.MagicMock()
+    md = ModeDescriptor(editor, view, 'mu.modes.debugger.DebugMode',
+                        'Graphical Debugger', 'Debug your Python 3 code.',
+                        'python', is_debugger=True)
+    assert md.api() == []
+    assert md.loaded
+    assert isinstance(md.mode, mu.modes.DebugMode)
+    assert md.mode.editor == editor
+    assert md.mode.view == view
+    assert md.save_timeout == md.mode.save_timeout
+    mode = md.mode
+    md.stop = mock.MagicMock()
+    assert md.mode is mode
+
+
+def test_ModeDescriptor_find_device():
+    """
+    A mode that finds devices is loaded when asked to.
+    """
+    md = ModeDescriptor(mock.MagicMock(), mock.MagicMock(),
+                        'mu.modes.adafruit.AdafruitMode',
+                        'Adafruit CircuitPython', 'Use CircuitPython.',
+                        'adafruit', finds_devices=True)
+    assert md.find_device == md.mode.find_device
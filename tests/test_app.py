@@ -4,8 +4,14 @@ Tests for the app script.
 """
 import sys
 import os.path
+import hashlib
+import http.server
+import json
+import threading
+import pytest
 from unittest import mock
-from mu.app import excepthook, run, setup_logging, debug, setup_modes
+from mu.app import (excepthook, run, setup_logging, debug, setup_modes,
+                    file_md5, download_file, Updater, UpdateCache)
 from mu.logic import LOG_FILE, LOG_DIR, DEBUGGER_PORT, ENCODING
 from mu.interface.themes import NIGHT_STYLE, DAY_STYLE, CONTRAST_STYLE
 
@@ -31,11 +37,13 @@ def test_setup_modes_with_pgzero():
     """
     If pgzero is installed, allow Pygame Zero mode.
     """
-    with mock.patch('mu.app.pkgutil.iter_modules', return_value=['pgzero', ]):
+    with mock.patch('mu.app.importlib.util.find_spec',
+                    return_value=mock.MagicMock()) as find_spec:
         mock_editor = mock.MagicMock()
         mock_view = mock.MagicMock()
         modes = setup_modes(mock_editor, mock_view)
         assert 'pygamezero' in modes
+    find_spec.assert_called_once_with('pgzero')
 
 
 def test_setup_modes_without_pgzero():
@@ -43,13 +51,31 @@ def test_setup_modes_without_pgzero():
     If pgzero is NOT installed, do not add Pygame Zero mode to the list of
     available modes.
     """
-    with mock.patch('mu.app.pkgutil.iter_modules', return_value=['foo', ]):
+    with mock.patch('mu.app.importlib.util.find_spec', return_value=None):
         mock_editor = mock.MagicMock()
         mock_view = mock.MagicMock()
         modes = setup_modes(mock_editor, mock_view)
         assert 'pygamezero' not in modes
 
 
+def test_setup_modes_lazy():
+    """
+    No mode is loaded until it's used and the descriptors match the modes
+    they describe.
+    """
+    with mock.patch('mu.app.importlib.util.find_spec',
+                    return_value=mock.MagicMock()):
+        modes = setup_modes(mock.MagicMock(), mock.MagicMock())
+    assert not any(mode.loaded for mode in modes.values())
+    for mode in modes.values():
+        mode_class = type(mode.mode)
+        assert mode.name == mode_class.name
+        assert mode.description == mode_class.description
+        assert mode.icon == mode_class.icon
+        assert mode.is_debugger == mode_class.is_debugger
+        assert mode.finds_devices == hasattr(mode_class, 'find_device')
+
+
 def test_run():
     """
     Ensure the run function sets things up in the expected way.
@@ -156,3 +182,291 @@ def test_debug_no_args():
         debug()
     msg = "Debugger requires a Python script filename to run."
     mock_print.assert_called_once_with(msg)
+
+
+#: Content served by the local HTTP server used to test downloads.
+CONTENT = bytes(range(256)) * 1000
+CONTENT_MD5 = hashlib.md5(CONTENT).hexdigest()
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves CONTENT, honouring Range headers unless the server's
+    ignore_range attribute is set. Records the Range headers it sees.
+    """
+
+    def do_GET(self):
+        requested = self.headers.get('Range')
+        self.server.ranges.append(requested)
+        if requested and not self.server.ignore_range:
+            start = int(requested[len('bytes='):-1])
+            if start >= len(CONTENT):
+                self.send_response(416)
+                self.end_headers()
+                return
+            body = CONTENT[start:]
+            self.send_response(206)
+        else:
+            body = CONTENT
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    """
+    A local HTTP server to download CONTENT from.
+    """
+    httpd = http.server.HTTPServer(('127.0.0.1', 0), RangeHandler)
+    httpd.ranges = []
+    httpd.ignore_range = False
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = 'http://127.0.0.1:{}/target.bin'.format(httpd.server_port)
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_file_md5(tmpdir):
+    """
+    The MD5 digest of a file is worked out a chunk at a time, and is empty
+    for a missing file.
+    """
+    path = os.path.join(str(tmpdir), 'target.bin')
+    assert file_md5(path) == ''
+    with open(path, 'wb') as f:
+        f.write(CONTENT)
+    assert file_md5(path, chunk_size=1000) == CONTENT_MD5
+
+
+def test_download_file(server, tmpdir):
+    """
+    The content is streamed to a partial file which is renamed into place
+    once its digest has been checked.
+    """
+    path = os.path.join(str(tmpdir), 'target.bin')
+    assert download_file(server.url, path, CONTENT_MD5,
+                         chunk_size=1000) == path
+    with open(path, 'rb') as f:
+        assert f.read() == CONTENT
+    assert not os.path.exists(path + '.part')
+    assert server.ranges == [None]
+
+
+def test_download_file_resume(server, tmpdir):
+    """
+    A partial download is resumed from where it left off.
+    """
+    path = os.path.join(str(tmpdir), 'target.bin')
+    with open(path + '.part', 'wb') as f:
+        f.write(CONTENT[:1234])
+    download_file(server.url, path, CONTENT_MD5)
+    with open(path, 'rb') as f:
+        assert f.read() == CONTENT
+    assert server.ranges == ['bytes=1234-']
+
+
+def test_download_file_range_ignored(server, tmpdir):
+    """
+    If the server sends everything instead of the requested range, the
+    partial download is replaced.
+    """
+    server.ignore_range = True
+    path = os.path.join(str(tmpdir), 'target.bin')
+    with open(path + '.part', 'wb') as f:
+        f.write(b'stale')
+    download_file(server.url, path, CONTENT_MD5)
+    with open(path, 'rb') as f:
+        assert f.read() == CONTENT
+
+
+def test_download_file_range_not_satisfiable(server, tmpdir):
+    """
+    If the partial download is already too big, start again.
+    """
+    path = os.path.join(str(tmpdir), 'target.bin')
+    with open(path + '.part', 'wb') as f:
+        f.write(CONTENT + b'extra')
+    download_file(server.url, path, CONTENT_MD5)
+    with open(path, 'rb') as f:
+        assert f.read() == CONTENT
+    assert server.ranges == ['bytes={}-'.format(len(CONTENT) + 5), None]
+
+
+def test_download_file_bad_md5(server, tmpdir):
+    """
+    A download that fails its MD5 check is thrown away and the existing file
+    is left alone.
+    """
+    path = os.path.join(str(tmpdir), 'target.bin')
+    with open(path, 'wb') as f:
+        f.write(b'old')
+    with pytest.raises(ValueError):
+        download_file(server.url, path, 'not the md5')
+    assert not os.path.exists(path + '.part')
+    with open(path, 'rb') as f:
+        assert f.read() == b'old'
+
+
+def test_updater_fetch(server, tmpdir):
+    """
+    The updater downloads into its config directory and returns the path,
+    or None if the download fails.
+    """
+    updater = Updater('win', 'http://example.com/', str(tmpdir))
+    updater.cache = UpdateCache(str(tmpdir))
+    path = updater.fetch(server.url, 'target.bin', CONTENT_MD5)
+    assert path == os.path.join(str(tmpdir), 'target.bin')
+    # The digest is known, so it's cached without hashing the file again.
+    with mock.patch('mu.app.file_md5') as mock_md5:
+        assert updater.cache.md5(path) == CONTENT_MD5
+    assert mock_md5.call_count == 0
+    assert updater.fetch(server.url, 'mpython.py', 'wrong') is None
+    with mock.patch('mu.app.download_file', side_effect=OSError('boom')):
+        assert updater.fetch(server.url, 'target.bin', CONTENT_MD5) is None
+
+
+class ManifestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the server's manifest with an ETag, answering 304 if the client
+    already has it.
+    """
+
+    def do_GET(self):
+        self.server.requests.append(self.headers.get('If-None-Match'))
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps(self.server.manifest).encode('utf-8')
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def manifest_server(tmpdir):
+    """
+    A local HTTP server for the update manifest, saying mpython.py and the
+    firmware are the same as the ones in tmpdir.
+    """
+    for name in ('mpython.py', 'target.bin'):
+        with open(os.path.join(str(tmpdir), name), 'wb') as f:
+            f.write(CONTENT)
+    httpd = http.server.HTTPServer(('127.0.0.1', 0), ManifestHandler)
+    httpd.requests = []
+    httpd.manifest = {
+        'IDE': [{'version': '0.0.1', 'win': {'url': 'http://example.com/'}}],
+        'mpython.py': {'MD5': CONTENT_MD5, 'url': 'http://example.com/'},
+        'firmware': {'MD5': CONTENT_MD5, 'url': 'http://example.com/',
+                     'version': 'MicroPython v1.0 on 2018-01-01'},
+    }
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = 'http://127.0.0.1:{}/mPython2.json'.format(httpd.server_port)
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_UpdateCache_md5(tmpdir):
+    """
+    Files are only hashed again if their size or modification time changes.
+    """
+    path = os.path.join(str(tmpdir), 'target.bin')
+    cache = UpdateCache(str(tmpdir))
+    assert cache.md5(path) == ''
+    with open(path, 'wb') as f:
+        f.write(CONTENT)
+    with mock.patch('mu.app.file_md5', wraps=file_md5) as mock_md5:
+        assert cache.md5(path) == CONTENT_MD5
+        assert cache.md5(path) == CONTENT_MD5
+        assert mock_md5.call_count == 1
+        with open(path, 'ab') as f:
+            f.write(b'more')
+        assert cache.md5(path) == hashlib.md5(CONTENT + b'more').hexdigest()
+        assert mock_md5.call_count == 2
+
+
+def test_UpdateCache_save(tmpdir):
+    """
+    The manifest validators and file hashes survive a round trip to disk,
+    and a broken cache file is ignored.
+    """
+    cache = UpdateCache(str(tmpdir))
+    assert cache.request_headers() == {}
+    cache.set_manifest(b'{}', {'ETag': '"v1"',
+                               'Last-Modified': 'Mon, 01 Jan 2018'})
+    cache.hashes['target.bin'] = {'key': [1, 2], 'md5': 'abc'}
+    cache.save()
+    cache = UpdateCache(str(tmpdir))
+    assert cache.request_headers() == {
+        'If-None-Match': '"v1"',
+        'If-Modified-Since': 'Mon, 01 Jan 2018',
+    }
+    assert cache.manifest['body'] == '{}'
+    assert cache.hashes['target.bin']['md5'] == 'abc'
+    with open(cache.path, 'w') as f:
+        f.write('not json')
+    assert UpdateCache(str(tmpdir)).manifest == {}
+
+
+def test_Updater_run_not_modified(manifest_server, tmpdir):
+    """
+    Once the manifest is cached, a 304 means nothing is downloaded or hashed
+    again.
+    """
+    updater = Updater('win', manifest_server.url, str(tmpdir))
+    updater.set_update_bin_status = mock.MagicMock()
+    updater.check_firmware = mock.MagicMock()
+    with mock.patch('mu.app.download_file') as mock_download:
+        updater.run()
+        updater.set_update_bin_status.emit.assert_called_once_with(True)
+        updater.check_firmware.emit.assert_called_once_with()
+        with mock.patch('mu.app.file_md5') as mock_md5:
+            updater.run()
+        assert mock_md5.call_count == 0
+    assert mock_download.call_count == 0
+    assert manifest_server.requests == [None, '"v1"']
+    assert updater.set_update_bin_status.emit.call_count == 2
+
+
+def test_Updater_run_update(manifest_server, tmpdir):
+    """
+    Files that differ from the manifest are downloaded and the window is
+    told where they are.
+    """
+    manifest_server.manifest['firmware']['MD5'] = 'new'
+    updater = Updater('win', manifest_server.url, str(tmpdir))
+    updater.update_pylib = mock.MagicMock()
+    updater.update_bin = mock.MagicMock()
+    updater.set_update_bin_status = mock.MagicMock()
+    updater.check_firmware = mock.MagicMock()
+    with mock.patch('mu.app.download_file') as mock_download:
+        updater.run()
+    path = os.path.join(str(tmpdir), 'target.bin')
+    mock_download.assert_called_once_with('http://example.com/', path, 'new')
+    updater.set_update_bin_status.emit.assert_called_once_with(False)
+    updater.update_bin.emit.assert_called_once_with(
+        'MicroPython v1.0 on 2018-01-01', path)
+    assert updater.update_pylib.emit.call_count == 0
+
+
+def test_Updater_download_unreachable(tmpdir):
+    """
+    If the manifest can't be had, the update check just stops.
+    """
+    updater = Updater('win', 'http://127.0.0.1:1/', str(tmpdir))
+    updater.cache = UpdateCache(str(tmpdir))
+    assert updater.download() is None
@@ -19,6 +19,7 @@ import pytest
 import mu.logic
 from PyQt5.QtWidgets import QMessageBox
 from PyQt5.QtCore import pyqtSignal, QObject
+from pyflakes.messages import UndefinedName
 
 from mu import __version__
 
@@ -153,6 +154,9 @@ def mocked_view(text, path, newline):
     view.current_tab.path = path
     view.current_tab.newline = newline
     view.current_tab.text = mock.MagicMock(return_value=text)
+    view.current_tab.large = False
+    view.current_tab.locked = False
+    view.current_tab.loading = False
     view.add_tab = mock.MagicMock()
     view.get_save_path = mock.MagicMock(return_value=path)
     view.get_load_path = mock.MagicMock()
@@ -244,6 +248,57 @@ def test_save_and_encode():
     assert mock_wandf.call_count == 1
 
 
+def test_save_and_encode_atomic(tmpdir):
+    """
+    An atomic save replaces the file with a fully written temporary file,
+    keeping the file's permissions and leaving no temporary file behind.
+    """
+    path = os.path.join(str(tmpdir), 'foo.py')
+    with open(path, 'w') as f:
+        f.write('old')
+    os.chmod(path, 0o640)
+    mu.logic.save_and_encode('new\ntext', path, '\r\n', atomic=True)
+    with open(path, 'rb') as f:
+        assert f.read() == b'new\r\ntext'
+    assert os.stat(path).st_mode & 0o777 == 0o640
+    assert os.listdir(str(tmpdir)) == ['foo.py']
+
+
+def test_save_and_encode_atomic_encoding_error(tmpdir):
+    """
+    If the text can't be encoded, the file is left alone.
+    """
+    path = os.path.join(str(tmpdir), 'foo.py')
+    with open(path, 'w') as f:
+        f.write('old')
+    with pytest.raises(UnicodeEncodeError):
+        mu.logic.save_and_encode('# coding: ascii\n\u00e9', path,
+                                 atomic=True)
+    with open(path) as f:
+        assert f.read() == 'old'
+    assert os.listdir(str(tmpdir)) == ['foo.py']
+
+
+def test_save_and_encode_atomic_fallback(tmpdir):
+    """
+    If the filesystem won't allow a temporary file to replace the file, it
+    is written in place.
+    """
+    path = os.path.join(str(tmpdir), 'foo.py')
+    with mock.patch('mu.logic.tempfile.mkstemp', side_effect=OSError):
+        mu.logic.save_and_encode('new', path, atomic=True)
+    with open(path) as f:
+        assert f.read() == 'new'
+
+
+def test_text_digest():
+    """
+    The digest changes with the text.
+    """
+    assert mu.logic.text_digest('foo') == mu.logic.text_digest('foo')
+    assert mu.logic.text_digest('foo') != mu.logic.text_digest('bar')
+
+
 def test_sniff_encoding_from_BOM():
     """
     Ensure an expected BOM detected at the start of the referenced file is
@@ -301,6 +356,14 @@ def test_sniff_newline_convention():
     assert mu.logic.sniff_newline_convention(text) == '\n'
 
 
+def test_sniff_newline_convention_blank_lines():
+    """
+    Consecutive newlines (blank lines) are all counted.
+    """
+    text = 'the\n\n\ncat\r\nsat\r\non'
+    assert mu.logic.sniff_newline_convention(text) == '\n'
+
+
 def test_sniff_newline_convention_local():
     """
     Ensure sniff_newline_convention returns the local newline convention if it
@@ -447,51 +510,84 @@ def test_extract_envars():
     ]
 
 
-def test_check_flake():
+@pytest.fixture
+def flake_cache():
+    """
+    Don't let cached pyflakes results leak between tests.
+    """
+    mu.logic.FLAKE_CACHE.clear()
+    yield mu.logic.FLAKE_CACHE
+    mu.logic.FLAKE_CACHE.clear()
+
+
+def test_check_flake(flake_cache):
+    """
+    Ensure the check_flake method returns pyflakes' messages keyed by (zero
+    based) line number.
+    """
+    code = 'import os\n\n\nx = y\n'
+    result = mu.logic.check_flake('foo.py', code)
+    assert result == {
+        0: [{'line_no': 0, 'column': 0,
+             'message': "'os' imported but unused"}],
+        3: [{'line_no': 3, 'column': 4, 'message': "undefined name 'y'"}],
+    }
+
+
+def test_check_flake_syntax_error(flake_cache):
     """
-    Ensure the check_flake method calls PyFlakes with the expected code
-    reporter.
+    Code that can't be parsed is reported as a syntax error.
     """
-    mock_r = mock.MagicMock()
-    mock_r.log = [{'line_no': 2, 'column': 0, 'message': 'b'}]
-    with mock.patch('mu.logic.MuFlakeCodeReporter', return_value=mock_r), \
-            mock.patch('mu.logic.check', return_value=None) as mock_check:
-        result = mu.logic.check_flake('foo.py', 'some code')
-        assert result == {2: mock_r.log}
-        mock_check.assert_called_once_with('some code', 'foo.py', mock_r)
+    result = mu.logic.check_flake('foo.py', 'x = 1\ndef f(:\n')
+    assert list(result) == [1]
+    assert result[1][0]['message'].startswith('Syntax error.')
 
 
-def test_check_flake_needing_expansion():
+def test_check_flake_needing_expansion(flake_cache):
     """
-    Ensure the check_flake method calls PyFlakes with the expected code
-    reporter.
+    Star imports from microbit, machine and mpython are expanded so the names
+    they bring in are known, without complaining that they're unused.
     """
-    mock_r = mock.MagicMock()
-    msg = "'microbit.foo' imported but unused"
-    mock_r.log = [{'line_no': 2, 'column': 0, 'message': msg}]
-    with mock.patch('mu.logic.MuFlakeCodeReporter', return_value=mock_r), \
-            mock.patch('mu.logic.check', return_value=None) as mock_check:
-        code = 'from microbit import *'
-        result = mu.logic.check_flake('foo.py', code)
-        assert result == {}
-        mock_check.assert_called_once_with(mu.logic.EXPANDED_IMPORT, 'foo.py',
-                                           mock_r)
+    code = ('from machine import *\nfrom mpython import *\n'
+            'oled.show(Pin)\n')
+    assert mu.logic.check_flake('foo.py', code) == {}
+    code = 'from microbit import *\ndisplay.show(foo)\n'
+    result = mu.logic.check_flake('foo.py', code)
+    assert [m['message'] for m in result[1]] == ["undefined name 'foo'"]
 
 
-def test_check_flake_with_builtins():
+def test_check_flake_needing_expansion_nested(flake_cache):
+    """
+    Star imports inside blocks, such as try:, are expanded too.
+    """
+    code = ('try:\n    from microbit import *\nexcept ImportError:\n'
+            '    from mpython import *\ndisplay.show(oled)\n')
+    assert mu.logic.check_flake('foo.py', code) == {}
+
+
+def test_check_flake_with_builtins(flake_cache):
     """
     If a list of assumed builtin symbols is passed, any "undefined name"
     messages for them are ignored.
     """
-    mock_r = mock.MagicMock()
-    mock_r.log = [{'line_no': 2, 'column': 0,
-                  'message': "undefined name 'foo'"}]
-    with mock.patch('mu.logic.MuFlakeCodeReporter', return_value=mock_r), \
-            mock.patch('mu.logic.check', return_value=None) as mock_check:
-        result = mu.logic.check_flake('foo.py', 'some code',
-                                      builtins=['foo', ])
-        assert result == {}
-        mock_check.assert_called_once_with('some code', 'foo.py', mock_r)
+    result = mu.logic.check_flake('foo.py', 'foo()\nbar()\n',
+                                  builtins=['foo', ])
+    assert list(result) == [1]
+
+
+def test_check_flake_cached(flake_cache):
+    """
+    Unchanged code is only checked once.
+    """
+    with mock.patch('mu.logic.ast.parse', wraps=mu.logic.ast.parse) as parse:
+        first = mu.logic.check_flake('foo.py', 'x = y\n')
+        assert mu.logic.check_flake('foo.py', 'x = y\n') is first
+        assert parse.call_count == 1
+        mu.logic.check_flake('foo.py', 'x = y\n', builtins=['y'])
+        assert parse.call_count == 2
+    with mock.patch('mu.logic.FLAKE_CACHE_SIZE', 2):
+        mu.logic.check_flake('foo.py', 'z = 1\n')
+    assert len(flake_cache) == 2
 
 
 def test_check_pycodestyle():
@@ -522,12 +618,104 @@ def test_check_pycodestyle_with_non_ascii():
     #
 
 
+def test_check_pycodestyle_line_breaks():
+    """
+    Only newlines end lines: form feeds and Unicode line separators (inside
+    strings or not) don't move or hide the problems reported.
+    """
+    cases = (('x = 1\n\x0c\ny=2\n', 2), ('s = "a\u2028b"\ny=2\n', 1))
+    for code, line_no in cases:
+        with mock.patch('mu.logic.STYLE_CACHE', {}):
+            for attempt in range(2):  # The second time from the cache.
+                result = mu.logic.check_pycodestyle(code)
+                assert list(result) == [line_no]
+                assert [item['code'] for item in result[line_no]] == \
+                    ['E225']
+
+
+def test_check_pycodestyle_no_temporary_file():
+    """
+    The code is checked in memory without writing it to disk or capturing
+    stdout.
+    """
+    code = "x=1\n"
+    with mock.patch('builtins.open') as mock_open, \
+            mock.patch('sys.stdout') as mock_stdout:
+        result = mu.logic.check_pycodestyle(code)
+    assert mock_open.call_count == 0
+    assert mock_stdout.write.call_count == 0
+    assert result[0][0]['code'] == 'E225'
+
+
+def test_check_pycodestyle_reuses_cached_results():
+    """
+    Checking the same code twice reuses the cached results of each line and
+    gives the same feedback.
+    """
+    code = "import foo\n\n\n\n\n\ndef bar():\n    x=1\n"
+    cache = {}
+    with mock.patch('mu.logic.STYLE_CACHE', cache):
+        first = mu.logic.check_pycodestyle(code)
+        cached = dict(cache)
+        with mock.patch('mu.logic.MuStyleChecker._run_physical',
+                        side_effect=AssertionError) as mock_physical:
+            second = mu.logic.check_pycodestyle(code)
+        assert mock_physical.call_count == 0
+    assert first == second
+    assert cache == cached
+    assert first[7][0]['code'] == 'E225'
+
+
+def test_check_pycodestyle_after_edit():
+    """
+    After an edit only the changed lines are checked again, with the results
+    for the unchanged lines reused (even if they have moved).
+    """
+    code = "x = 1\ny = 2\nz = 3\n"
+    cache = {}
+    with mock.patch('mu.logic.STYLE_CACHE', cache):
+        assert mu.logic.check_pycodestyle(code) == {}
+        size = len(cache)
+        result = mu.logic.check_pycodestyle("w=0\n" + code)
+    assert list(result.keys()) == [0, ]
+    assert result[0][0]['code'] == 'E225'
+    # New entries for the new line and those of its neighbour whose context
+    # (the previous logical line) changed.
+    assert size < len(cache) <= size + 4
+
+
+def test_check_pycodestyle_prunes_cache():
+    """
+    If the cache grows too big, only the results used by the most recent
+    check are kept.
+    """
+    cache = {'stale': ()}
+    with mock.patch('mu.logic.STYLE_CACHE', cache), \
+            mock.patch('mu.logic.STYLE_CACHE_SIZE', 1):
+        mu.logic.check_pycodestyle("x = 1\n")
+    assert 'stale' not in cache
+    assert cache
+
+
+def test_MuStyleReport_error():
+    """
+    Problems are logged as structured data unless they're ignored.
+    """
+    style = mu.logic.StyleGuide(parse_argv=False, config_file=False)
+    style.options.ignore = ('E226', )
+    r = mu.logic.MuStyleReport(style.options)
+    r.init_file('stdin', [], None, 0)
+    r.error(3, 4, 'E225 missing whitespace around operator', None)
+    r.error(5, 6, 'E226 missing whitespace around arithmetic operator', None)
+    assert r.log == [(3, 4, 'E225', 'missing whitespace around operator'), ]
+
+
 def test_MuFlakeCodeReporter_init():
     """
     Check state is set up as expected.
     """
     r = mu.logic.MuFlakeCodeReporter()
-    assert r.log == []
+    assert r.feedback == {}
 
 
 def test_MuFlakeCodeReporter_unexpected_error():
@@ -536,10 +724,12 @@ def test_MuFlakeCodeReporter_unexpected_error():
     """
     r = mu.logic.MuFlakeCodeReporter()
     r.unexpectedError('foo.py', 'Nobody expects the Spanish Inquisition!')
-    assert len(r.log) == 1
-    assert r.log[0]['line_no'] == 0
-    assert r.log[0]['filename'] == 'foo.py'
-    assert r.log[0]['message'] == 'Nobody expects the Spanish Inquisition!'
+    assert r.feedback == {0: [{
+        'line_no': 0,
+        'column': 0,
+        'filename': 'foo.py',
+        'message': 'Nobody expects the Spanish Inquisition!',
+    }]}
 
 
 def test_MuFlakeCodeReporter_syntax_error():
@@ -552,39 +742,28 @@ def test_MuFlakeCodeReporter_syntax_error():
     r = mu.logic.MuFlakeCodeReporter()
     r.syntaxError('foo.py', 'something incomprehensible to kids', '2', 3,
                   'source')
-    assert len(r.log) == 1
-    assert r.log[0]['line_no'] == 1
-    assert r.log[0]['message'] == msg
-    assert r.log[0]['column'] == 2
-    assert r.log[0]['source'] == 'source'
+    assert r.feedback == {1: [{
+        'line_no': 1,
+        'column': 2,
+        'message': msg,
+        'source': 'source',
+    }]}
 
 
-def test_MuFlakeCodeReporter_flake_matched():
+def test_MuFlakeCodeReporter_flake():
     """
-    Check the reporter handles flake (regular) errors that match the expected
-    message structure.
+    Check the reporter takes the line, column and text of pyflakes' messages
+    straight from the message.
     """
     r = mu.logic.MuFlakeCodeReporter()
-    err = "foo.py:4: something went wrong"
-    r.flake(err)
-    assert len(r.log) == 1
-    assert r.log[0]['line_no'] == 3
-    assert r.log[0]['column'] == 0
-    assert r.log[0]['message'] == 'something went wrong'
-
-
-def test_MuFlakeCodeReporter_flake_un_matched():
-    """
-    Check the reporter handles flake errors that do not conform to the expected
-    message structure.
-    """
-    r = mu.logic.MuFlakeCodeReporter()
-    err = "something went wrong"
-    r.flake(err)
-    assert len(r.log) == 1
-    assert r.log[0]['line_no'] == 0
-    assert r.log[0]['column'] == 0
-    assert r.log[0]['message'] == 'something went wrong'
+    r.flake(UndefinedName('foo.py', mock.MagicMock(lineno=4, col_offset=2),
+                          'foo'))
+    r.flake(UndefinedName('foo.py', mock.MagicMock(lineno=4, col_offset=9),
+                          'bar'))
+    assert r.feedback == {3: [
+        {'line_no': 3, 'column': 2, 'message': "undefined name 'foo'"},
+        {'line_no': 3, 'column': 9, 'message': "undefined name 'bar'"},
+    ]}
 
 
 def test_REPL_posix():
@@ -676,7 +855,8 @@ def test_editor_restore_session_existing_runtime():
             ed.restore_session()
 
     assert ed.theme == theme
-    assert ed._view.add_tab.call_count == len(file_contents)
+    assert ed._view.add_placeholder_tab.call_count == len(file_contents)
+    ed._view.add_tab.assert_not_called()
     ed._view.set_theme.assert_called_once_with(theme)
     assert ed.envars == [['name', 'value'], ]
     assert ed.minify is False
@@ -696,7 +876,8 @@ def test_editor_restore_session_missing_runtime():
         ed.restore_session()
 
     assert ed.theme == theme
-    assert ed._view.add_tab.call_count == len(file_contents)
+    assert ed._view.add_placeholder_tab.call_count == len(file_contents)
+    ed._view.add_tab.assert_not_called()
     ed._view.set_theme.assert_called_once_with(theme)
     assert ed.envars == [['name', 'value'], ]
     assert ed.minify is False
@@ -858,6 +1039,169 @@ def test_editor_session_and_open_focus_passed_file():
         'path/foo.py')
 
 
+def test_editor_restore_session_placeholders():
+    """
+    Restored text files are added as placeholder tabs (the last of which is
+    focussed) while other files are loaded straight away.
+    """
+    mode, theme = "python", "day"
+    ed = mocked_editor(mode)
+    ed.direct_load = mock.MagicMock()
+    with generate_session(theme, mode, ["", ""]) as session:
+        session_dir = os.path.dirname(session['session_filepath'])
+        hex_path = os.path.join(session_dir, 'firmware.hex')
+        session['paths'].insert(0, hex_path)
+        with open(session['session_filepath'], 'w') as f:
+            json.dump(session, f)
+        ed.restore_session()
+        placeholder_paths = [call[0][0] for call in
+                             ed._view.add_placeholder_tab.call_args_list]
+        assert placeholder_paths == session['paths'][1:]
+    ed.direct_load.assert_called_once_with(hex_path)
+    placeholder = ed._view.add_placeholder_tab.return_value
+    ed._view.focus_tab.assert_called_once_with(placeholder)
+
+
+def test_FileLoader_read():
+    """
+    The text and newline convention of the file are emitted.
+    """
+    fl = mu.logic.FileLoader()
+    fl.on_load = mock.MagicMock()
+    with mock.patch('mu.logic.read_and_decode',
+                    return_value=('foo', '\n')):
+        fl.read('foo.py')
+    fl.on_load.emit.assert_called_once_with('foo.py', 'foo', '\n')
+
+
+def test_FileLoader_read_fail():
+    """
+    The exception raised when a file can't be read is emitted.
+    """
+    fl = mu.logic.FileLoader()
+    fl.on_load_fail = mock.MagicMock()
+    ex = OSError('boom')
+    with mock.patch('mu.logic.read_and_decode', side_effect=ex):
+        fl.read('foo.py')
+    fl.on_load_fail.emit.assert_called_once_with('foo.py', ex)
+
+
+def test_FileSaver_run():
+    """
+    The latest text queued for each path is written and the digest emitted,
+    and the thread finishes once nothing is left when stopping.
+    """
+    fs = mu.logic.FileSaver()
+    fs.on_save = mock.MagicMock()
+    fs.queue('foo.py', 'old', '\n', 'old digest')
+    fs.queue('foo.py', 'new', '\n', 'new digest')
+    fs.queue('bar.py', 'bar', '\n', 'bar digest')
+    fs.stopping = True
+    with mock.patch('mu.logic.save_and_encode') as mock_save:
+        fs.run()
+    assert mock_save.call_args_list == [
+        mock.call('new', 'foo.py', '\n', atomic=True),
+        mock.call('bar', 'bar.py', '\n', atomic=True),
+    ]
+    assert fs.on_save.emit.call_args_list == [
+        mock.call('foo.py', 'new digest'),
+        mock.call('bar.py', 'bar digest'),
+    ]
+    assert fs.writing is None
+
+
+def test_FileSaver_run_fail():
+    """
+    The exception raised when a file can't be written is emitted.
+    """
+    fs = mu.logic.FileSaver()
+    fs.on_save_fail = mock.MagicMock()
+    fs.queue('foo.py', 'foo', '\n', 'digest')
+    fs.stopping = True
+    ex = OSError('boom')
+    with mock.patch('mu.logic.save_and_encode', side_effect=ex):
+        fs.run()
+    fs.on_save_fail.emit.assert_called_once_with('foo.py', ex)
+
+
+def test_FileSaver_discard():
+    """
+    Discarding a path forgets the text still to be written to it.
+    """
+    fs = mu.logic.FileSaver()
+    fs.queue('foo.py', 'foo', '\n', 'digest')
+    fs.discard('foo.py')
+    fs.discard('bar.py')
+    assert fs.pending == {}
+
+
+def test_FileSaver_thread(tmpdir):
+    """
+    Files are written in the thread, and stopping it writes what's left.
+    """
+    path = os.path.join(str(tmpdir), 'foo.py')
+    fs = mu.logic.FileSaver()
+    fs.start()
+    fs.queue(path, 'foo', '\n', 'digest')
+    fs.stop()
+    assert fs.isFinished()
+    with open(path) as f:
+        assert f.read() == 'foo'
+
+
+def test_editor_load_tab_wait():
+    """
+    When the caller needs the tab straight away, the file is read in the GUI
+    thread and the placeholder replaced.
+    """
+    ed = mocked_editor()
+    with mock.patch('mu.logic.read_and_decode',
+                    return_value=('foo', '\n')), \
+            mock.patch('mu.logic.QThread') as mock_thread:
+        ed.load_tab('foo.py', True)
+    assert mock_thread.call_count == 0
+    ed._view.replace_placeholder.assert_called_once_with(
+        'foo.py', 'foo', ["API Specification"], '\n')
+
+
+def test_editor_load_tab_wait_fail():
+    """
+    If a file can't be read, the user is told and the placeholder removed.
+    """
+    ed = mocked_editor()
+    with mock.patch('mu.logic.read_and_decode',
+                    side_effect=UnicodeDecodeError('utf-8', b'', 0, 0, '')):
+        ed.load_tab('foo.py', True)
+    ed._view.remove_placeholder.assert_called_once_with('foo.py')
+    assert ed._view.show_message.call_count == 1
+    assert ed._view.replace_placeholder.call_count == 0
+
+
+def test_editor_load_tab_background():
+    """
+    Files are read by a FileLoader in a separate thread, which is only created
+    once. A file already being read isn't asked for again.
+    """
+    ed = mocked_editor()
+    with mock.patch('mu.logic.QThread') as mock_thread, \
+            mock.patch('mu.logic.FileLoader') as mock_loader:
+        ed.load_tab('foo.py')
+        ed.load_tab('foo.py')
+        ed.load_tab('bar.py')
+    mock_thread.assert_called_once_with()
+    mock_thread.return_value.start.assert_called_once_with()
+    loader = mock_loader.return_value
+    loader.moveToThread.assert_called_once_with(mock_thread.return_value)
+    loader.on_load.connect.assert_called_once_with(ed.on_file_loaded)
+    loader.on_load_fail.connect.assert_called_once_with(ed.on_file_load_fail)
+    assert loader.load.emit.call_args_list == [mock.call('foo.py'),
+                                               mock.call('bar.py')]
+    ed.on_file_loaded('foo.py', 'foo', '\n')
+    assert ed._loading == {'bar.py'}
+    ed._view.replace_placeholder.assert_called_once_with(
+        'foo.py', 'foo', ["API Specification"], '\n')
+
+
 def test_toggle_theme_to_night():
     """
     The current theme is 'day' so toggle to night. Expect the state to be
@@ -1298,6 +1642,7 @@ def test_save_file_with_exception():
     view = mock.MagicMock()
     view.current_tab = mock.MagicMock()
     view.current_tab.path = 'foo.py'
+    view.current_tab.loading = False
     view.current_tab.text = mock.MagicMock(return_value='foo')
     view.current_tab.setModified = mock.MagicMock(return_value=None)
     view.show_message = mock.MagicMock()
@@ -1333,6 +1678,7 @@ def test_save_python_file():
     view = mock.MagicMock()
     view.current_tab = mock.MagicMock()
     view.current_tab.path = path
+    view.current_tab.loading = False
     view.current_tab.text = mock.MagicMock(return_value=contents)
     view.current_tab.newline = "\n"
     view.get_save_path = mock.MagicMock(return_value=path)
@@ -1346,6 +1692,47 @@ def test_save_python_file():
     view.current_tab.setModified.assert_called_once_with(False)
 
 
+def test_save_while_loading():
+    """
+    A large file that is still being loaded isn't saved.
+    """
+    ed = mocked_editor(text='foo', path='foo.py', newline='\n')
+    ed._view.current_tab.loading = True
+    ed.show_status_message = mock.MagicMock()
+    with mock.patch("mu.logic.save_and_encode") as mock_save:
+        ed.save()
+        ed.save_as()
+    assert mock_save.call_count == 0
+    assert ed.show_status_message.call_count == 2
+
+
+def test_check_code_large_file():
+    """
+    Large files aren't checked.
+    """
+    ed = mocked_editor()
+    ed._view.current_tab.large = True
+    ed.show_status_message = mock.MagicMock()
+    with mock.patch('mu.logic.check_flake') as mock_flake:
+        ed.check_code()
+    assert mock_flake.call_count == 0
+    assert ed.show_status_message.call_count == 1
+
+
+def test_load_large_file_notice():
+    """
+    The user is told when a file is opened in large file mode.
+    """
+    ed = mocked_editor()
+    ed.show_status_message = mock.MagicMock()
+    ed._view.add_tab.return_value.large = True
+    with generate_python_file('x = 1\n') as filepath:
+        ed._load(filepath)
+    message = ed.show_status_message.call_args[0][0]
+    assert os.path.basename(filepath) in message
+    assert 'Ctrl+Shift+E' in message
+
+
 def test_save_with_no_file_extension():
     """
     If the path doesn't end in *.py then append it to the filename.
@@ -1379,6 +1766,7 @@ def test_get_tab_existing_tab():
     mock_tab = mock.MagicMock()
     mock_tab.path = 'foo'
     view.widgets = [mock_tab, ]
+    view.current_tab = mock_tab
     ed = mu.logic.Editor(view)
     view.focus_tab.reset_mock()
     tab = ed.get_tab('foo')
@@ -1446,6 +1834,7 @@ def test_check_code_on():
     """
     view = mock.MagicMock()
     tab = mock.MagicMock()
+    tab.large = False
     tab.has_annotations = False
     tab.path = 'foo.py'
     tab.text.return_value = 'import this\n'
@@ -1497,6 +1886,7 @@ def test_check_code_off():
     """
     view = mock.MagicMock()
     tab = mock.MagicMock()
+    tab.large = False
     tab.has_annotations = True
     view.current_tab = tab
     ed = mu.logic.Editor(view)
@@ -1628,6 +2018,27 @@ def test_quit_modified_ok():
     assert mock_open.return_value.write.call_count > 0
 
 
+def test_quit_stops_file_loader():
+    """
+    The thread reading restored files is stopped before quitting.
+    """
+    view = mock.MagicMock()
+    view.modified = False
+    ed = mu.logic.Editor(view)
+    ed.modes = {
+        'python': mock.MagicMock(),
+    }
+    ed.file_loader_thread = mock.MagicMock()
+    ed.file_saver = mock.MagicMock()
+    with mock.patch('sys.exit', return_value=None), \
+            mock.patch('builtins.open', mock.mock_open()):
+        ed.quit()
+    ed.file_loader_thread.quit.assert_called_once_with()
+    ed.file_loader_thread.wait.assert_called_once_with()
+    # Pending autosaves are written before quitting.
+    ed.file_saver.stop.assert_called_once_with()
+
+
 def test_quit_save_tabs_with_paths():
     """
     When saving the session, ensure those tabs with associated paths are
@@ -1973,21 +2384,130 @@ def test_change_mode_reset_breakpoints():
 
 def test_autosave():
     """
-    Ensure the autosave callback does the expected things to the tabs.
+    Ensure the autosave callback queues the text of modified tabs to be
+    written by the file saver, once.
     """
     view = mock.MagicMock()
     view.modified = True
     mock_tab = mock.MagicMock()
     mock_tab.path = 'foo'
+    mock_tab.newline = '\n'
+    mock_tab.text.return_value = 'bar'
     mock_tab.isModified.return_value = True
     view.widgets = [mock_tab, ]
     ed = mu.logic.Editor(view)
-    with mock.patch('mu.logic.save_and_encode') as mock_save:
+    with mock.patch('mu.logic.FileSaver') as mock_saver_class:
+        ed.autosave()
+        ed.autosave()
+    saver = mock_saver_class.return_value
+    saver.start.assert_called_once_with()
+    digest = mu.logic.text_digest('bar')
+    saver.queue.assert_called_once_with('foo', 'bar', '\n', digest)
+    assert ed.file_saver == saver
+    assert mock_tab.setModified.call_count == 0
+
+
+def test_autosave_unchanged():
+    """
+    Tabs whose text is the same as when last saved aren't saved again.
+    """
+    view = mock.MagicMock()
+    view.modified = True
+    mock_tab = mock.MagicMock()
+    mock_tab.path = 'foo'
+    mock_tab.text.return_value = 'bar'
+    mock_tab.isModified.return_value = True
+    view.widgets = [mock_tab, ]
+    ed = mu.logic.Editor(view)
+    ed.saved_digests['foo'] = mu.logic.text_digest('bar')
+    with mock.patch('mu.logic.FileSaver') as mock_saver_class:
         ed.autosave()
-    assert mock_save.call_count == 1
+    assert mock_saver_class.call_count == 0
     mock_tab.setModified.assert_called_once_with(False)
 
 
+def test_on_autosaved():
+    """
+    Once written, a tab is no longer modified unless its text has changed
+    since.
+    """
+    view = mock.MagicMock()
+    tab1 = mock.MagicMock()
+    tab1.path = 'foo'
+    tab1.text = mock.MagicMock(return_value='bar')
+    tab1.isModified.return_value = True
+    tab2 = mock.MagicMock()
+    tab2.path = 'baz'
+    tab2.text = mock.MagicMock(return_value='changed')
+    tab2.isModified.return_value = True
+    view.widgets = [tab1, tab2]
+    ed = mu.logic.Editor(view)
+    ed._autosaving = {'foo': mu.logic.text_digest('bar'),
+                      'baz': mu.logic.text_digest('baz')}
+    ed.on_autosaved('foo', mu.logic.text_digest('bar'))
+    ed.on_autosaved('baz', mu.logic.text_digest('baz'))
+    tab1.setModified.assert_called_once_with(False)
+    assert tab2.setModified.call_count == 0
+    assert ed._autosaving == {}
+    assert ed.saved_digests['foo'] == mu.logic.text_digest('bar')
+
+
+def test_on_autosave_fail():
+    """
+    The user is told if an autosave fails, and it'll be tried again.
+    """
+    ed = mu.logic.Editor(mock.MagicMock())
+    ed.show_status_message = mock.MagicMock()
+    ed._autosaving = {'foo': 'digest'}
+    ed.on_autosave_fail('foo', OSError('boom'))
+    assert ed._autosaving == {}
+    assert ed.show_status_message.call_count == 1
+
+
+def test_save_tab_to_file_discards_autosave():
+    """
+    Saving a file stops an older autosave of it overwriting it, and records
+    the digest of the text saved.
+    """
+    ed = mocked_editor(text='foo', path='foo.py', newline='\n')
+    ed.file_saver = mock.MagicMock()
+    ed._autosaving = {'foo.py': 'old'}
+    with mock.patch('mu.logic.save_and_encode'):
+        ed.save_tab_to_file(ed._view.current_tab)
+    ed.file_saver.discard.assert_called_once_with('foo.py')
+    assert ed._autosaving == {}
+    assert ed.saved_digests['foo.py'] == mu.logic.text_digest('foo')
+
+
+def test_on_autosaved_after_save():
+    """
+    An autosave that finishes after the file is saved by hand doesn't
+    replace the digest of the saved text, so going back to the autosaved
+    text is still saved.
+    """
+    ed = mocked_editor(text='old', path='foo.py', newline='\n')
+    tab = ed._view.current_tab
+    tab.text = mock.MagicMock(return_value='old')
+    tab.isModified.return_value = True
+    ed._view.modified = True
+    ed._view.widgets = [tab]
+    ed.file_saver = mock.MagicMock()
+    ed.autosave()
+    ed.file_saver.queue.assert_called_once_with(
+        'foo.py', 'old', '\n', mu.logic.text_digest('old'))
+    tab.text.return_value = 'new'
+    with mock.patch('mu.logic.save_and_encode'):
+        ed.save_tab_to_file(tab)
+    # The write that was in progress when the file was saved reports back.
+    ed.on_autosaved('foo.py', mu.logic.text_digest('old'))
+    assert ed.saved_digests['foo.py'] == mu.logic.text_digest('new')
+    tab.text.return_value = 'old'
+    tab.setModified.reset_mock()
+    ed.autosave()
+    assert ed.file_saver.queue.call_count == 2
+    tab.setModified.assert_not_called()
+
+
 def test_check_usb():
     """
     Ensure the check_usb callback actually checks for connected USB devices.
@@ -2122,6 +2642,42 @@ def test_check_usb_remove_disconnected_devices():
     assert len(ed.connected_devices) == 0
 
 
+def test_check_usb_enumerates_ports_once():
+    """
+    The serial ports are listed once and shared with every mode, and the
+    modes aren't asked again until the ports change.
+    """
+    view = mock.MagicMock()
+    ed = mu.logic.Editor(view)
+    ed.show_status_message = mock.MagicMock()
+    mode_mb = mock.MagicMock()
+    mode_mb.find_device.return_value = (None, None)
+    mode_cp = mock.MagicMock()
+    mode_cp.find_device.return_value = (None, None)
+    ed.modes = {
+        'microbit': mode_mb,
+        'circuitplayground': mode_cp,
+    }
+    mock_port = mock.MagicMock()
+    mock_port.portName.return_value = 'ttyACM0'
+    with mock.patch('mu.logic.QSerialPortInfo.availablePorts',
+                    return_value=[mock_port]) as ports, \
+            mock.patch('mu.logic.volumes.invalidate') as invalidate:
+        ed.check_usb()
+        ed.check_usb()
+        assert ports.call_count == 2
+        # Mounted volumes are looked for again when the ports change.
+        assert invalidate.call_count == 1
+        mode_mb.find_device.assert_called_once_with(
+            with_logging=False, available_ports=[mock_port])
+        mode_cp.find_device.assert_called_once_with(
+            with_logging=False, available_ports=[mock_port])
+        mock_port.portName.return_value = 'ttyACM1'
+        ed.check_usb()
+        assert invalidate.call_count == 2
+    assert mode_mb.find_device.call_count == 2
+
+
 def test_show_status_message():
     """
     Ensure the method calls the status_bar in the view layer.
@@ -2531,6 +3087,34 @@ def test_read_encoding_unsuccessful():
             text, _ = mu.logic.read_and_decode(filepath)
 
 
+def test_read_mmap():
+    """Big files are memory mapped and decoded the same way
+    """
+    with generate_python_file() as filepath:
+        with open(filepath, "wb") as f:
+            f.write(codecs.BOM_UTF16_LE)
+            f.write((UNICODE_TEST_STRING + "\r\n").encode("utf-16-le") * 3)
+        with mock.patch("mu.logic.MMAP_THRESHOLD", 1), \
+                mock.patch("mu.logic.mmap.mmap",
+                           wraps=mu.logic.mmap.mmap) as mock_mmap:
+            text, newline = mu.logic.read_and_decode(filepath)
+        assert mock_mmap.call_count == 1
+        assert text == (UNICODE_TEST_STRING + "\n") * 3
+        assert newline == "\r\n"
+
+
+def test_read_mmap_unsuccessful():
+    """A memory mapped file that can't be decoded fails the same way
+    """
+    with generate_python_file() as filepath:
+        with open(filepath, "wb") as f:
+            f.write(codecs.BOM_UTF8)
+            f.write(b"\xd8\x00")
+        with mock.patch("mu.logic.MMAP_THRESHOLD", 1), \
+                pytest.raises(UnicodeDecodeError):
+            mu.logic.read_and_decode(filepath)
+
+
 #
 # When writing, if the text has an encoding cookie, then that encoding
 # should be used. Otherwise, UTF-8 should be used and no encoding cookie
@@ -2584,6 +3168,7 @@ def test_handle_open_file():
     """
     class Dummy(QObject):
         open_file = pyqtSignal(str)
+        load_tab = pyqtSignal(str, bool)
     view = Dummy()
     edit = mu.logic.Editor(view)
     m = mock.MagicMock()
@@ -2656,7 +3241,7 @@ def test_find_replace_no_find():
     message to explain the problem.
     """
     mock_view = mock.MagicMock()
-    mock_view.show_find_replace.return_value = ('', '', False)
+    mock_view.show_find_replace.return_value = ('', '', False, False)
     ed = mu.logic.Editor(mock_view)
     ed.show_message = mock.MagicMock()
     ed.find_replace()
@@ -2671,12 +3256,12 @@ def test_find_replace_find_matched():
     the expected status message should be shown.
     """
     mock_view = mock.MagicMock()
-    mock_view.show_find_replace.return_value = ('foo', '', False)
+    mock_view.show_find_replace.return_value = ('foo', '', False, False)
     mock_view.highlight_text.return_value = True
     ed = mu.logic.Editor(mock_view)
     ed.show_status_message = mock.MagicMock()
     ed.find_replace()
-    mock_view.highlight_text.assert_called_once_with('foo')
+    mock_view.highlight_text.assert_called_once_with('foo', False)
     assert ed.find == 'foo'
     assert ed.replace == ''
     assert ed.global_replace is False
@@ -2690,7 +3275,7 @@ def test_find_replace_find_unmatched():
     then the expected status message should be shown.
     """
     mock_view = mock.MagicMock()
-    mock_view.show_find_replace.return_value = ('foo', '', False)
+    mock_view.show_find_replace.return_value = ('foo', '', False, False)
     mock_view.highlight_text.return_value = False
     ed = mu.logic.Editor(mock_view)
     ed.show_status_message = mock.MagicMock()
@@ -2705,7 +3290,7 @@ def test_find_replace_replace_no_match():
     UN-matched in the code, then the expected status message should be shown.
     """
     mock_view = mock.MagicMock()
-    mock_view.show_find_replace.return_value = ('foo', 'bar', False)
+    mock_view.show_find_replace.return_value = ('foo', 'bar', False, False)
     mock_view.replace_text.return_value = 0
     ed = mu.logic.Editor(mock_view)
     ed.show_status_message = mock.MagicMock()
@@ -2713,7 +3298,8 @@ def test_find_replace_replace_no_match():
     assert ed.find == 'foo'
     assert ed.replace == 'bar'
     assert ed.global_replace is False
-    mock_view.replace_text.assert_called_once_with('foo', 'bar', False)
+    mock_view.replace_text.assert_called_once_with('foo', 'bar', False,
+                                                   False)
     ed.show_status_message.\
         assert_called_once_with('Could not find "foo".')
 
@@ -2724,7 +3310,7 @@ def test_find_replace_replace_single_match():
     matched once in the code, then the expected status message should be shown.
     """
     mock_view = mock.MagicMock()
-    mock_view.show_find_replace.return_value = ('foo', 'bar', False)
+    mock_view.show_find_replace.return_value = ('foo', 'bar', False, False)
     mock_view.replace_text.return_value = 1
     ed = mu.logic.Editor(mock_view)
     ed.show_status_message = mock.MagicMock()
@@ -2732,7 +3318,8 @@ def test_find_replace_replace_single_match():
     assert ed.find == 'foo'
     assert ed.replace == 'bar'
     assert ed.global_replace is False
-    mock_view.replace_text.assert_called_once_with('foo', 'bar', False)
+    mock_view.replace_text.assert_called_once_with('foo', 'bar', False,
+                                                   False)
     ed.show_status_message.\
         assert_called_once_with('Replaced "foo" with "bar".')
 
@@ -2744,7 +3331,7 @@ def test_find_replace_replace_multi_match():
     shown.
     """
     mock_view = mock.MagicMock()
-    mock_view.show_find_replace.return_value = ('foo', 'bar', True)
+    mock_view.show_find_replace.return_value = ('foo', 'bar', True, False)
     mock_view.replace_text.return_value = 4
     ed = mu.logic.Editor(mock_view)
     ed.show_status_message = mock.MagicMock()
@@ -2752,11 +3339,62 @@ def test_find_replace_replace_multi_match():
     assert ed.find == 'foo'
     assert ed.replace == 'bar'
     assert ed.global_replace is True
-    mock_view.replace_text.assert_called_once_with('foo', 'bar', True)
+    mock_view.replace_text.assert_called_once_with('foo', 'bar', True,
+                                                   False)
     ed.show_status_message.\
         assert_called_once_with('Replaced 4 matches of "foo" with "bar".')
 
 
+def test_find_replace_regex():
+    """
+    The regular expression flag from the dialog is remembered for next time
+    and passed on when replacing.
+    """
+    mock_view = mock.MagicMock()
+    mock_view.show_find_replace.return_value = (r'f(o+)', r'b\1', True, True)
+    mock_view.replace_text.return_value = 2
+    ed = mu.logic.Editor(mock_view)
+    ed.show_status_message = mock.MagicMock()
+    ed.find_replace()
+    assert ed.use_regex is True
+    mock_view.replace_text.assert_called_once_with(r'f(o+)', r'b\1', True,
+                                                   True)
+    ed.find_replace()
+    assert mock_view.show_find_replace.call_args[0] == (r'f(o+)', r'b\1',
+                                                        True, True)
+
+
+def test_unlock_tab():
+    """
+    A large file, once it has loaded, can be made editable.
+    """
+    ed = mocked_editor(path='/foo/log.txt')
+    ed.show_status_message = mock.MagicMock()
+    tab = ed._view.current_tab
+    tab.locked = True
+    tab.loading = True
+    ed.unlock_tab()
+    assert ed._view.unlock_tab.call_count == 0
+    ed.show_status_message.assert_called_once_with(
+        'Please wait, the file is still loading.')
+    tab.loading = False
+    ed.unlock_tab()
+    ed._view.unlock_tab.assert_called_once_with(tab)
+    assert 'log.txt' in ed.show_status_message.call_args[0][0]
+
+
+def test_unlock_tab_not_locked():
+    """
+    Nothing happens if there's no tab or it isn't locked.
+    """
+    ed = mocked_editor()
+    ed._view.current_tab.locked = False
+    ed.unlock_tab()
+    ed._view.current_tab = None
+    ed.unlock_tab()
+    assert ed._view.unlock_tab.call_count == 0
+
+
 def test_toggle_comments():
     """
     Ensure the method in the view for toggling comments on and off is called.
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for shrinking source before it is sent to a MicroPython board.
+"""
+import os
+import subprocess
+import pytest
+from unittest import mock
+import mu.shrink
+
+
+SOURCE = '''"""
+A module docstring.
+"""
+# A comment.
+import time
+
+
+def blink(pin, times=3):
+    """
+    Blink the pin.
+    """
+    for counter in range(times):  # Say what it does.
+        pin.value(counter % 2)
+        time.sleep(0.1)
+    message = """Lines of a string
+    keep their indentation."""
+    return message
+
+
+class Thing:
+    """A class with only a docstring."""
+'''
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    Don't let cached results leak between tests.
+    """
+    mu.shrink._cache.clear()
+    yield
+    mu.shrink._cache.clear()
+
+
+def test_strip_source():
+    """
+    Comments and docstrings go, blocks are indented by a single space and
+    every line stays where it was.
+    """
+    result = mu.shrink.strip_source(SOURCE)
+    lines = result.split('\n')
+    assert len(lines) == len(SOURCE.split('\n'))
+    assert '#' not in result
+    assert 'Blink the pin' not in result
+    assert lines[7] == 'def blink(pin, times=3):'
+    assert lines[11] == ' for counter in range(times):'
+    assert lines[12] == '  pin.value(counter % 2)'
+    assert lines[15] == '    keep their indentation."""'
+    # A docstring that was the only statement is replaced by pass.
+    assert lines[20] == ' pass'
+    namespace = {}
+    exec(result, namespace)
+    assert namespace['blink'](mock.MagicMock(), 0).endswith('indentation.')
+
+
+def test_strip_source_keeps_expressions():
+    """
+    Strings that are part of an expression, and f-strings (which may call
+    things), are kept.
+    """
+    source = 'x = 1\n"a".join(b)\nf"{x}"\n("a")\n'
+    assert mu.shrink.strip_source(source) == source
+
+
+def test_strip_source_continuation_lines():
+    """
+    Continuation lines keep a single space of indentation.
+    """
+    source = 'x = (1,\n     2)\ny = 1 + \\\n    2\n'
+    assert mu.shrink.strip_source(source) == 'x = (1,\n 2)\ny = 1 + \\\n 2\n'
+
+
+def test_local_names():
+    """
+    Only assigned names that aren't arguments or imports can be renamed, and
+    none can be in functions that have nested scopes or look at their
+    locals.
+    """
+    def names(source):
+        tree = mu.shrink.ast.parse(source)
+        return mu.shrink.local_names(tree.body[0])
+    assert names('def f(a, *b, c=1):\n a = x = 1\n import os as y\n'
+                 ' try:\n  pass\n except Exception as z:\n  pass\n') == {'x'}
+    assert names('def f():\n x = 1\n return lambda: x\n') == set()
+    assert names('def f():\n x = 1\n return [x for y in z]\n') == set()
+    assert names('def f():\n global x\n x = 1\n') == set()
+    assert names('def f():\n x = 1\n return locals()\n') == set()
+    assert names('@micropython.viper\ndef f():\n x = 1\n') == set()
+
+
+def test_rename_locals():
+    """
+    Locals get the shortest names not used by the function, the most used
+    first, and the code still works.
+    """
+    source = ('def total(values):\n'
+              '    result = 0\n'
+              '    for value in values:\n'
+              '        result += value\n'
+              '    a = result\n'
+              '    return a\n')
+    result = mu.shrink.rename_locals(source)
+    assert result == ('def total(values):\n'
+                      '    b = 0\n'
+                      '    for c in values:\n'
+                      '        b += c\n'
+                      '    a = b\n'
+                      '    return a\n')
+    namespace = {}
+    exec(result, namespace)
+    assert namespace['total']([1, 2, 3]) == 6
+
+
+def test_rename_locals_unicode():
+    """
+    Names are found by byte offset, so non-ASCII text earlier on the line
+    doesn't throw them out.
+    """
+    source = 'def f():\n    value = "é"; other = value\n    return other\n'
+    result = mu.shrink.rename_locals(source)
+    assert result == 'def f():\n    b = "é"; a = b\n    return a\n'
+
+
+def test_shrink_cached():
+    """
+    The result is cached by a hash of the source.
+    """
+    with mock.patch('mu.shrink.strip_source',
+                    return_value='x = 1\n') as mock_strip:
+        assert mu.shrink.shrink('x = 1  # One.\n') == 'x = 1\n'
+        assert mu.shrink.shrink('x = 1  # One.\n') == 'x = 1\n'
+    assert mock_strip.call_count == 1
+
+
+def test_shrink_syntax_error():
+    """
+    Source that can't be parsed is sent as it is, so the board reports the
+    error against what the user wrote.
+    """
+    assert mu.shrink.shrink('def f(:\n    pass\n') == 'def f(:\n    pass\n'
+    assert mu.shrink.shrink('x = (1,\n') == 'x = (1,\n'
+
+
+def test_find_mpy_cross():
+    """
+    The MPY_CROSS environment variable is preferred over the path.
+    """
+    with mock.patch.dict(os.environ, {'MPY_CROSS': '/opt/mpy-cross'}):
+        assert mu.shrink.find_mpy_cross() == '/opt/mpy-cross'
+    with mock.patch.dict(os.environ, {}, clear=True), \
+            mock.patch('mu.shrink.shutil.which', return_value=None):
+        assert mu.shrink.find_mpy_cross() is None
+
+
+def test_compile_mpy():
+    """
+    mpy-cross is run on the source in a temporary directory and the result
+    is read back (and cached).
+    """
+    def fake_run(args, **kwargs):
+        with open(args[-1][:-3] + '.mpy', 'wb') as f:
+            f.write(b'M\x03')
+        return subprocess.CompletedProcess(args, 0, b'')
+    with mock.patch('mu.shrink.subprocess.run',
+                    side_effect=fake_run) as mock_run:
+        assert mu.shrink.compile_mpy('x = 1\n', 'lib.py', 'mpy-cross') == \
+            b'M\x03'
+        assert mu.shrink.compile_mpy('x = 1\n', 'lib.py', 'mpy-cross') == \
+            b'M\x03'
+    assert mock_run.call_count == 1
+    assert mock_run.call_args[0][0][:3] == ['mpy-cross', '-s', 'lib.py']
+
+
+def test_compile_mpy_fails():
+    """
+    An IOError is raised if mpy-cross isn't there or fails.
+    """
+    with mock.patch('mu.shrink.find_mpy_cross', return_value=None):
+        with pytest.raises(IOError):
+            mu.shrink.compile_mpy('x = 1\n', 'lib.py')
+    failed = subprocess.CompletedProcess([], 1, b'SyntaxError')
+    with mock.patch('mu.shrink.subprocess.run', return_value=failed):
+        with pytest.raises(IOError) as ex:
+            mu.shrink.compile_mpy('x = 1\n', 'lib.py', 'mpy-cross')
+    assert 'SyntaxError' in str(ex.value)
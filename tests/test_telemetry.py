@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for decoding binary telemetry frames.
+"""
+import struct
+import zlib
+import mu.telemetry
+
+
+def test_encode():
+    """
+    A frame is the sync marker, kind, channels, rows, the values and the CRC
+    of everything after the sync marker.
+    """
+    frame = mu.telemetry.encode([(1, -2), (3, 4)])
+    body = b'h\x02\x02' + struct.pack('<4h', 1, -2, 3, 4)
+    assert frame == b'\xff\x55' + body + struct.pack('<I', zlib.crc32(body))
+
+
+def test_encode_long():
+    """
+    More than 255 samples are split between frames.
+    """
+    samples = [(i, ) for i in range(300)]
+    data = mu.telemetry.encode(samples)
+    assert data.count(mu.telemetry.SYNC) == 2
+    assert mu.telemetry.FrameDecoder().feed(data) == (b'', samples)
+
+
+def test_feed_frames():
+    """
+    The samples of int16 and float32 frames are decoded.
+    """
+    decoder = mu.telemetry.FrameDecoder()
+    data = mu.telemetry.encode([(1, 2, 3)]) + \
+        mu.telemetry.encode([(0.5, -1.25)], 'f')
+    assert decoder.feed(data) == (b'', [(1, 2, 3), (0.5, -1.25)])
+    assert decoder.frames == 2
+    assert decoder.errors == 0
+
+
+def test_feed_text():
+    """
+    Text mixed with frames is returned with the frames taken out.
+    """
+    decoder = mu.telemetry.FrameDecoder()
+    data = b'>>> ' + mu.telemetry.encode([(7, )]) + b'(1, 2)\r\n' + \
+        mu.telemetry.encode([(8, )]) + '温度\r\n'.encode('utf-8')
+    assert decoder.feed(data) == ('>>> (1, 2)\r\n温度\r\n'.encode('utf-8'),
+                                  [(7, ), (8, )])
+
+
+def test_feed_non_ascii_text():
+    """
+    Text that isn't ASCII, including characters ending in 0xaa and 0x55
+    bytes, isn't mistaken for the start of a frame.
+    """
+    decoder = mu.telemetry.FrameDecoder()
+    text = 'ªUhello Ъ world\r\n>>> 温度ª'.encode('utf-8')
+    assert decoder.feed(text) == (text, [])
+    assert decoder.pending == b''
+    assert decoder.errors == 0
+
+
+def test_feed_chunks():
+    """
+    However the data is split into chunks, the text and samples are the
+    same.
+    """
+    data = b'hello ' + mu.telemetry.encode([(1, 2), (3, 4)]) + b'\xff' + \
+        b'world\r\n' + mu.telemetry.encode([(0.25, )], 'f')
+    for size in range(1, len(data) + 1):
+        decoder = mu.telemetry.FrameDecoder()
+        text = b''
+        samples = []
+        for start in range(0, len(data), size):
+            chunk_text, chunk_samples = decoder.feed(data[start:start + size])
+            text += chunk_text
+            samples += chunk_samples
+        text += decoder.pending
+        assert text == b'hello \xffworld\r\n'
+        assert samples == [(1, 2), (3, 4), (0.25, )]
+
+
+def test_feed_keeps_incomplete_frame():
+    """
+    The start of a frame is held back until the rest of it arrives.
+    """
+    decoder = mu.telemetry.FrameDecoder()
+    frame = mu.telemetry.encode([(5, )])
+    assert decoder.feed(b'abc' + frame[:6]) == (b'abc', [])
+    assert decoder.pending == frame[:6]
+    assert decoder.feed(frame[6:] + b'd') == (b'd', [(5, )])
+    assert decoder.pending == b''
+
+
+def test_feed_bad_crc():
+    """
+    Something that looks like a frame but fails its CRC is text, and frames
+    after it are still found.
+    """
+    decoder = mu.telemetry.FrameDecoder()
+    bad = bytearray(mu.telemetry.encode([(5, )]))
+    bad[5] ^= 1
+    good = mu.telemetry.encode([(6, )])
+    text, samples = decoder.feed(bytes(bad) + good)
+    assert text == bytes(bad)
+    assert samples == [(6, )]
+    assert decoder.errors == 1
+
+
+def test_feed_bad_header():
+    """
+    A sync marker followed by a kind that isn't known, or no channels or
+    rows, is text.
+    """
+    for header in (b'\xff\x55x\x01\x01', b'\xff\x55h\x00\x01',
+                   b'\xff\x55h\x01\x00'):
+        decoder = mu.telemetry.FrameDecoder()
+        assert decoder.feed(header + b'\r\n') == (header + b'\r\n', [])
+        assert decoder.errors == 1
+
+
+def test_flush():
+    """
+    When the rest of a frame never arrives, what was held back is text, and
+    any frame in it is still found.
+    """
+    decoder = mu.telemetry.FrameDecoder()
+    frame = mu.telemetry.encode([(5, )])
+    # Says it's followed by 255 * 255 int16 values.
+    fake = b'\xff\x55h\xff\xff'
+    assert decoder.feed(fake + b'hi ' + frame) == (b'', [])
+    assert decoder.flush() == (fake + b'hi ', [(5, )])
+    assert decoder.pending == b''
+    assert decoder.errors == 1
+    assert decoder.flush() == (b'', [])
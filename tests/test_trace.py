@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the start up tracer.
+"""
+import builtins
+import importlib
+import json
+import os
+import tempfile
+from unittest import mock
+from PyQt5.QtCore import QEvent
+import mu.trace
+
+
+def test_tracer_disabled():
+    """
+    Nothing is recorded (or patched) unless the tracer is started.
+    """
+    tracer = mu.trace.StartupTracer()
+    with tracer.phase('foo'):
+        pass
+    tracer.mark('bar')
+    tracer.end()
+    tracer.stop()
+    assert tracer.records == []
+    assert tracer.marks == {}
+    assert tracer.enabled is False
+
+
+def test_tracer_phases():
+    """
+    Nested phases are timed with their stack and the time spent importing.
+    """
+    tracer = mu.trace.StartupTracer()
+    original_import = builtins.__import__
+    original_import_module = importlib.import_module
+    tracer.start()
+    try:
+        assert builtins.__import__ != original_import
+        tracer.end()  # imports
+        with tracer.phase('run'):
+            with tracer.phase('child'):
+                importlib.import_module('json')
+                importlib.import_module('os.path')
+            tracer.mark('done')
+    finally:
+        tracer.stop()
+    assert builtins.__import__ == original_import
+    assert importlib.import_module == original_import_module
+    names = [(r['name'], r['stack']) for r in tracer.records]
+    assert names == [
+        ('imports', ['imports']),
+        ('child', ['run', 'child']),
+        ('run', ['run']),
+    ]
+    child, run = tracer.records[1:]
+    assert child['imports'] > 0
+    assert run['imports'] >= child['imports']
+    assert run['wall'] >= child['wall']
+    assert 'done' in tracer.marks
+
+
+def test_tracer_stop_closes_phases():
+    """
+    Phases left open when tracing stops are recorded.
+    """
+    tracer = mu.trace.StartupTracer()
+    tracer.start()
+    tracer.begin('run')
+    tracer.stop()
+    assert [r['name'] for r in tracer.records] == ['run', 'imports']
+
+
+def test_tracer_folded():
+    """
+    Each phase is reported with the time spent in it and not its children,
+    with imports as a separate frame.
+    """
+    tracer = mu.trace.StartupTracer()
+    tracer.records = [
+        {'name': 'child', 'stack': ['run', 'child'], 'start': 0.1,
+         'wall': 0.2, 'imports': 0.05},
+        {'name': 'run', 'stack': ['run'], 'start': 0.0, 'wall': 0.5,
+         'imports': 0.15},
+    ]
+    assert tracer.folded() == ('run 200000\n'
+                               'run;(imports) 100000\n'
+                               'run;child 150000\n'
+                               'run;child;(imports) 50000\n')
+
+
+def test_tracer_write_report():
+    """
+    The JSON and folded reports are written to the referenced directory.
+    """
+    tracer = mu.trace.StartupTracer()
+    tracer.records = [
+        {'name': 'run', 'stack': ['run'], 'start': 0.0, 'wall': 0.5,
+         'imports': 0.0},
+    ]
+    tracer.marks = {'first_paint': 0.6}
+    with tempfile.TemporaryDirectory() as directory:
+        path = tracer.write_report(directory)
+        with open(path) as report_file:
+            report = json.load(report_file)
+        with open(path[:-len('.json')] + '.folded') as folded_file:
+            folded = folded_file.read()
+    assert os.path.dirname(path) == directory
+    assert report['phases'] == tracer.records
+    assert report['marks'] == {'first_paint': 0.6}
+    assert folded == 'run 500000\n'
+
+
+def test_tracer_finish_on_first_paint():
+    """
+    The report is written when the first paint event is seen.
+    """
+    tracer = mu.trace.StartupTracer()
+    tracer.start()
+    app = mock.MagicMock()
+    tracer.write_report = mock.MagicMock()
+    tracer.finish_on_first_paint(app, 'logs')
+    event_filter = app.installEventFilter.call_args[0][0]
+    event = mock.MagicMock()
+    event.type.return_value = QEvent.Show
+    assert event_filter.eventFilter(None, event) is False
+    assert tracer.enabled
+    event.type.return_value = QEvent.Paint
+    assert event_filter.eventFilter(None, event) is False
+    app.removeEventFilter.assert_called_once_with(event_filter)
+    assert not tracer.enabled
+    assert 'first_paint' in tracer.marks
+    tracer.write_report.assert_called_once_with('logs')
+
+
+def test_tracer_finish_on_first_paint_disabled():
+    """
+    Nothing is installed if the tracer isn't running.
+    """
+    tracer = mu.trace.StartupTracer()
+    app = mock.MagicMock()
+    tracer.finish_on_first_paint(app, 'logs')
+    assert app.installEventFilter.call_count == 0
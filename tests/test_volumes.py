@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for finding mounted volumes.
+"""
+import os
+import pytest
+from unittest import mock
+import mu.volumes
+
+
+MOUNTINFO = (
+    b'22 28 0:20 / /sys rw,nosuid,nodev,noexec,relatime shared:7 - sysfs '
+    b'sysfs rw\n'
+    b'28 1 8:1 / / rw,relatime shared:1 - ext4 /dev/sda1 rw\n'
+    b'340 28 8:17 / /media/ntoll/CIRCUITPY rw,nosuid,nodev,relatime '
+    b'shared:183 - vfat /dev/sdb1 rw\n'
+    b'341 28 8:33 / /media/ntoll/My\\040Stick rw,relatime shared:184 - vfat '
+    b'/dev/sdc1 rw\n'
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    Don't let cached volumes leak between tests.
+    """
+    mu.volumes.invalidate()
+    yield
+    mu.volumes.invalidate()
+
+
+def test_parse_mountinfo():
+    """
+    The mount points are the fifth field, with spaces unescaped.
+    """
+    assert mu.volumes.parse_mountinfo(MOUNTINFO) == [
+        '/sys', '/', '/media/ntoll/CIRCUITPY', '/media/ntoll/My Stick']
+
+
+def test_parse_mount():
+    """
+    The mount points are the third field of the mount command's output.
+    """
+    with open('tests/modes/mount_exists.txt', 'rb') as fixture_file:
+        volumes = mu.volumes.parse_mount(fixture_file.read())
+    assert '/media/ntoll/CIRCUITPY' in volumes
+    assert '/sys' in volumes
+
+
+def test_read_volumes_mountinfo(tmpdir):
+    """
+    On Linux, /proc/self/mountinfo is read and no process is run.
+    """
+    path = os.path.join(str(tmpdir), 'mountinfo')
+    with open(path, 'wb') as f:
+        f.write(MOUNTINFO)
+    with mock.patch('mu.volumes.MOUNTINFO', path), \
+            mock.patch('mu.volumes.check_output') as mock_check:
+        assert '/media/ntoll/CIRCUITPY' in mu.volumes.read_volumes()
+    assert mock_check.call_count == 0
+
+
+def test_read_volumes_no_mount_command():
+    """
+    Without mountinfo the mount command is run. When the user doesn't have
+    administrative privileges on OSX then the mount command isn't on their
+    path, in which case /sbin/mount is used instead.
+    """
+    with open('tests/modes/mount_exists.txt', 'rb') as fixture_file:
+        fixture = fixture_file.read()
+    mock_check = mock.MagicMock(side_effect=[FileNotFoundError, fixture])
+    with mock.patch('mu.volumes.MOUNTINFO', '/does/not/exist'), \
+            mock.patch('mu.volumes.check_output', mock_check):
+        assert '/media/ntoll/CIRCUITPY' in mu.volumes.read_volumes()
+    assert mock_check.call_args_list == [mock.call('mount'),
+                                         mock.call('/sbin/mount')]
+    with mock.patch('mu.volumes.MOUNTINFO', '/does/not/exist'), \
+            mock.patch('mu.volumes.check_output',
+                       side_effect=FileNotFoundError):
+        assert mu.volumes.read_volumes() == []
+
+
+def test_mounted_volumes_cached():
+    """
+    The volumes are only read again once the cache expires or is
+    invalidated.
+    """
+    with mock.patch('mu.volumes.read_volumes',
+                    return_value=['/']) as mock_read, \
+            mock.patch('mu.volumes.time.monotonic', return_value=100.0):
+        assert mu.volumes.mounted_volumes() == ['/']
+        assert mu.volumes.mounted_volumes() == ['/']
+        assert mock_read.call_count == 1
+        mu.volumes.invalidate()
+        mu.volumes.mounted_volumes()
+        assert mock_read.call_count == 2
+    with mock.patch('mu.volumes.read_volumes',
+                    return_value=['/']) as mock_read, \
+            mock.patch('mu.volumes.time.monotonic',
+                       return_value=100.0 + mu.volumes.CACHE_TTL + 1):
+        mu.volumes.mounted_volumes()
+        assert mock_read.call_count == 1
+
+
+def test_find_volume():
+    """
+    The first volume whose path ends with the name is returned.
+    """
+    with mock.patch('mu.volumes.mounted_volumes',
+                    return_value=['/', '/media/ntoll/MICROBIT']):
+        assert mu.volumes.find_volume('MICROBIT') == '/media/ntoll/MICROBIT'
+        assert mu.volumes.find_volume('CIRCUITPY') is None
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Counts the I2C traffic mpython.Accelerometer needs to read all three axes,
+and checks timer-driven sampling keeps every sample when the program reads
+them in batches.
+
+Usage: python utils/accelerometer_benchmark.py [samples]
+
+The accelerometer is a stand-in (see mu.emulator.standins) whose registers
+hold a made up reading, and the timer is fired by hand.
+"""
+import array
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from mu.emulator import standins  # noqa: E402
+
+
+def set_reading(mpython, x, y, z):
+    """
+    Put a raw reading in the stand-in accelerometer's registers.
+    """
+    raw = array.array('h', (x, y, z)).tobytes()
+    for i, byte in enumerate(raw):
+        mpython.i2c.memory[(38, 2 + i)] = byte
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    board = standins.install('A')
+    mpython = standins.load_mpython()
+    accelerometer = mpython.accelerometer
+    print('{:24} {:>13} {:>10}'.format('reading x, y and z', 'transactions',
+                                       'bytes'))
+    for name, read in (('get_x, get_y and get_z',
+                        lambda: (accelerometer.get_x(), accelerometer.get_y(),
+                                 accelerometer.get_z())),
+                       ('get_xyz', accelerometer.get_xyz)):
+        board.reset()
+        read()
+        print('{:24} {:13} {:10}'.format(
+            name, board.i2c_transactions,
+            board.i2c_written + board.i2c_read))
+    set_reading(mpython, 100, -200, 16384)
+    assert accelerometer.get_xyz() == (100 / 16384, -200 / 16384, 1.0)
+    # Sample at 100Hz, reading batches of 10 every 80ms.
+    accelerometer.start_sampling(rate=100, size=32)
+    batch = array.array('h', bytes(60))  # Ten samples.
+    received = []
+    for sample in range(count):
+        set_reading(mpython, sample % 1000, -sample % 1000, 7)
+        accelerometer.timer.fire()
+        if sample % 8 == 7:
+            while True:
+                n = accelerometer.read_samples(batch)
+                received.extend(batch[:n * 3])
+                if n < 10:
+                    break
+    accelerometer.stop_sampling()
+    expected = []
+    for sample in range(count):
+        expected.extend((sample % 1000, -sample % 1000, 7))
+    assert received == expected[:len(received)]
+    print()
+    print('{} samples taken, {} read, {} dropped'.format(
+        count, len(received) // 3, accelerometer.samples.overruns))
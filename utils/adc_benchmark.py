@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Checks mpython.ADCSampler keeps every sample of the light and sound sensors
+at 1000 samples a second when the program reads them in blocks, that its
+mean, peak and rms agree with the statistics module, and counts the bytes
+a second sending them to Mu takes as binary frames and as printed tuples.
+
+Usage: python utils/adc_benchmark.py [samples]
+
+The sensors are stand-ins (see mu.emulator.standins) and the timer is fired
+by hand. The serial port runs at 115200 baud: 11520 bytes a second.
+"""
+import array
+import contextlib
+import io
+import math
+import os
+import statistics
+import struct
+import sys
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from mu.emulator import standins  # noqa: E402
+
+
+RATE = 1000
+BLOCK = 50
+
+
+def capture(send):
+    """
+    Return the bytes send() prints.
+    """
+    out = io.TextIOWrapper(io.BytesIO(), encoding='utf-8', newline='\r\n')
+    with contextlib.redirect_stdout(out):
+        send()
+        out.flush()
+    return out.buffer.getvalue()
+
+
+def unpack_frames(data):
+    """
+    Return the samples in data, which must be nothing but binary frames.
+    """
+    samples = []
+    while data:
+        assert data[:2] == b'\xff\x55'
+        kind, channels, rows = struct.unpack_from('<cBB', data, 2)
+        layout = '<{}{}'.format(channels * rows, kind.decode())
+        end = 5 + struct.calcsize(layout)
+        crc, = struct.unpack_from('<I', data, end)
+        assert zlib.crc32(data[2:end]) == crc
+        values = struct.unpack_from(layout, data, 5)
+        samples.extend(values[i:i + channels]
+                       for i in range(0, len(values), channels))
+        data = data[end + 4:]
+    return samples
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    board = standins.install('A')
+    mpython = standins.load_mpython()
+    sampler = mpython.ADCSampler((mpython.light, mpython.sound), rate=RATE,
+                                 size=128)
+    sampler.start()
+    block = array.array('h', bytes(2 * 2 * BLOCK))
+    received = []
+    # Read a block every 40ms (40 samples), sometimes late.
+    for sample in range(count):
+        sampler.timer.fire()
+        if sample % 40 == 39 and sample % 400 != 39:
+            while True:
+                n = sampler.read(block)
+                received.extend(block[:n * 2])
+                if n < BLOCK:
+                    break
+    sampler.stop()
+    print('{} samples taken, {} read, {} dropped'.format(
+        count, len(received) // 2, sampler.ring.overruns))
+    sound = received[1::2][:BLOCK]
+    sampler.read(block)  # Empty the ring.
+    block[:] = array.array('h', received[:BLOCK * 2])
+    mean = sampler.mean(block, BLOCK, 1)
+    assert math.isclose(mean, statistics.mean(sound))
+    assert sampler.peak(block, BLOCK, 1) == max(sound)
+    centre = int(mean)
+    assert sampler.peak(block, BLOCK, 1, centre) == \
+        max(abs(s - centre) for s in sound)
+    assert math.isclose(sampler.rms(block, BLOCK, 1, centre),
+                        math.sqrt(statistics.mean((s - centre) ** 2
+                                                  for s in sound)))
+    frames = capture(lambda: sampler.send(block, BLOCK))
+    samples = [tuple(block[i:i + 2]) for i in range(0, BLOCK * 2, 2)]
+    assert unpack_frames(frames) == samples
+    tuples = capture(lambda: [print(s) for s in samples])
+    print()
+    print('sending {} samples a second of 2 channels in blocks of {}'.format(
+        RATE, BLOCK))
+    print('{:14} {:>12} {:>16}'.format('', 'bytes/s', 'of 115200 baud'))
+    for name, data in (('binary frames', frames), ('text tuples', tuples)):
+        per_second = len(data) * RATE / BLOCK
+        print('{:14} {:12.0f} {:15.0f}%'.format(
+            name, per_second, per_second / 115.2))
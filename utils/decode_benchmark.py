@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Measures how long mu.logic.read_and_decode takes to load big files and how
+much memory it needs to do so.
+
+Usage: python utils/decode_benchmark.py [megabytes]
+
+Files of the given size (50MB by default) with Unix newlines, Windows
+newlines and a UTF-16 BOM are written to a temporary directory. Each one is
+loaded in a fresh Python process so the peak resident memory reported is
+for that load alone.
+"""
+import codecs
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+# Run in a child process so memory used by one load doesn't hide another.
+CHILD = """
+import builtins, json, resource, sys, time
+builtins._ = lambda s: s
+from mu.logic import read_and_decode
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+text, newline = read_and_decode(sys.argv[1])
+elapsed = time.perf_counter() - start
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps([elapsed, (after - before) / 1024, len(text)]))
+"""
+
+LINE = 'print("The quick brown fox jumps over the lazy dog", 42)'
+
+
+def write_file(path, size, newline, encoding, bom=b''):
+    """
+    Write about size bytes of lines of Python to path.
+    """
+    line = (LINE + newline).encode(encoding)
+    with open(path, 'wb') as f:
+        f.write(bom)
+        f.write(line * (size // len(line)))
+
+
+if __name__ == '__main__':
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    size = megabytes * 1024 * 1024
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    cases = [
+        ('utf-8, \\n', '\n', 'utf-8', b''),
+        ('utf-8, \\r\\n', '\r\n', 'utf-8', b''),
+        ('utf-16 BOM, \\n', '\n', 'utf-16-le', codecs.BOM_UTF16_LE),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'big.py')
+        print('{:16} {:>9} {:>14}'.format('{}MB file'.format(megabytes),
+                                          'time (s)', 'peak RSS (MB)'))
+        for name, newline, encoding, bom in cases:
+            write_file(path, size, newline, encoding, bom)
+            output = subprocess.check_output(
+                [sys.executable, '-c', CHILD, path], env=env, cwd=root,
+                stderr=subprocess.DEVNULL)
+            elapsed, peak, length = json.loads(output.decode('utf-8'))
+            print('{:16} {:9.3f} {:14.1f}'.format(name, elapsed, peak))
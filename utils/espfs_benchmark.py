@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Measures how long mu.contrib.espfs takes to send a script to an mPython board
+and run it, against a simulated board on a serial link of a given baud rate.
+
+Usage: python utils/espfs_benchmark.py [kilobytes] [baud]
+
+The simulated board answers like MicroPython's REPL: it echoes what is typed
+at the friendly REPL, has a raw REPL and, unless told otherwise, supports
+raw-paste mode. Every byte takes 10 bits of time to cross the link in each
+direction and time.sleep in espfs advances the same simulated clock, so the
+results don't depend on the speed of this computer.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mu.contrib import espfs  # noqa: E402
+
+
+class Clock:
+    """
+    Simulated time, standing in for the time module used by espfs.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def time(self):
+        return self.now
+
+
+class SimulatedBoard:
+    """
+    A serial connection to a board running MicroPython's REPL.
+    """
+
+    PROMPT = b'\r\n>>> '
+    WINDOW = 128
+
+    def __init__(self, clock, baud, raw_paste=True, timeout=1):
+        self.clock = clock
+        self.byte_time = 10 / baud
+        self.raw_paste = raw_paste
+        self.timeout = timeout
+        self.sent = 0
+        self.received = 0
+        self.pending = []  # (time the byte arrives, byte)
+        self.rx_free = 0.0  # When the link back to the host is next free.
+        self.mode = 'friendly'
+        self.buffer = b''
+        self.paste_remain = 0
+
+    # The host's side of the connection.
+
+    def write(self, data):
+        self.sent += len(data)
+        for i in range(len(data)):
+            self.clock.now += self.byte_time
+            self.receive(data[i:i + 1])
+        return len(data)
+
+    def inWaiting(self):
+        return sum(1 for when, _ in self.pending if when <= self.clock.now)
+
+    def read(self, size=1):
+        return self.read_until(None, size)
+
+    def read_until(self, terminator=b'\n', size=None):
+        deadline = self.clock.now + self.timeout
+        data = b''
+        while self.pending and self.pending[0][0] <= deadline:
+            when, byte = self.pending.pop(0)
+            self.clock.now = max(self.clock.now, when)
+            data += byte
+            if terminator and data.endswith(terminator):
+                break
+            if size and len(data) >= size:
+                break
+        else:
+            self.clock.now = deadline
+        self.received += len(data)
+        return data
+
+    def setDTR(self, value):
+        pass
+
+    # The board's side of the connection.
+
+    def send(self, data):
+        for i in range(len(data)):
+            self.rx_free = max(self.rx_free, self.clock.now) + self.byte_time
+            self.pending.append((self.rx_free, data[i:i + 1]))
+
+    def run(self, code):
+        """
+        Run the code (instantly, printing nothing).
+        """
+
+    def receive(self, byte):
+        if self.mode == 'paste':
+            if byte == b'\x04':
+                self.send(b'\x04')
+                self.run(self.buffer)
+                self.send(b'\x04\x04>')
+                self.mode = 'raw'
+                self.buffer = b''
+                return
+            self.buffer += byte
+            self.paste_remain -= 1
+            if not self.paste_remain:
+                # The window has been read, ask for another.
+                self.paste_remain = self.WINDOW
+                self.send(b'\x01')
+        elif byte == b'\x03':
+            self.buffer = b''
+            if self.mode == 'friendly':
+                self.send(b'\r\nKeyboardInterrupt' + self.PROMPT)
+        elif byte == b'\x02':
+            self.mode = 'friendly'
+            self.buffer = b''
+            self.send(b'\r\nMicroPython v1.9.4 on 2019-01-01; mPython with '
+                      b'ESP32\r\nType "help()" for more information.' +
+                      self.PROMPT)
+        elif (byte == b'\x01' and self.mode == 'raw' and self.raw_paste and
+                self.buffer == b'\x05A'):
+            self.mode = 'paste'
+            self.buffer = b''
+            self.paste_remain = self.WINDOW
+            self.send(b'R\x01' + self.WINDOW.to_bytes(2, 'little'))
+        elif byte == b'\x01':
+            self.mode = 'raw'
+            self.buffer = b''
+            self.send(espfs.RAW_REPL_PROMPT)
+        elif self.mode == 'friendly':
+            self.send(byte)  # Echo.
+            if byte == b'\r':
+                self.run(self.buffer)
+                self.buffer = b''
+                self.send(self.PROMPT)
+            elif byte != b'\n':
+                self.buffer += byte
+        elif byte == b'\x04':
+            self.send(b'OK')
+            self.run(self.buffer)
+            self.send(b'\x04\x04>')
+            self.buffer = b''
+        else:
+            self.buffer += byte
+
+
+def make_script(size):
+    """
+    Return about size bytes of Python.
+    """
+    lines = []
+    while sum(len(line) + 1 for line in lines) < size:
+        n = len(lines)
+        lines.append('value_{} = "{}"  # comment {}'.format(n, 'x' * 20, n))
+    return '\n'.join(lines) + '\n'
+
+
+if __name__ == '__main__':
+    kilobytes = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    baud = int(sys.argv[2]) if len(sys.argv) > 2 else 115200
+    script = make_script(kilobytes * 1024)
+    espfs.time = Clock()
+    print('{}KB script at {} baud'.format(kilobytes, baud))
+    print('{:22} {:>9} {:>10} {:>10}'.format('board', 'time (s)',
+                                             'sent (B)', 'read (B)'))
+    for name, raw_paste in (('raw-paste firmware', True),
+                            ('older firmware', False)):
+        clock = espfs.time
+        clock.now = 0.0
+        board = SimulatedBoard(clock, baud, raw_paste)
+        espfs.start_command(script, board)
+        reader = espfs.RawReplReader()
+        while not reader.finished:
+            reader.feed(board.read_until(b'\x04>'))
+        print('{:22} {:9.3f} {:10} {:10}'.format(name, clock.now, board.sent,
+                                                 board.received))
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Counts the flash reads mpython.Font makes to draw lines of text over and
+over, as OLED.DispChar does, with and without its glyph cache.
+
+Usage: python utils/font_benchmark.py [frames]
+
+The font is in a stand-in for the board's flash (see mu.emulator.standins)
+that counts the reads and the bytes read. "no cache" (a cache size of 0)
+reads flash the way Font always used to: twice for every character drawn.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from mu.emulator import standins  # noqa: E402
+
+
+#: A status line redrawn every frame.
+STATUS = '温度 23.5℃ 湿度 45% 光线 正常'
+#: A page of poems, with some characters repeated.
+PAGE = ('床前明月光疑是地上霜举头望明月低头思故乡' * 2 +
+        '白日依山尽黄河入海流欲穷千里目更上一层楼春眠不觉晓处处闻啼鸟'
+        '夜来风雨声花落知多少')
+
+
+def draw(font, text, frames, prefetch):
+    """
+    Get the glyphs of text frames times, as DispChar does, and return the
+    seconds it took and the glyphs got.
+    """
+    start = time.perf_counter()
+    for _ in range(frames):
+        if prefetch:
+            font.prefetch(text)
+        glyphs = [font.GetCharacterData(c) for c in text]
+    return time.perf_counter() - start, glyphs
+
+
+if __name__ == '__main__':
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    board = standins.install(STATUS + PAGE)
+    mpython = standins.load_mpython()
+    print('{} frames'.format(frames))
+    print('{:8} {:20} {:>8} {:>11} {:>9}'.format(
+        'text', '', 'reads', 'bytes read', 'time (s)'))
+    for name, text in (('status', STATUS), ('page', PAGE)):
+        expected = None
+        for label, cache_size, prefetch in (('no cache', 0, False),
+                                            ('cache', 64, False),
+                                            ('cache + prefetch', 64, True)):
+            font = mpython.Font(cache_size=cache_size)
+            board.reset()
+            seconds, glyphs = draw(font, text, frames, prefetch)
+            if expected is None:
+                expected = glyphs
+            assert glyphs == expected, 'Glyphs differ with ' + label
+            print('{:8} {:20} {:8} {:11} {:9.3f}'.format(
+                name, label, board.flash_reads, board.flash_bytes, seconds))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Counts the FrameBuffer calls mpython.OLED.DispChar makes to draw a line of
+text in each of the text modes, and the bytes OLED.show sends over I2C to
+update the display for some typical frames.
+
+Usage: python utils/oled_benchmark.py [path to mpython.py]
+
+On the board each FrameBuffer call is a Python-level call into C, so their
+number is what it costs to draw. The display is on a 400kHz I2C bus, where
+each byte takes 22.5us (nine clocks). Pass the path of another copy of
+mpython.py (e.g. from "git show") to compare with it.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from mu.emulator import standins  # noqa: E402
+
+
+TEXT = 'Hello 你好 mPython'
+
+
+def progress_bar(mpython, frame):
+    mpython.UI().ProgressBar(10, 40, 108, 12, frame % 101)
+
+
+def status_line(mpython, frame):
+    mpython.oled.DispChar('{:3d}%'.format(frame % 101), 96, 0)
+
+
+def full_screen(mpython, frame):
+    mpython.oled.fill(0)
+    mpython.oled.DispChar(TEXT, 0, 20)
+
+
+FRAMES = (('progress bar', progress_bar), ('status line', status_line),
+          ('full screen', full_screen))
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else None
+    board = standins.install(TEXT)
+    mpython = standins.load_mpython(path)
+    oled = mpython.oled
+    oled.DispChar(TEXT, 0, 0)  # Fill the glyph cache.
+    print('{:8} {:>11} {:>9}'.format('mode', 'draw calls', 'time (s)'))
+    for name in ('normal', 'rev', 'trans', 'xor'):
+        mode = getattr(mpython.TextMode, name)
+        board.reset()
+        start = time.perf_counter()
+        oled.DispChar(TEXT, 0, 20, mode)
+        seconds = time.perf_counter() - start
+        print('{:8} {:11} {:9.3f}'.format(name, board.draw_calls, seconds))
+    print()
+    print('{:14} {:>13} {:>20}'.format('frame', 'I2C bytes',
+                                       'I2C transactions'))
+    for name, draw in FRAMES:
+        frames = 20
+        oled.show()
+        board.reset()
+        for frame in range(frames):
+            draw(mpython, frame)
+            oled.show()
+        print('{:14} {:13.0f} {:20.0f}'.format(
+            name, board.i2c_written / frames,
+            board.i2c_transactions / frames))
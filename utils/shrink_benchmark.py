@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Measures how much mu.shrink saves when a library is sent to an mPython board.
+
+Usage: python utils/shrink_benchmark.py [path] [--board]
+
+The library (mpython.py by default) is sent as it is, stripped, stripped with
+its locals renamed and, if mpy-cross is installed, compiled to a .mpy file.
+For each, the bytes sent and the time taken are measured against the
+simulated 115200 baud board from espfs_benchmark. With --board it is also
+copied to an attached board as shrinkbench.py (or .mpy) and imported there,
+to report the import time and the heap it takes.
+"""
+import os
+import sys
+
+UTILS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(UTILS))
+sys.path.insert(0, UTILS)
+
+from espfs_benchmark import Clock, SimulatedBoard  # noqa: E402
+from mu import shrink  # noqa: E402
+from mu.contrib import espfs  # noqa: E402
+
+
+# Run on the board: import the module in a clean heap and report the time it
+# took in milliseconds and the heap it used in bytes.
+IMPORT = ("import gc, sys, time;sys.modules.pop('shrinkbench', None);"
+          "gc.collect();free = gc.mem_free();start = time.ticks_ms();"
+          "import shrinkbench;gc.collect();"
+          "print(time.ticks_diff(time.ticks_ms(), start), "
+          "free - gc.mem_free())")
+
+
+def variants(source):
+    """
+    Yield (name, target, content) for each way of sending the source.
+    """
+    yield 'original', 'shrinkbench.py', source.encode('utf-8')
+    stripped = shrink.strip_source(source)
+    yield 'stripped', 'shrinkbench.py', stripped.encode('utf-8')
+    renamed = shrink.rename_locals(stripped)
+    yield 'stripped + renamed', 'shrinkbench.py', renamed.encode('utf-8')
+    if shrink.find_mpy_cross():
+        yield ('mpy-cross', 'shrinkbench.mpy',
+               shrink.compile_mpy(renamed, 'shrinkbench.py'))
+
+
+def simulate(target, content):
+    """
+    Return the seconds and bytes it takes to send content to the simulated
+    board.
+    """
+    clock = espfs.time = Clock()
+    board = SimulatedBoard(clock, 115200)
+    espfs.write_lib(None, board, content=content, target=target)
+    return clock.now, board.sent
+
+
+def on_board(target, content):
+    """
+    Copy content to the attached board as target and return how many
+    milliseconds importing it takes and how many bytes of heap it uses.
+    """
+    espfs.write_lib(None, content=content, target=target)
+    out, err = espfs.execute([IMPORT])
+    if err:
+        raise IOError(espfs.clean_error(err))
+    espfs.rm(target)
+    milliseconds, heap = out.split()
+    return int(milliseconds), int(heap)
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if arg != '--board']
+    board = '--board' in sys.argv
+    path = args[0] if args else os.path.join(os.path.dirname(UTILS),
+                                             'mpython.py')
+    with open(path, encoding='utf-8') as f:
+        source = f.read()
+    real_time = espfs.time
+    results = []
+    for name, target, content in variants(source):
+        seconds, sent = simulate(target, content)
+        results.append((name, target, content, seconds, sent))
+    espfs.time = real_time
+    print(os.path.basename(path))
+    header = '{:20} {:>9} {:>10} {:>9}'.format('', 'size (B)', 'sent (B)',
+                                               'send (s)')
+    if board:
+        header += ' {:>11} {:>9}'.format('import (ms)', 'heap (B)')
+    print(header)
+    for name, target, content, seconds, sent in results:
+        line = '{:20} {:9} {:10} {:9.2f}'.format(name, len(content), sent,
+                                                 seconds)
+        if board:
+            line += ' {:11} {:9}'.format(*on_board(target, content))
+        print(line)
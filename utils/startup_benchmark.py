@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Measures how long Mu takes from a cold start (a fresh Python process) until
+the editor window is set up and the session restored, without showing the
+window or entering the event loop.
+
+Usage: python utils/startup_benchmark.py [runs] [mode]
+
+Each run uses a throwaway session file in the given mode (python by
+default) so the mode selector dialog never pops up. The median time and
+the modes that had to be loaded are printed.
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+
+# Run in a child process so nothing is already imported.
+CHILD = """
+import time
+start = time.perf_counter()
+import builtins, json, sys
+from unittest import mock
+builtins._ = lambda s: s
+from PyQt5.QtWidgets import QApplication
+app = QApplication([])
+from mu.app import setup_modes
+from mu.interface import Window
+from mu.logic import Editor
+with mock.patch('mu.logic.get_session_path', return_value=sys.argv[1]), \\
+        mock.patch.object(Window, 'autosize_window'):
+    window = Window()
+    editor = Editor(view=window)
+    editor.setup(setup_modes(editor, window))
+    window.setup(editor.debug_toggle_breakpoint, editor.theme)
+    editor.restore_session([])
+elapsed = time.perf_counter() - start
+loaded = sorted(name for name, mode in editor.modes.items()
+                if getattr(mode, 'loaded', True))
+print(json.dumps([elapsed, loaded]))
+"""
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    mode = sys.argv[2] if len(sys.argv) > 2 else 'python'
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen', PYTHONPATH=root)
+    with tempfile.TemporaryDirectory() as tmp:
+        session_path = os.path.join(tmp, 'session.json')
+        with open(session_path, 'w') as session:
+            json.dump({'mode': mode, 'paths': []}, session)
+        timings = []
+        for i in range(runs):
+            output = subprocess.check_output(
+                [sys.executable, '-c', CHILD, session_path], env=env,
+                stderr=subprocess.DEVNULL, cwd=root)
+            elapsed, loaded = json.loads(output.decode('utf-8'))
+            timings.append(elapsed)
+    print('Median start up time over {} runs: {:.3f}s'.format(
+        runs, statistics.median(timings)))
+    print('Modes loaded: {}'.format(', '.join(loaded)))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Compares sending samples to Mu's plotter as printed tuples and as binary
+telemetry frames (see mu.telemetry): the bytes each sample takes, so how many
+samples a second fit through 115200 baud, and how many samples a second the
+plotter can pick out of what it's sent.
+
+Usage: python utils/telemetry_benchmark.py [samples]
+
+The frames are made by mpython.py's plot (a frame for each sample) and
+send_frame (a frame for each block of 50), run against the stand-ins in
+mu.emulator.standins. Floats are printed to 7 significant figures, as
+MicroPython does on the board. The plotter only decodes: drawing the chart is
+left out.
+"""
+import array
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+from adc_benchmark import capture  # noqa: E402
+from mu.emulator import standins  # noqa: E402
+from mu.interface.panes import PlotterPane  # noqa: E402
+
+
+BAUD = 115200
+BLOCK = 50
+CHUNK = 256  # Bytes the plotter is given at a time.
+
+
+def text_tuples(samples):
+    """
+    Return samples printed as tuples, the way MicroPython prints them.
+    """
+    lines = []
+    for sample in samples:
+        values = [str(v) if isinstance(v, int) else '{:.7g}'.format(v)
+                  for v in sample]
+        lines.append('({})\r\n'.format(', '.join(values)))
+    return ''.join(lines).encode('ascii')
+
+
+def blocks(mpython, samples, kind):
+    """
+    Return samples sent in blocks by send_frame.
+    """
+    channels = len(samples[0])
+
+    def send():
+        for start in range(0, len(samples), BLOCK):
+            rows = samples[start:start + BLOCK]
+            buf = array.array(kind, [v for row in rows for v in row])
+            mpython.send_frame(buf, channels, len(rows), kind)
+    return capture(send)
+
+
+def decode(data):
+    """
+    Return how many samples the plotter finds in data and the seconds it
+    takes to find them.
+    """
+    pane = PlotterPane()
+    found = []
+    pane.add_data = found.append
+    pane.add_samples = found.extend
+    start = time.perf_counter()
+    for i in range(0, len(data), CHUNK):
+        pane.process_bytes(data[i:i + CHUNK])
+    return len(found), time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    app = QApplication([])
+    standins.install('A')
+    mpython = standins.load_mpython()
+    rng = random.Random(1)
+    data_sets = (
+        ('sound', 'h', [(rng.randrange(4096), ) for _ in range(count)]),
+        ('light, sound', 'h', [(rng.randrange(4096), rng.randrange(4096))
+                               for _ in range(count)]),
+        ('x, y, z (g)', 'f', [tuple(rng.uniform(-2, 2) for _ in range(3))
+                              for _ in range(count)]),
+    )
+    print('{} samples, {} baud'.format(count, BAUD))
+    print('{:13} {:17} {:>8} {:>10} {:>12}'.format(
+        'values', 'sent as', 'bytes', 'samples/s', 'Mu samples/s'))
+    print('{:13} {:17} {:>8} {:>10} {:>12}'.format(
+        '', '', '/sample', 'on wire', 'decoded'))
+    for name, kind, samples in data_sets:
+        ways = (
+            ('text tuples', text_tuples(samples)),
+            ('plot()', capture(lambda: [mpython.plot(*s) for s in samples])),
+            ('send_frame({})'.format(BLOCK), blocks(mpython, samples, kind)),
+        )
+        for way, data in ways:
+            found, seconds = decode(data)
+            assert found == count, '{} of {} found'.format(found, count)
+            per_sample = len(data) / count
+            print('{:13} {:17} {:8.1f} {:10.0f} {:12.0f}'.format(
+                name, way, per_sample, BAUD / 10 / per_sample,
+                count / seconds))